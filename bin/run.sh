@@ -1,4 +1,4 @@
 # turn off slack for now!
 #invoke notify
 python manage.py cf_startup
-gunicorn webservices.rest:app
+gunicorn --config gunicorn_config.py webservices.rest:app
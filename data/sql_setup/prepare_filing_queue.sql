@@ -0,0 +1,62 @@
+-- Create queue tables to hold committees and cycles with changed filings
+drop table if exists ofec_filing_queue;
+drop table if exists ofec_filing_queue_processing;
+create table ofec_filing_queue (
+    cmte_id varchar(9),
+    cycle numeric,
+    timestamp timestamp
+);
+create table ofec_filing_queue_processing as select * from ofec_filing_queue limit 0;
+create index on ofec_filing_queue (cmte_id, cycle);
+create index on ofec_filing_queue (timestamp);
+create index on ofec_filing_queue_processing (cmte_id, cycle);
+
+-- Create table to record full rebuilds of the incremental tables
+create table if not exists ofec_filing_queue_rebuilds (
+    timestamp timestamp
+);
+
+-- Create trigger to maintain filing queue
+create or replace function ofec_filing_update_queue() returns trigger as $$
+declare
+    start_year int = TG_ARGV[0]::int;
+    timestamp timestamp = current_timestamp;
+begin
+    if tg_op in ('INSERT', 'UPDATE') then
+        if new.election_cycle >= start_year then
+            insert into ofec_filing_queue values (new.cmte_id, new.election_cycle, timestamp);
+        end if;
+    end if;
+
+    if tg_op in ('UPDATE', 'DELETE') then
+        if old.election_cycle >= start_year then
+            insert into ofec_filing_queue values (old.cmte_id, old.election_cycle, timestamp);
+        end if;
+    end if;
+
+    return null;
+end
+$$ language plpgsql;
+
+-- Attach the trigger to the Form 3 summaries. Row-level after triggers can
+-- only be attached to tables; if a summary is a view, its changes aren't
+-- queued, and `refresh_materialized` rebuilds the incremental tables in full
+-- instead of refreshing them (see `webservices/incremental.py`)
+do $$
+declare
+    relation text;
+begin
+    foreach relation in array array['fec_vsum_f3_vw', 'fec_vsum_f3p_vw', 'fec_vsum_f3x_vw'] loop
+        if exists (select 1 from pg_tables where tablename = relation) then
+            execute format('drop trigger if exists ofec_filing_queue_trigger on %I', relation);
+            execute format(
+                'create trigger ofec_filing_queue_trigger after insert or update or delete '
+                'on %I for each row execute procedure ofec_filing_update_queue(%s)',
+                relation, :START_YEAR
+            );
+        else
+            raise warning '% is not a table; its filing changes will not be queued', relation;
+        end if;
+    end loop;
+end
+$$;
@@ -0,0 +1,18 @@
+"""Gunicorn settings for the API. See bin/run.sh.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def post_worker_init(worker):
+    """Reflect shared tables once per worker before it starts serving
+    requests, so that the first requests do not pay for catalog queries.
+    """
+    from webservices.rest import app
+    from webservices.common import catalog
+    try:
+        with app.app_context():
+            catalog.warm()
+    except Exception as error:
+        logger.exception(error)
@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 
 import os
+import sys
 import glob
+import json
+import time
+import functools
 import logging
 import subprocess
 import multiprocessing
@@ -11,10 +15,13 @@ import sqlalchemy as sa
 from flask_script import Server
 from flask_script import Manager
 
-from webservices import flow, partition
+from webservices import flow, partition, incremental, decoders
 from webservices.env import env
 from webservices.rest import app, db
 from webservices.config import SQL_CONFIG, check_config
+from webservices.common import cache
+from webservices.common import catalog
+from webservices.common import slow_queries
 from webservices.common.util import get_full_path
 import webservices.legal_docs as legal_docs
 
@@ -40,6 +47,7 @@ manager.command(legal_docs.create_staging_index)
 manager.command(legal_docs.restore_from_staging_index)
 manager.command(legal_docs.reinitialize_all_legal_docs)
 manager.command(legal_docs.refresh_legal_docs_zero_downtime)
+manager.command(decoders.dump_efile_guides)
 
 def check_itemized_queues(schedule):
     """Checks to see if the queues associated with an itemized schedule have
@@ -101,18 +109,25 @@ def get_actual_weekly_itemized_totals(schedules):
 
     return actual_weekly_totals
 
-def execute_sql_file(path):
-    """This helper is typically used within a multiprocessing pool; create a new database
-    engine for each job.
+def read_sql_file(path, live_views=()):
+    """Read the SQL in `path` without comment lines. References to the
+    temporary names of `live_views` are replaced with their final names; see
+    `flow.replace_temporary_names`.
     """
-    db.engine.dispose()
-    logger.info(('Running {}'.format(path)))
     with open(path) as fp:
         cmd = '\n'.join([
             line for line in fp.readlines()
             if not line.strip().startswith('--')
         ])
-        db.engine.execute(sa.text(cmd), **SQL_CONFIG)
+    return sa.text(flow.replace_temporary_names(cmd, live_views))
+
+def execute_sql_file(path, live_views=()):
+    """This helper is typically used within a multiprocessing pool; create a new database
+    engine for each job.
+    """
+    db.engine.dispose()
+    logger.info(('Running {}'.format(path)))
+    db.engine.execute(read_sql_file(path, live_views=live_views), **SQL_CONFIG)
 
 def execute_sql_folder(path, processes):
     sql_dir = get_full_path(path)
@@ -212,19 +227,93 @@ def build_district_counts(outname='districts.json'):
     import utils
     utils.write_district_counts(outname)
 
+def run_schema_script(name, live_views=()):
+    """Run migration script `name`, converting its incremental views to
+    tables if enabled; used by `flow.run_graph`.
+    """
+    execute_sql_file(os.path.join('data', 'sql_updates', '{}.sql'.format(name)), live_views=live_views)
+    if incremental.is_enabled():
+        incremental.convert_script(name)
+
+def log_timing_report(graph, durations, elapsed):
+    for name, duration in sorted(durations.items(), key=lambda item: item[1], reverse=True):
+        logger.info('Ran {} in {:.1f}s'.format(name, duration))
+    length, path = flow.get_critical_path(graph, durations)
+    logger.info('Ran {} scripts in {:.1f}s; {:.1f}s if run serially'.format(
+        len(durations), elapsed, sum(durations.values())))
+    logger.info('Critical path ({:.1f}s): {}'.format(length, ' -> '.join(path)))
+
+def run_schema_scripts(graph, processes, live_views=()):
+    """Run the migration scripts in `graph`; see `flow.run_graph`. Scripts
+    read `live_views`, created by scripts that aren't being run, by their
+    final names.
+
+    :raises RuntimeError: If any script fails
+    """
+    start = time.time()
+    run = functools.partial(run_schema_script, live_views=tuple(live_views))
+    durations, errors, skipped = flow.run_graph(graph, run, processes)
+    log_timing_report(graph, durations, time.time() - start)
+    if errors:
+        for name, error in sorted(errors.items()):
+            logger.error('Failed to run {}: {}'.format(name, error))
+        if skipped:
+            logger.error('Skipped dependent scripts: {}'.format(', '.join(sorted(skipped))))
+        raise RuntimeError('Failed to update schemas: {}'.format(', '.join(sorted(errors))))
+
+def rename_script_views(graph):
+    """Swap in the temporary views created by the migration scripts in
+    `graph`, as `rename_temporary_views.sql` does for every view. Replacing a
+    view drops the views that depend on it, so `graph` must include all of
+    the scripts that depend on its scripts.
+    """
+    enabled = incremental.is_enabled()
+    with db.engine.begin() as connection:
+        for name in nx.topological_sort(graph):
+            for view in flow.get_views(name):
+                if view in incremental.VIEWS:
+                    if enabled:
+                        incremental.VIEWS[view].rename(connection)
+                        continue
+                    incremental.VIEWS[view].drop(connection)
+                logger.info('Renaming {}_tmp'.format(view))
+                connection.execute('drop materialized view if exists {0} cascade'.format(view))
+                connection.execute('alter materialized view {0}_tmp rename to {0}'.format(view))
+
 @manager.command
 def update_schemas(processes=1):
     """This updates the smaller tables and views. It is run on deploy.
+    Scripts run as soon as the scripts they depend on in `webservices.flow`
+    have finished, with up to `processes` scripts running at once.
     """
     logger.info("Starting DB refresh...")
     processes = int(processes)
     graph = flow.get_graph()
-    for task in nx.topological_sort(graph):
-        path = os.path.join('data', 'sql_updates', '{}.sql'.format(task))
-        execute_sql_file(path)
-    execute_sql_file('data/rename_temporary_views.sql')
+    run_schema_scripts(graph, processes)
+    # Swap in every view in one transaction, so that dependent views aren't
+    # left dropped if a later swap fails
+    with db.engine.begin() as connection:
+        if incremental.is_enabled():
+            incremental.rename_tables(connection)
+        else:
+            incremental.drop_tables(connection)
+        connection.execute(read_sql_file('data/rename_temporary_views.sql'), **SQL_CONFIG)
+    catalog.bump_generation()
     logger.info("Finished DB refresh.")
 
+@manager.command
+def dump_flow_graph(dest=None):
+    """Write the dependencies between `data/sql_updates` scripts, discovered
+    from the scripts and unioned with `flow.EXPLICIT_EDGES`, as JSON to `dest`
+    or standard output.
+    """
+    report = flow.get_report(flow.get_graph())
+    if dest:
+        with open(dest, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+
 @manager.command
 def update_functions(processes=1):
     """This command updates the helper functions. It is run on deploy.
@@ -241,6 +330,50 @@ def update_itemized(schedule):
     execute_sql_file('data/sql_setup/prepare_schedule_{0}.sql'.format(schedule))
     logger.info('Finished Schedule {0} update.'.format(schedule))
 
+@manager.command
+def update_filing_queue():
+    """Create the queue of changed filings used to refresh incremental views.
+    Run this when you make a change to:
+        data/sql_setup/prepare_filing_queue.sql
+    """
+    logger.info('Updating filing queue...')
+    execute_sql_file('data/sql_setup/prepare_filing_queue.sql')
+    logger.info('Finished filing queue update.')
+
+@manager.command
+def rebuild_incremental(views=None):
+    """Recompute incremental views from scratch, e.g. after a failed refresh.
+    Takes a comma-separated list of view names; defaults to all views.
+    """
+    rebuilt = incremental.get_views(views.split(',') if views else None)
+    for view in rebuilt:
+        logger.info('Rebuilding {}...'.format(view.name))
+        with db.engine.begin() as connection:
+            view.rebuild(connection)
+    if not views:
+        with db.engine.begin() as connection:
+            incremental.record_rebuild(connection)
+    cache.bump_generation()
+    logger.info('Finished rebuilding incremental views.')
+
+@manager.command
+def check_incremental(views=None):
+    """Compare incremental views to a full evaluation of their definitions.
+    Takes a comma-separated list of view names; defaults to all views.
+    """
+    views = incremental.get_views(views.split(',') if views else None)
+    mismatched = []
+    for view in views:
+        with db.engine.connect() as connection:
+            count = view.check(connection)
+        if count:
+            logger.error('{} differs from its definition in {} rows'.format(view.name, count))
+            mismatched.append(view.name)
+        else:
+            logger.info('{} matches its definition'.format(view.name))
+    if mismatched:
+        raise RuntimeError('Incremental views out of date: {}'.format(', '.join(mismatched)))
+
 @manager.command
 def rebuild_aggregates(processes=1):
     """These are the functions used to update the aggregates and schedules.
@@ -252,10 +385,16 @@ def rebuild_aggregates(processes=1):
     logger.info('Finished rebuilding incremental aggregates.')
 
 @manager.command
-def update_aggregates():
-    """These are run nightly to recalculate the totals
+def update_aggregates(processes=1, batch_size=None, throttle=None):
+    """These are run nightly to recalculate the totals. Itemized child tables
+    are refreshed by up to `processes` workers at once, applying queued
+    changes in batches of `batch_size` records with `throttle` seconds
+    between batches.
     """
     logger.info('Updating incremental aggregates...')
+    processes = int(processes)
+    batch_size = int(batch_size) if batch_size else None
+    throttle = float(throttle) if throttle else None
 
     with db.engine.begin() as connection:
         connection.execute(
@@ -266,13 +405,19 @@ def update_aggregates():
         logger.info('Finished updating Schedule E and support aggregates.')
 
     logger.info('Updating Schedule A...')
-    partition.SchedAGroup.refresh_children()
+    partition.SchedAGroup.refresh_children(
+        processes=processes, batch_size=batch_size, throttle=throttle
+    )
     logger.info('Finished updating Schedule A.')
 
     logger.info('Updating Schedule B...')
-    partition.SchedBGroup.refresh_children()
+    partition.SchedBGroup.refresh_children(
+        processes=processes, batch_size=batch_size, throttle=throttle
+    )
     logger.info('Finished updating Schedule B.')
 
+    cache.bump_generation()
+
     logger.info('Finished updating incremental aggregates.')
 
 @manager.command
@@ -310,23 +455,223 @@ def update_all(processes=1):
     update_itemized('a')
     update_itemized('b')
     update_itemized('e')
+    update_filing_queue()
     logger.info('Partitioning Schedule A...')
-    partition.SchedAGroup.run()
+    partition.SchedAGroup.run(processes=processes)
     logger.info('Finished partitioning Schedule A.')
     logger.info('Partitioning Schedule B...')
-    partition.SchedBGroup.run()
+    partition.SchedBGroup.run(processes=processes)
     logger.info('Finished partitioning Schedule B.')
     rebuild_aggregates(processes=processes)
     update_schemas(processes=processes)
 
+def refresh_views(job, full=False):
+    """Refresh materialized views in order; typically used within a
+    multiprocessing pool, so create a new database engine for each job.
+
+    :param tuple job: Name of the job and list of views to refresh
+    :param bool full: Rebuild incremental views built as tables rather than
+        refreshing the committees and cycles in the filing queue
+    :returns: Tuple of job name, list of refreshed views and durations, and
+        the view that failed and its error, if any
+    """
+    db.engine.dispose()
+    name, views = job
+    timings = []
+    for view in views:
+        logger.info('Refreshing {}'.format(view))
+        start = time.time()
+        try:
+            table = incremental.VIEWS.get(view)
+            if table:
+                with db.engine.begin() as connection:
+                    # Incremental views are materialized views unless enabled
+                    if not table.is_table(connection):
+                        table = None
+                    elif full:
+                        table.rebuild(connection)
+                    else:
+                        table.refresh(connection)
+            if not table:
+                db.engine.execute(
+                    sa.text('refresh materialized view concurrently {}'.format(view)).execution_options(
+                        autocommit=True
+                    )
+                )
+        except Exception as error:
+            logger.exception(error)
+            return name, timings, (view, str(error))
+        timings.append((view, time.time() - start))
+    return name, timings, None
+
+def get_materialized_views():
+    rows = db.engine.execute("select matviewname from pg_matviews where schemaname = 'public'")
+    return {row[0] for row in rows}
+
+def get_refresh_jobs(graph, unscripted=True):
+    """Group the materialized views created by `data/sql_updates` scripts into
+    waves of refresh jobs that can run in parallel, following `graph`. If
+    `unscripted`, views without a script in `graph` run in a final wave.
+    Incremental views built as tables are refreshed in place of their
+    materialized views.
+    """
+    existing = get_materialized_views() | incremental.get_tables()
+    scheduled = set()
+    waves = []
+    for wave in flow.get_waves(graph):
+        jobs = []
+        for name in wave:
+            views = [view for view in flow.get_views(name) if view in existing]
+            scheduled.update(views)
+            if views:
+                jobs.append((name, views))
+        waves.append(jobs)
+    if unscripted:
+        waves.append([(view, [view]) for view in sorted(existing - scheduled)])
+    return [jobs for jobs in waves if jobs]
+
+def run_refresh_wave(jobs, pool, retries, full=False):
+    """Refresh each of `jobs`, retrying failed jobs from the view that failed.
+
+    :returns: Tuple of durations by view and errors by job name
+    """
+    timings, errors = [], {}
+    refresh = functools.partial(refresh_views, full=True) if full else refresh_views
+    for attempt in range(retries + 1):
+        results = pool.map(refresh, jobs) if pool else list(map(refresh, jobs))
+        remaining = []
+        for (name, views), (_, done, error) in zip(jobs, results):
+            timings.extend(done)
+            if error:
+                errors[name] = error
+                remaining.append((name, views[len(done):]))
+            else:
+                errors.pop(name, None)
+        if not remaining:
+            break
+        if attempt < retries:
+            logger.info('Retrying {}'.format(', '.join(name for name, _ in remaining)))
+        jobs = remaining
+    return timings, errors
+
+def refresh_graph(graph, pool, retries, unscripted=True, full=False):
+    """Refresh the views created by the scripts in `graph` in waves, skipping
+    the scripts that depend on a script whose views failed to refresh; see
+    `get_refresh_jobs` and `run_refresh_wave`.
+
+    :returns: Tuple of durations by view, errors by job name, and skipped
+        scripts
+    """
+    timings, failed, skipped = [], {}, set()
+    for jobs in get_refresh_jobs(graph, unscripted=unscripted):
+        jobs = [job for job in jobs if job[0] not in skipped]
+        wave_timings, errors = run_refresh_wave(jobs, pool, retries, full=full)
+        timings.extend(wave_timings)
+        failed.update(errors)
+        for name in errors:
+            if name in graph:
+                skipped.update(nx.descendants(graph, name))
+    return timings, failed, skipped
+
+def log_refresh_report(timings, start):
+    for view, duration in sorted(timings, key=lambda timing: timing[1], reverse=True):
+        logger.info('Refreshed {} in {:.1f}s'.format(view, duration))
+    logger.info('Refreshed {} views in {:.1f}s'.format(len(timings), time.time() - start))
+
+def raise_refresh_errors(failed, skipped):
+    for name, (view, error) in sorted(failed.items()):
+        logger.error('Failed to refresh {}: {}'.format(view, error))
+    if skipped:
+        logger.error('Skipped dependent views: {}'.format(', '.join(sorted(skipped))))
+    raise RuntimeError('Failed to refresh materialized views: {}'.format(', '.join(sorted(failed))))
+
 @manager.command
-def refresh_materialized():
-    """Refresh materialized views nightly
+def refresh_materialized(processes=1, retries=1):
+    """Refresh materialized views nightly. Views are refreshed in waves that
+    follow the dependency graph in `webservices.flow`, with up to `processes`
+    views refreshed at once; failed views are retried up to `retries` times.
+    Incremental views built as tables are rebuilt in full when due; see
+    `incremental.needs_rebuild`.
     """
     logger.info('Refreshing materialized views...')
-    execute_sql_file('data/refresh_materialized_views.sql')
+    processes, retries = int(processes), int(retries)
+    graph = flow.get_graph()
+    pool = multiprocessing.Pool(processes=processes) if processes > 1 else None
+    start = time.time()
+    tables = incremental.get_tables()
+    full = bool(tables) and incremental.needs_rebuild()
+    if tables:
+        incremental.begin_refresh()
+    try:
+        timings, failed, skipped = refresh_graph(graph, pool, retries, full=full)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    log_refresh_report(timings, start)
+    catalog.bump_generation()
+    cache.bump_generation()
+    if failed:
+        raise_refresh_errors(failed, skipped)
+    if tables:
+        incremental.finish_refresh(rebuilt=full)
     logger.info('Finished refreshing materialized views.')
 
+@manager.option('-f', '--from', dest='sources', required=True,
+                help='Comma-separated names of the data/sql_updates scripts that changed')
+@manager.option('-p', '--processes', dest='processes', default=1,
+                help='Number of scripts or views to run at once')
+@manager.option('-r', '--refresh', dest='refresh', action='store_true', default=False,
+                help='Refresh the existing views instead of rerunning their scripts')
+def rebuild(sources, processes=1, refresh=False):
+    """Rebuild the views created by the given scripts and by every script that
+    depends on them in `webservices.flow`, then swap in the rebuilt views.
+    With `--refresh`, refresh those views in place instead.
+    """
+    processes = int(processes)
+    full_graph = flow.get_graph()
+    graph = flow.get_descendant_graph(full_graph, sources.split(','))
+    logger.info('Rebuilding {}'.format(', '.join(nx.topological_sort(graph))))
+    if refresh:
+        pool = multiprocessing.Pool(processes=processes) if processes > 1 else None
+        start = time.time()
+        try:
+            timings, failed, skipped = refresh_graph(graph, pool, 0, unscripted=False, full=True)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        log_refresh_report(timings, start)
+        if failed:
+            raise_refresh_errors(failed, skipped)
+    else:
+        # Views of scripts upstream of `graph` have already been renamed
+        run_schema_scripts(graph, processes, live_views=flow.get_outside_views(full_graph, graph))
+        rename_script_views(graph)
+    catalog.bump_generation()
+    cache.bump_generation()
+    logger.info('Finished rebuilding {} scripts.'.format(len(graph)))
+
+@manager.command
+def dump_slow_queries(limit=slow_queries.DEFAULT_LIMIT, dest=None):
+    """Write the `limit` statements with the most total time among recorded
+    slow queries, with their slowest call and sampled plan, as JSON to `dest`
+    or standard output. See `webservices.common.slow_queries`.
+    """
+    entries = slow_queries.get_entries(cache.get_client())
+    report = slow_queries.get_top_offenders(entries, limit=int(limit))
+    if dest:
+        with open(dest, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+@manager.command
+def clear_slow_queries():
+    """Discard recorded slow queries."""
+    slow_queries.clear()
+    logger.info('Cleared slow queries.')
+
 @manager.command
 def cf_startup():
     """Migrate schemas on `cf push`."""
@@ -337,7 +682,8 @@ def cf_startup():
 @manager.command
 def load_efile_sheets():
     """Run this management command if there are changes to incoming efiling data structures.
-    It will make the json mapping from the spreadsheets you provide it
+    It will make the json mapping from the spreadsheets you provide it, and
+    pickle the mapping so that processes can load it without parsing JSON.
     """
     import pandas as pd
     sheet_map = {4: 'efile_guide_f3', 5: 'efile_guide_f3p', 6: 'efile_guide_f3x'}
@@ -359,6 +705,39 @@ def load_efile_sheets():
         columns_to_drop = ['summary line number', form_column, 'Unnamed: 5']
         df.drop(columns_to_drop, axis=1, inplace=True)
         df.to_json(path_or_buf="data/" + table + ".json", orient='values')
+    decoders.dump_efile_guides()
+
+@manager.command
+def benchmark_efile_summaries(iterations=1000):
+    """Time the summary line transformation applied to each filing served by
+    `/efile/reports/<type>/`, using a synthetic filing with every summary line.
+    """
+    from types import SimpleNamespace
+    from webservices import schemas
+    guides = {
+        'BaseF3Filing': schemas.get_summary_lines('f3'),
+        'BaseF3PFiling': schemas.get_summary_lines('f3p'),
+        'BaseF3XFiling': schemas.get_summary_lines('f3x'),
+    }
+    iterations = int(iterations)
+    for name, lines in sorted(guides.items()):
+        schema = schemas.schema_map[name]()
+        summary_lines = [
+            SimpleNamespace(line_number=number, column_a=float(number), column_b=float(number))
+            for number in range(1, len(lines) + 1)
+        ]
+        start = time.time()
+        for _ in range(iterations):
+            filing = SimpleNamespace(
+                summary_lines=summary_lines,
+                total_receipts=0.0,
+                total_disbursements=0.0,
+                cash_on_hand_beginning_period=0.0,
+            )
+            schema.parse_summary_rows(filing)
+        elapsed = time.time() - start
+        logger.info('{0}: {1} lines, {2:.1f} us per filing'.format(
+            name, len(lines), elapsed / iterations * 1e6))
 
 
 if __name__ == '__main__':
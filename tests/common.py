@@ -10,6 +10,7 @@ from nplusone.ext.flask_sqlalchemy import NPlusOne
 import manage
 from webservices import rest
 from webservices import __API_VERSION__
+from webservices.common import catalog
 
 
 TEST_CONN = os.getenv('SQLA_TEST_CONN', 'postgresql:///cfdm_unit_test')
@@ -27,6 +28,7 @@ def _reset_schema():
     rest.db.engine.execute('create schema disclosure;')
     rest.db.engine.execute('create schema staging;')
     rest.db.engine.execute('create schema fecapp;')
+    catalog.invalidate()
 
 
 def _reset_schema_for_integration():
@@ -35,6 +37,7 @@ def _reset_schema_for_integration():
     rest.db.engine.execute('drop schema if exists staging cascade;')
     rest.db.engine.execute('drop schema if exists fecapp cascade;')
     rest.db.engine.execute('create schema public;')
+    catalog.invalidate()
 
 
 class BaseTestCase(unittest.TestCase):
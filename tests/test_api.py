@@ -7,6 +7,7 @@ from webservices import rest
 from webservices.rest import api
 from webservices.resources.search import CandidateNameSearch, CommitteeNameSearch
 from webservices.resources.candidates import CandidateList
+from webservices.resources.sched_a import ScheduleAView
 
 
 class OverallTest(ApiBaseTest):
@@ -83,6 +84,45 @@ class OverallTest(ApiBaseTest):
         for itm in page_two:
             self.assertIn(itm, page_one_and_two)
 
+    def test_seek_pagination(self):
+        candidates = [factories.CandidateFactory(district='{0:02d}'.format(idx % 3)) for idx in range(7)]
+        candidates.append(factories.CandidateFactory(district=None))
+        rest.db.session.flush()
+        seen = []
+        response = self._response(api.url_for(CandidateList, seek=True, per_page=3, sort='-district'))
+        while True:
+            seen.extend(response['results'])
+            cursor = response['pagination']['last_cursor']
+            if cursor is None:
+                break
+            response = self._response(api.url_for(CandidateList, cursor=cursor, per_page=3, sort='-district'))
+        self.assertEqual(
+            sorted(each['candidate_id'] for each in seen),
+            sorted(each.candidate_id for each in candidates),
+        )
+        expected = self._results(api.url_for(CandidateList, per_page=100, sort='-district'))
+        self.assertEqual(
+            [each['district'] for each in seen],
+            [each['district'] for each in expected],
+        )
+
+    def test_seek_pagination_invalid_cursor(self):
+        response = self.app.get(api.url_for(CandidateList, cursor='not-a-cursor'))
+        self.assertEqual(response.status_code, 422)
+
+    def test_seek_pagination_sort_mismatch(self):
+        [factories.CandidateFactory() for _ in range(3)]
+        rest.db.session.flush()
+        response = self._response(api.url_for(CandidateList, seek=True, per_page=1, sort='name'))
+        cursor = response['pagination']['last_cursor']
+        response = self.app.get(api.url_for(CandidateList, cursor=cursor, per_page=1, sort='district'))
+        self.assertEqual(response.status_code, 422)
+
+    def test_seek_pagination_args(self):
+        self.assertIn('cursor', CandidateList().args)
+        self.assertNotIn('cursor', ScheduleAView().args)
+        self.assertNotIn('seek', ScheduleAView().args)
+
     def test_typeahead_candidate_search(self):
         rows = [
             factories.CandidateSearchFactory(
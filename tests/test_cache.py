@@ -0,0 +1,187 @@
+import os
+import mock
+import redis
+
+from tests import factories
+from tests.common import ApiBaseTest
+
+from webservices.rest import db, api
+from webservices.common import cache
+from webservices.resources.candidates import CandidateView
+from webservices.resources.filings import FilingsList
+
+
+class FakeRedis(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def lpush(self, key, *values):
+        self.data[key] = list(reversed(values)) + self.data.get(key, [])
+        return len(self.data[key])
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.data.get(key, [])[start:end + 1]
+
+    def lrange(self, key, start, end):
+        values = self.data.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        return lambda *args, **kwargs: self.commands.append((method, args, kwargs))
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.commands]
+
+
+class TestResponseCache(ApiBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client = FakeRedis()
+        cache.generation._value = None
+        patches = [
+            mock.patch.object(cache, 'get_client', return_value=self.client),
+            mock.patch.dict(os.environ, {'FEC_RESPONSE_CACHE': 'true'}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_hit_and_miss(self):
+        candidate = factories.CandidateDetailFactory()
+        db.session.flush()
+        url = api.url_for(CandidateView, candidate_id=candidate.candidate_id)
+
+        response = self.app.get(url)
+        self.assertEqual(response.headers['X-Cache'], cache.MISS)
+        response = self.app.get(url)
+        self.assertEqual(response.headers['X-Cache'], cache.HIT)
+
+        results = self._results(url)
+        self.assertEqual(results[0]['candidate_id'], candidate.candidate_id)
+
+    def test_bump_generation(self):
+        candidate = factories.CandidateDetailFactory()
+        db.session.flush()
+        url = api.url_for(CandidateView, candidate_id=candidate.candidate_id)
+
+        self.app.get(url)
+        cache.bump_generation()
+        response = self.app.get(url)
+        self.assertEqual(response.headers['X-Cache'], cache.MISS)
+
+    def test_disabled(self):
+        candidate = factories.CandidateDetailFactory()
+        db.session.flush()
+        url = api.url_for(CandidateView, candidate_id=candidate.candidate_id)
+        with mock.patch.dict(os.environ, {'FEC_RESPONSE_CACHE': ''}):
+            response = self.app.get(url)
+        self.assertNotIn('X-Cache', response.headers)
+        self.assertEqual(self.client.data, {})
+
+    def test_wait_for_lock_holder(self):
+        self.client.data['key:lock'] = '1'
+        self.client.get = mock.Mock(side_effect=[None, 'cached'])
+        render = mock.Mock()
+        body, status = cache.get_or_render(self.client, 'key', render, 60)
+        self.assertEqual((body, status), ('cached', cache.HIT))
+        self.assertFalse(render.called)
+
+    def test_etag(self):
+        candidate = factories.CandidateDetailFactory()
+        db.session.flush()
+        url = api.url_for(CandidateView, candidate_id=candidate.candidate_id)
+
+        response = self.app.get(url)
+        etag = response.headers['ETag']
+        response = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        cache.bump_generation()
+        response = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_last_modified(self):
+        candidate = factories.CandidateDetailFactory()
+        db.session.flush()
+        url = api.url_for(CandidateView, candidate_id=candidate.candidate_id)
+        cache.bump_generation()
+
+        response = self.app.get(url)
+        last_modified = response.headers['Last-Modified']
+        response = self.app.get(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        response = self.app.get(url, headers={'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_without_response_cache(self):
+        factories.FilingsFactory(committee_id='C001')
+        db.session.flush()
+        url = api.url_for(FilingsList, committee_id='C001')
+        with mock.patch.dict(os.environ, {'FEC_RESPONSE_CACHE': ''}):
+            response = self.app.get(url)
+            etag = response.headers['ETag']
+            self.assertNotIn('X-Cache', response.headers)
+            response = self.app.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            response = self.app.get(
+                api.url_for(FilingsList, committee_id='C002'),
+                headers={'If-None-Match': etag},
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_redis_unavailable(self):
+        candidate = factories.CandidateDetailFactory()
+        db.session.flush()
+        url = api.url_for(CandidateView, candidate_id=candidate.candidate_id)
+        self.client.mget = mock.Mock(side_effect=redis.exceptions.ConnectionError)
+        self.client.get = mock.Mock(side_effect=redis.exceptions.ConnectionError)
+        response = self.app.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_not_modified_skips_query(self):
+        candidate = factories.CandidateDetailFactory()
+        db.session.flush()
+        url = api.url_for(CandidateView, candidate_id=candidate.candidate_id)
+        etag = self.app.get(url).headers['ETag']
+        with mock.patch.object(CandidateView, 'build_query') as build_query:
+            response = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(build_query.called)
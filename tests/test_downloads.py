@@ -1,12 +1,16 @@
+import io
+import csv
+import zipfile
 import datetime
 import mock
-import hashlib
 
 import pytest
 from botocore.exceptions import ClientError
 
 from webservices.rest import db, api
+from webservices.tasks import bundle
 from webservices.tasks import download as tasks
+from webservices.resources import candidates
 from webservices.resources import download as resource
 
 from tests import factories
@@ -16,10 +20,23 @@ class TestDownloadTask(ApiBaseTest):
 
     def test_get_filename(self):
         path = '/v1/candidates/'
-        qs = '?office=H&sort=name'
-        expected = hashlib.sha224((path + qs).encode('utf-8')).hexdigest() + '.zip'
+        qs = b'office=H&sort=name'
+        expected = tasks.get_fingerprint(path, qs) + '.zip'
         assert tasks.get_s3_name(path, qs) == expected
 
+    def test_fingerprint_canonical(self):
+        path = '/v1/candidates/'
+        fingerprint = tasks.get_fingerprint(path, b'office=H&state=CA&state=NY')
+        equivalents = [
+            b'state=NY&office=H&state=CA',
+            b'office=H&state=CA&state=NY&sort=name&per_page=50&page=3',
+            b'office=H&state=CA&state=NY&sort_hide_null=false',
+        ]
+        for qs in equivalents:
+            assert tasks.get_fingerprint(path, qs) == fingerprint
+        assert tasks.get_fingerprint(path, b'office=S&state=CA&state=NY') != fingerprint
+        assert tasks.get_fingerprint('/v1/committees/', b'state=CA&state=NY') != fingerprint
+
     def test_download_url(self):
         obj = mock.Mock()
         obj.key = 'key'
@@ -48,8 +65,8 @@ class TestDownloadTask(ApiBaseTest):
             ExpiresIn=resource.URL_EXPIRY,
         )
 
-    @mock.patch('webservices.tasks.download.upload_s3')
-    def test_views(self, upload_s3):
+    @mock.patch('webservices.tasks.bundle.MultipartUpload')
+    def test_views(self, upload):
         committee = factories.CommitteeFactory(committee_type='H')
         committee_id = committee.committee_id
         factories.CommitteeHistoryFactory(
@@ -78,7 +95,54 @@ class TestDownloadTask(ApiBaseTest):
                 url = api.url_for(view, committee_id=committee.committee_id)
             else:
                 url = api.url_for(view)
-            tasks.export_query(url, b'')
+            tasks.export_query(url, b'', tasks.get_fingerprint(url, b''))
+
+    @mock.patch('webservices.tasks.bundle.MultipartUpload')
+    def test_bundle(self, upload):
+        buffer = io.BytesIO()
+        upload.return_value.write.side_effect = buffer.write
+        [factories.CandidateFactory(name='Doe, "Jane"\nQ') for _ in range(3)]
+        db.session.commit()
+        resource = tasks.call_resource(api.url_for(candidates.CandidateList), b'')
+        tasks.make_bundle(resource)
+
+        upload.assert_called_once_with(resource['name'])
+        assert upload.return_value.complete.called
+        archive = zipfile.ZipFile(io.BytesIO(buffer.getvalue()))
+        assert archive.testzip() is None
+        assert archive.namelist() == ['data.csv', 'manifest.txt']
+        assert len(list(csv.DictReader(io.StringIO(archive.read('data.csv').decode('utf-8'))))) == 3
+        assert '*Count: 3' in archive.read('manifest.txt').decode('utf-8')
+
+    @mock.patch('webservices.tasks.bundle.MultipartUpload')
+    def test_bundle_aborts_on_error(self, upload):
+        resource = tasks.call_resource(api.url_for(candidates.CandidateList), b'')
+        with mock.patch.object(tasks, 'copy_to', side_effect=ValueError):
+            with pytest.raises(ValueError):
+                tasks.make_bundle(resource)
+        assert upload.return_value.abort.called
+        assert not upload.return_value.complete.called
+
+    def test_row_counter(self):
+        counter = bundle.RowCounter(io.BytesIO())
+        counter.write(b'name,id\n')
+        counter.write(b'"Doe, ""Jane""\nQ",1\n')
+        counter.write(b'Smith,2\n')
+        assert counter.rows() == 2
+
+    def test_multipart_upload(self):
+        with mock.patch('webservices.tasks.utils.get_object') as get_object:
+            multipart = get_object.return_value.initiate_multipart_upload.return_value
+            multipart.Part.return_value.upload.return_value = {'ETag': 'etag'}
+            upload = bundle.MultipartUpload('key', part_size=4)
+            upload.write(b'abcdef')
+            upload.write(b'gh')
+            upload.complete()
+        assert [call[1]['Body'] for call in multipart.Part.return_value.upload.call_args_list] == [b'abcdef', b'gh']
+        multipart.complete.assert_called_once_with(MultipartUpload={'Parts': [
+            {'ETag': 'etag', 'PartNumber': 1},
+            {'ETag': 'etag', 'PartNumber': 2},
+        ]})
 
 
 class TestDownloadResource(ApiBaseTest):
@@ -89,8 +153,9 @@ class TestDownloadResource(ApiBaseTest):
         get_cached.return_value = None
         res = self.client.post_json(api.url_for(resource.DownloadView, path='candidates', office='S'))
         assert res.json == {'status': 'queued'}
-        get_cached.assert_called_once_with('/v1/candidates/', b'office=S', filename=None)
-        export.delay.assert_called_once_with('/v1/candidates/', b'office=S')
+        fingerprint = tasks.get_fingerprint('/v1/candidates/', b'office=S')
+        get_cached.assert_called_once_with(fingerprint, filename=None)
+        export.delay.assert_called_once_with('/v1/candidates/', b'office=S', fingerprint)
 
     @mock.patch('webservices.resources.download.get_cached_file')
     @mock.patch('webservices.resources.download.download.export_query')
@@ -124,8 +189,9 @@ class TestDownloadResource(ApiBaseTest):
         mock_object = mock.Mock()
         get_object.return_value = mock_object
         get_download.return_value = '/download'
-        res = resource.get_cached_file('/candidate', b'', filename='download.csv')
+        res = resource.get_cached_file('abc', filename='download.csv')
         assert res == '/download'
+        get_object.assert_called_once_with('abc.zip')
         get_download.assert_called_once_with(mock_object, filename='download.csv')
 
     @mock.patch('webservices.tasks.utils.get_object')
@@ -136,5 +202,5 @@ class TestDownloadResource(ApiBaseTest):
         mock_metadata = mock.PropertyMock(side_effect=get_metadata)
         type(mock_object).metadata = mock_metadata
         get_object.return_value = mock_object
-        res = resource.get_cached_file('/candidate', b'')
+        res = resource.get_cached_file('abc')
         assert res is None
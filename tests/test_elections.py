@@ -1,10 +1,13 @@
 import datetime
 import functools
 
+import sqlalchemy as sa
+
 from tests import factories
 from tests.common import ApiBaseTest, assert_dicts_subset
 
 from webservices.rest import db, api
+from webservices.common import catalog
 from webservices.resources.elections import ElectionList, ElectionView, ElectionSummary
 
 
@@ -51,6 +54,24 @@ class TestElectionSearch(ApiBaseTest):
         assert_dicts_subset(results[1], {'cycle': 2012, 'office': 'S', 'state': 'VA', 'district': '00'})
         assert_dicts_subset(results[2], {'cycle': 2012, 'office': 'H', 'state': 'VA', 'district': '05'})
 
+    def test_search_zip_reflects_tables_once(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'pg_catalog' in statement:
+                statements.append(statement)
+
+        catalog.invalidate()
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self._results(api.url_for(ElectionList, zip='22902'))
+            first = len(statements)
+            self._results(api.url_for(ElectionList, zip='22902'))
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', record)
+        assert first > 0
+        assert len(statements) == first
+
     def test_search_incumbent(self):
         [
             factories.ElectionResultFactory(
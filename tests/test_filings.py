@@ -1,9 +1,11 @@
+import json
 import datetime
 
 from tests import factories
 from tests.common import ApiBaseTest
 
 from webservices.rest import api
+from webservices.common import streaming
 from webservices.resources.filings import FilingsView, FilingsList, EFilingsView
 
 
@@ -24,6 +26,20 @@ class TestFilings(ApiBaseTest):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]['candidate_id'], candidate_id)
 
+    def test_committee_filings_window_count(self):
+        committee_id = 'C8675309'
+        [factories.FilingsFactory(committee_id=committee_id) for _ in range(5)]
+        factories.FilingsFactory(committee_id='C001')
+
+        response = self._response(api.url_for(FilingsView, committee_id=committee_id, per_page=2))
+        self.assertEqual(len(response['results']), 2)
+        self.assertEqual(response['pagination']['count'], 5)
+        self.assertEqual(response['pagination']['pages'], 3)
+
+        response = self._response(api.url_for(FilingsView, committee_id=committee_id, per_page=2, page=4))
+        self.assertEqual(response['results'], [])
+        self.assertEqual(response['pagination']['count'], 5)
+
     def test_filings(self):
         """ Check filings returns in general endpoint"""
         factories.FilingsFactory(committee_id='C001')
@@ -150,6 +166,16 @@ class TestFilings(ApiBaseTest):
 
         self.assertEqual(results[0]['document_description'], 'RFAI: report 2004')
 
+    def test_stream_filings(self):
+        factories.FilingsFactory(committee_id='C001')
+        factories.FilingsFactory(committee_id='C002')
+        url = api.url_for(FilingsView, committee_id='C001')
+        response = self.app.get(url, headers={'Accept': streaming.NDJSON})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, streaming.NDJSON)
+        rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual([row['committee_id'] for row in rows], ['C001'])
+
 
 class TestEfileFiles(ApiBaseTest):
 
@@ -0,0 +1,201 @@
+import os
+import re
+import tempfile
+import unittest
+
+import mock
+import networkx as nx
+
+import manage
+from webservices import flow
+
+
+def fail_b(node):
+    if node == 'b':
+        return 'syntax error'
+
+
+class TestFlow(unittest.TestCase):
+
+    def test_waves_follow_dependencies(self):
+        graph = flow.get_graph()
+        waves = flow.get_waves(graph)
+        position = {
+            node: index
+            for index, wave in enumerate(waves)
+            for node in wave
+        }
+        self.assertEqual(set(position), set(graph.nodes()))
+        for parent, child in graph.edges():
+            self.assertLess(position[parent], position[child])
+
+    def test_waves_empty_graph(self):
+        self.assertEqual(flow.get_waves(nx.DiGraph()), [])
+
+    def test_get_views(self):
+        self.assertEqual(
+            flow.get_views('filings'),
+            ['ofec_filings_amendments_all_mv', 'ofec_filings_mv'],
+        )
+
+
+class TestDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch.object(flow, 'script_path', self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, text):
+        with open(os.path.join(self.directory.name, '{}.sql'.format(name)), 'w') as fp:
+            fp.write(text)
+
+    def test_explicit_edges_in_graph(self):
+        with mock.patch.object(flow, 'script_path', os.path.join('data', 'sql_updates')):
+            graph = flow.get_graph()
+        for parent, child in flow.EXPLICIT_EDGES:
+            self.assertTrue(graph.has_edge(parent, child))
+        self.assertEqual(graph['committee_history']['committee_detail']['source'], 'both')
+        self.assertIn('ofec_committee_history_mv_tmp', graph['committee_history']['committee_detail']['objects'])
+
+    def test_discover_edges(self):
+        self.write('parent', 'create materialized view ofec_parent_mv_tmp as select 1;')
+        self.write('child', (
+            '-- Uses ofec_other_mv_tmp\n'
+            'create materialized view ofec_child_mv_tmp as select * from ofec_parent_mv_tmp;'
+        ))
+        self.write('other', 'create table ofec_other_mv_tmp as select 1;')
+        edges = flow.get_discovered_edges(flow.get_script_names())
+        self.assertEqual(edges, {('parent', 'child'): ['ofec_parent_mv_tmp']})
+
+    def test_cycle(self):
+        self.write('a', 'create materialized view a_tmp as select * from b_tmp;')
+        self.write('b', 'create materialized view b_tmp as select * from a_tmp;')
+        with mock.patch.object(flow, 'EXPLICIT_EDGES', []):
+            with self.assertRaises(ValueError):
+                flow.get_graph()
+
+    def test_report(self):
+        self.write('parent', 'create materialized view ofec_parent_mv_tmp as select 1;')
+        self.write('child', 'create materialized view ofec_child_mv_tmp as select * from ofec_parent_mv_tmp;')
+        with mock.patch.object(flow, 'EXPLICIT_EDGES', []):
+            report = flow.get_report(flow.get_graph())
+        self.assertEqual(report['child']['depends_on'], {
+            'parent': {'source': 'discovered', 'objects': ['ofec_parent_mv_tmp']},
+        })
+        self.assertEqual(report['parent']['views'], ['ofec_parent_mv'])
+
+class TestRefreshMaterialized(unittest.TestCase):
+
+    def test_retry_resumes_from_failed_view(self):
+        calls = []
+
+        def refresh_views(job):
+            name, views = job
+            calls.append(job)
+            if len(calls) == 1:
+                return name, [(views[0], 1.0)], (views[1], 'deadlock detected')
+            return name, [(view, 1.0) for view in views], None
+
+        with mock.patch.object(manage, 'refresh_views', refresh_views):
+            timings, errors = manage.run_refresh_wave([('filings', ['a', 'b', 'c'])], None, retries=1)
+        self.assertEqual(calls, [('filings', ['a', 'b', 'c']), ('filings', ['b', 'c'])])
+        self.assertEqual([view for view, _ in timings], ['a', 'b', 'c'])
+        self.assertEqual(errors, {})
+
+    def test_retry_exhausted(self):
+        def refresh_views(job):
+            return job[0], [], (job[1][0], 'error')
+
+        with mock.patch.object(manage, 'refresh_views', refresh_views):
+            timings, errors = manage.run_refresh_wave([('filings', ['a'])], None, retries=2)
+        self.assertEqual(timings, [])
+        self.assertEqual(errors, {'filings': ('a', 'error')})
+
+
+class TestRunGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = nx.DiGraph()
+        self.graph.add_edges_from([('a', 'b'), ('b', 'c'), ('a', 'd'), ('d', 'e'), ('x', 'e')])
+
+    def test_run_serial(self):
+        calls = []
+        durations, errors, skipped = flow.run_graph(self.graph, calls.append)
+        self.assertEqual(set(calls), set(self.graph.nodes()))
+        position = {node: index for index, node in enumerate(calls)}
+        for parent, child in self.graph.edges():
+            self.assertLess(position[parent], position[child])
+        self.assertEqual(set(durations), set(self.graph.nodes()))
+        self.assertEqual(errors, {})
+        self.assertEqual(skipped, set())
+
+    def test_failure_skips_descendants(self):
+        durations, errors, skipped = flow.run_graph(self.graph, fail_b, processes=2)
+        self.assertEqual(errors, {'b': 'syntax error'})
+        self.assertEqual(skipped, {'c'})
+        self.assertEqual(set(durations), {'a', 'b', 'd', 'e', 'x'})
+
+    def test_critical_path(self):
+        durations = {'a': 1, 'b': 5, 'c': 1, 'd': 2, 'e': 1, 'x': 3}
+        self.assertEqual(flow.get_critical_path(self.graph, durations), (7, ['a', 'b', 'c']))
+
+    def test_critical_path_empty(self):
+        self.assertEqual(flow.get_critical_path(nx.DiGraph(), {}), (0, []))
+
+
+class TestRebuild(unittest.TestCase):
+
+    def test_descendant_graph(self):
+        graph = flow.get_descendant_graph(flow.get_graph(), ['committee_history'])
+        self.assertIn('committee_history', graph)
+        self.assertIn('committee_detail', graph)
+        self.assertIn('committee_fulltext', graph)
+        self.assertNotIn('candidate_history', graph)
+        for node in graph:
+            self.assertTrue(node == 'committee_history' or nx.has_path(graph, 'committee_history', node))
+
+    def test_descendant_graph_unknown(self):
+        with self.assertRaises(ValueError):
+            flow.get_descendant_graph(flow.get_graph(), ['committee_history', 'nonexistent'])
+
+    def test_rebuild(self):
+        with mock.patch.object(manage, 'run_schema_scripts') as run_schema_scripts, \
+                mock.patch.object(manage, 'rename_script_views') as rename_script_views, \
+                mock.patch.object(manage.catalog, 'bump_generation'), \
+                mock.patch.object(manage.cache, 'bump_generation'):
+            manage.rebuild('totals_house_senate,totals_presidential', processes='2')
+        (graph, processes), kwargs = run_schema_scripts.call_args
+        self.assertEqual(processes, 2)
+        self.assertIn('totals_combined', graph)
+        self.assertNotIn('committee_history', graph)
+        self.assertIn('ofec_committee_history_mv', kwargs['live_views'])
+        self.assertNotIn('ofec_totals_combined_mv', kwargs['live_views'])
+        rename_script_views.assert_called_once_with(graph)
+
+    def test_replace_temporary_names(self):
+        text = 'select * from ofec_amendments_mv_tmp join ofec_filings_mv_tmp using (sub_id)'
+        self.assertEqual(
+            flow.replace_temporary_names(text, ['ofec_amendments_mv', 'ofec_filings']),
+            'select * from ofec_amendments_mv join ofec_filings_mv_tmp using (sub_id)',
+        )
+        self.assertEqual(flow.replace_temporary_names(text, []), text)
+
+    def test_rebuild_reads_live_views(self):
+        """Rebuilding from any script only reads temporary views created by
+        the scripts being rebuilt.
+        """
+        graph = flow.get_graph()
+        pattern = re.compile(r'\b(\w+)_tmp\b', re.IGNORECASE)
+        for source in graph.nodes():
+            subgraph = flow.get_descendant_graph(graph, [source])
+            live_views = flow.get_outside_views(graph, subgraph)
+            rebuilt = {view for name in subgraph.nodes() for view in flow.get_views(name)}
+            for name in subgraph.nodes():
+                with open(os.path.join(flow.script_path, '{}.sql'.format(name))) as fp:
+                    text = flow.comment_pattern.sub(' ', fp.read())
+                text = flow.replace_temporary_names(text, live_views)
+                missing = {view.lower() for view in pattern.findall(text)} - rebuilt
+                self.assertEqual(missing, set(), '{} from {}'.format(name, source))
@@ -0,0 +1,161 @@
+import unittest
+
+import mock
+import sqlalchemy as sa
+
+import manage
+from tests import common
+from webservices import flow
+from webservices import incremental
+from webservices.rest import db
+from webservices.config import SQL_CONFIG
+
+
+class TestIncrementalView(unittest.TestCase):
+
+    def test_definition(self):
+        view = incremental.VIEWS['ofec_reports_house_senate_mv']
+        definition = view.get_definition()
+        self.assertTrue(definition.startswith('select'))
+        self.assertNotIn('idx', definition)
+        self.assertNotIn('_tmp', definition)
+        self.assertIn('ofec_amendments_mv', definition)
+        self.assertIn(':START_YEAR', definition)
+
+    def test_definition_with_cte(self):
+        definition = incremental.VIEWS['ofec_totals_presidential_mv'].get_definition()
+        self.assertTrue(definition.startswith('with last as'))
+        self.assertNotIn('row_number', definition)
+
+    def test_index_statements(self):
+        statements = incremental.VIEWS['ofec_totals_house_senate_mv'].get_index_statements()
+        self.assertEqual(
+            statements,
+            [
+                'create unique index on ofec_totals_house_senate_mv_tmp(idx);',
+                'create index on ofec_totals_house_senate_mv_tmp(cycle, idx);',
+                'create index on ofec_totals_house_senate_mv_tmp(committee_id, idx);',
+            ],
+        )
+
+    def test_views_match_scripts(self):
+        for view in incremental.get_views():
+            self.assertIn(view.name, flow.get_views(view.script))
+            view.get_definition()
+
+    def test_get_views(self):
+        views = incremental.get_views(['ofec_totals_presidential_mv'])
+        self.assertEqual([view.script for view in views], ['totals_presidential'])
+        with self.assertRaises(ValueError):
+            incremental.get_views(['ofec_filings_mv'])
+
+    def test_refresh_deletes_before_insert(self):
+        connection = mock.Mock()
+        incremental.VIEWS['ofec_totals_pacs_parties_mv'].refresh(connection)
+        delete, insert = [str(call[0][0]) for call in connection.execute.call_args_list]
+        self.assertTrue(delete.startswith('delete from ofec_totals_pacs_parties_mv'))
+        self.assertIn(incremental.PROCESSING, delete)
+        self.assertTrue(insert.startswith('insert into ofec_totals_pacs_parties_mv'))
+        self.assertIn(incremental.PROCESSING, insert)
+
+    @mock.patch.dict('os.environ', {'FEC_INCREMENTAL_VIEWS': 'true'})
+    def test_update_schemas_swaps_in_one_transaction(self):
+        with mock.patch.object(manage, 'run_schema_scripts'), \
+                mock.patch.object(manage.catalog, 'bump_generation'), \
+                mock.patch.object(manage.incremental, 'rename_tables') as rename_tables, \
+                mock.patch.object(manage, 'db') as db_mock:
+            manage.update_schemas()
+        connection = db_mock.engine.begin.return_value.__enter__.return_value
+        rename_tables.assert_called_once_with(connection)
+        statement = connection.execute.call_args[0][0]
+        self.assertIn('rename_temporary_views', str(statement))
+        self.assertEqual(db_mock.engine.begin.call_count, 1)
+
+    @mock.patch.dict('os.environ', {'FEC_INCREMENTAL_VIEWS': 'true'})
+    def test_enabled(self):
+        self.assertTrue(incremental.is_enabled())
+
+    @mock.patch.dict('os.environ', {'FEC_INCREMENTAL_VIEWS': 'false'})
+    def test_disabled(self):
+        self.assertFalse(incremental.is_enabled())
+
+
+class TestIncrementalRefresh(common.IntegrationTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestIncrementalRefresh, cls).setUpClass()
+        cls.environ = mock.patch.dict('os.environ', {'FEC_INCREMENTAL_VIEWS': 'true'})
+        cls.environ.start()
+        manage.update_all(processes=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.environ.stop()
+        super(TestIncrementalRefresh, cls).tearDownClass()
+
+    def _get_rows(self, view):
+        with db.engine.connect() as connection:
+            columns = ', '.join(view.get_columns(connection))
+            return connection.execute(
+                'select {0} from {1} order by committee_id, cycle'.format(columns, view.name)
+            ).fetchall()
+
+    def _get_receipts(self, committee_id, cycle):
+        return db.engine.execute(
+            sa.text(
+                'select receipts from ofec_totals_pacs_parties_mv '
+                'where committee_id = :committee_id and cycle = :cycle'
+            ),
+            committee_id=committee_id,
+            cycle=cycle,
+        ).scalar()
+
+    def test_refresh_matches_rebuild(self):
+        view = incremental.VIEWS['ofec_totals_pacs_parties_mv']
+        committee_id, cycle = db.engine.execute(
+            sa.text(
+                'select cmte_id, election_cycle from fec_vsum_f3x_vw '
+                'where election_cycle >= :START_YEAR and ttl_receipts is not null '
+                'order by cmte_id, election_cycle limit 1'
+            ),
+            **SQL_CONFIG
+        ).first()
+        receipts = self._get_receipts(committee_id, cycle)
+        db.engine.execute(
+            sa.text(
+                'update fec_vsum_f3x_vw set ttl_receipts = ttl_receipts + 100 '
+                'where cmte_id = :committee_id and election_cycle = :cycle'
+            ).execution_options(autocommit=True),
+            committee_id=committee_id,
+            cycle=cycle,
+        )
+        queued = db.engine.execute(
+            'select distinct cmte_id, cycle from {0}'.format(incremental.QUEUE)
+        ).fetchall()
+        self.assertEqual([tuple(row) for row in queued], [(committee_id, cycle)])
+
+        with db.engine.begin() as connection:
+            incremental.record_rebuild(connection)
+        self.assertFalse(incremental.needs_rebuild())
+        manage.refresh_materialized()
+        for table in [incremental.QUEUE, incremental.PROCESSING]:
+            self.assertEqual(db.engine.execute('select count(*) from {0}'.format(table)).scalar(), 0)
+        self.assertGreater(self._get_receipts(committee_id, cycle), receipts)
+        with db.engine.connect() as connection:
+            for each in incremental.get_views():
+                self.assertEqual(each.check(connection), 0, each.name)
+
+        refreshed = self._get_rows(view)
+        manage.rebuild_incremental(view.name)
+        self.assertEqual(refreshed, self._get_rows(view))
+
+    def test_needs_rebuild(self):
+        with db.engine.begin() as connection:
+            connection.execute('delete from {0}'.format(incremental.REBUILDS))
+        self.assertTrue(incremental.needs_rebuild())
+        with db.engine.begin() as connection:
+            incremental.record_rebuild(connection)
+        self.assertFalse(incremental.needs_rebuild())
+        with mock.patch.dict('os.environ', {'FEC_INCREMENTAL_REBUILD_DAYS': '0'}):
+            self.assertTrue(incremental.needs_rebuild())
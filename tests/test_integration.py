@@ -1,6 +1,7 @@
 import datetime
 import unittest
 
+import mock
 import sqlalchemy as sa
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.orm.session import make_transient
@@ -81,7 +82,27 @@ class TestViews(common.IntegrationTestCase):
                 continue
             self.assertGreater(model.query.count(), 0)
     def test_refresh_materialized(self):
-        db.session.execute('select refresh_materialized()')
+        manage.refresh_materialized(processes=2)
+        temporary = [view for view in manage.get_materialized_views() if view.endswith('_tmp')]
+        self.assertEqual(temporary, [])
+        for model in REPORTS_MODELS + TOTALS_MODELS:
+            self.assertGreater(model.query.count(), 0, model.__name__)
+
+    def test_rebuild(self):
+        """Rebuilding a script reruns the scripts that depend on it against
+        the live views of the scripts it depends on.
+        """
+        for source in ['committee_history', 'totals_house_senate']:
+            manage.rebuild(source)
+        temporary = [view for view in manage.get_materialized_views() if view.endswith('_tmp')]
+        self.assertEqual(temporary, [])
+        for model in [
+                models.CommitteeDetail,
+                models.CommitteeSearch,
+                models.CandidateSearch,
+                models.CommitteeTotalsHouseSenate,
+                models.Filings]:
+            self.assertGreater(model.query.count(), 0, model.__name__)
 
     def test_committee_year_filter(self):
         self._check_entity_model(models.Committee, 'committee_id')
@@ -304,6 +325,28 @@ class TestViews(common.IntegrationTestCase):
         self.assertEqual(search.sub_id, row.sub_id)
         self.assertEqual(search.contributor_name, 'Sheldon Adelson')
 
+    def test_sched_a_queue_batches(self):
+        # Make sure queues are clear before starting
+        self._clear_sched_a_queues()
+
+        rows = [
+            self.SchedAFactory(rpt_yr=2014, contbr_nm='Sheldon Adelson')
+            for _ in range(3)
+        ]
+        db.session.commit()
+        self.assertEqual(self._get_sched_a_queue_new_count(), 3)
+        with mock.patch('time.sleep') as sleep:
+            manage.update_aggregates(batch_size=2, throttle=0.5)
+        self.assertEqual(self._get_sched_a_queue_new_count(), 0)
+        self.assertEqual(self._get_sched_a_queue_old_count(), 0)
+        self.assertEqual(
+            models.ScheduleA.query.filter(
+                models.ScheduleA.sub_id.in_([row.sub_id for row in rows])
+            ).count(),
+            3,
+        )
+        sleep.assert_called_with(0.5)
+
     def _check_update_aggregate_create(self, item_key, total_key, total_model, value):
         filing = self.SchedAFactory(**{
             'rpt_yr': 2015,
@@ -1,11 +1,16 @@
+import io
+import csv
+import json
 import datetime
 
+import mock
 import sqlalchemy as sa
 
 from tests import factories
 from tests.common import ApiBaseTest
 
 from webservices.rest import api
+from webservices.common import streaming
 from webservices.common.models import ScheduleA, ScheduleB, ScheduleE, ScheduleAEfile, ScheduleBEfile, ScheduleEEfile
 from webservices.schemas import ScheduleASchema
 from webservices.schemas import ScheduleBSchema
@@ -482,3 +487,71 @@ class TestItemized(ApiBaseTest):
             results = self._results(api.url_for(ScheduleEEfileView, **{label: values[0]}))
             assert len(results) == 1
             assert results[0][column.key] == values[0]
+
+
+class TestStreaming(ApiBaseTest):
+    kwargs = {'two_year_transaction_period': 2016}
+
+    def _stream(self, url, mimetype):
+        response = self.app.get(url, headers={'Accept': mimetype})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, mimetype)
+        return response
+
+    def test_ndjson(self):
+        [
+            factories.ScheduleAFactory(
+                contribution_receipt_date=datetime.date(2016, 1, day),
+                two_year_transaction_period=2016,
+            )
+            for day in (3, 1, 2)
+        ]
+        url = api.url_for(ScheduleAView, sort='contribution_receipt_date', **self.kwargs)
+        response = self._stream(url, streaming.NDJSON)
+        rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual(
+            [row['contribution_receipt_date'] for row in rows],
+            ['2016-01-01', '2016-01-02', '2016-01-03'],
+        )
+
+    def test_csv(self):
+        factories.ScheduleAFactory(committee_id='C01', two_year_transaction_period=2016)
+        factories.ScheduleAFactory(committee_id='C02', two_year_transaction_period=2016)
+        url = api.url_for(ScheduleAView, committee_id='C01', **self.kwargs)
+        response = self._stream(url, streaming.CSV)
+        rows = list(csv.DictReader(io.StringIO(response.data.decode('utf-8'))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['committee_id'], 'C01')
+
+    def test_row_cap(self):
+        [factories.ScheduleAFactory(two_year_transaction_period=2016) for _ in range(3)]
+        url = api.url_for(ScheduleAView, **self.kwargs)
+        with mock.patch.object(ScheduleAView, 'stream_max_rows', 2):
+            response = self._stream(url, streaming.NDJSON)
+        self.assertEqual(response.headers['X-Row-Cap'], '2')
+        lines = response.data.decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[-1]), {'truncated': True, 'row_cap': 2})
+
+    def test_row_cap_not_reached(self):
+        [factories.ScheduleAFactory(two_year_transaction_period=2016) for _ in range(2)]
+        url = api.url_for(ScheduleAView, **self.kwargs)
+        with mock.patch.object(ScheduleAView, 'stream_max_rows', 2):
+            response = self._stream(url, streaming.NDJSON)
+        rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(all('truncated' not in row for row in rows))
+
+    def test_row_cap_csv(self):
+        [factories.ScheduleAFactory(two_year_transaction_period=2016) for _ in range(3)]
+        url = api.url_for(ScheduleAView, **self.kwargs)
+        with mock.patch.object(ScheduleAView, 'stream_max_rows', 2):
+            response = self._stream(url, streaming.CSV)
+        rows = list(csv.reader(io.StringIO(response.data.decode('utf-8'))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1], ['# truncated at row cap of 2'])
+
+    def test_json_by_default(self):
+        factories.ScheduleAFactory(two_year_transaction_period=2016)
+        results = self._results(api.url_for(ScheduleAView, **self.kwargs))
+        self.assertEqual(len(results), 1)
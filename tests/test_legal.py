@@ -1,4 +1,5 @@
 from webservices import rest
+import os
 import json
 import codecs
 import unittest
@@ -7,6 +8,9 @@ from mock import patch
 from elasticsearch_dsl import Q
 
 from webservices.resources.legal import es, parse_query_string
+from webservices.legal_docs import cache
+
+from tests.test_cache import FakeRedis
 
 # TODO: integrate more with API Schema so that __API_VERSION__ is returned
 # self.assertEqual(result['api_version'], __API_VERSION__)
@@ -48,6 +52,14 @@ def es_search(**kwargs):
         return {'hits': {'hits': [{'highlight': {'text': ['f']},
                                     '_source': {}, '_type': 'murs'}], 'total': 4}}
 
+def es_msearch(body, **kwargs):
+    return {'responses': [es_search(body=search) for search in body[1::2]]}
+
+def es_msearch_failure(body, **kwargs):
+    responses = es_msearch(body)['responses']
+    responses[1] = {'error': 'SearchPhaseExecutionException[Failed to execute phase [query]]'}
+    return {'responses': responses}
+
 
 class CanonicalPageTest(unittest.TestCase):
     @patch('webservices.rest.legal.es.search', es_advisory_opinion)
@@ -87,7 +99,7 @@ class SearchTest(unittest.TestCase):
     def setUp(self):
         self.app = rest.app.test_client()
 
-    @patch('webservices.rest.legal.es.search', es_search)
+    @patch('webservices.rest.legal.es.msearch', es_msearch)
     def test_default_search(self):
         response = self.app.get('/v1/legal/search/?q=president&api_key=1234')
         assert response.status_code == 200
@@ -101,6 +113,34 @@ class SearchTest(unittest.TestCase):
             'advisory_opinions': [{'highlights': ['a', 'b']},
               {'highlights': ['c', 'd']}], 'total_all': 10}
 
+    @patch.object(es, 'search')
+    @patch.object(es, 'msearch')
+    def test_default_search_multi_search(self, es_msearch_mock, es_search_mock):
+        es_msearch_mock.side_effect = es_msearch
+        response = self.app.get('/v1/legal/search/?q=president&api_key=1234')
+        assert response.status_code == 200
+        assert es_msearch_mock.call_count == 1
+        assert not es_search_mock.called
+
+        _, kwargs = es_msearch_mock.call_args
+        headers = kwargs['body'][::2]
+        searches = kwargs['body'][1::2]
+        assert [header['type'] for header in headers] == \
+            ['statutes', 'regulations', 'advisory_opinions', 'murs']
+        assert [search['query']['bool']['must'][0] for search in searches] == [
+            {'term': {'_type': header['type']}} for header in headers]
+        assert all('timeout' in search for search in searches)
+
+    @patch('webservices.rest.legal.es.msearch', es_msearch_failure)
+    def test_default_search_type_failure(self):
+        response = self.app.get('/v1/legal/search/?q=president&api_key=1234')
+        assert response.status_code == 200
+        result = json.loads(codecs.decode(response.data))
+        assert result['regulations'] == []
+        assert result['total_regulations'] == 0
+        assert result['total_statutes'] == 3
+        assert result['total_all'] == 9
+
     @patch('webservices.rest.legal.es.search', es_search)
     def test_type_search(self):
         response = self.app.get('/v1/legal/search/' +
@@ -305,3 +345,91 @@ class LegalPhraseSearchTests(unittest.TestCase):
 
         match = next((q for q in must_clause if 'match' in q), None)
         assert match == {'match': {'_all': 'required 2016'}}, "Expected `match` clause for non-phrase terms"
+
+
+class LegalCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = rest.app.test_client()
+        self.client = FakeRedis()
+        cache.generation._value = None
+        cache.lru.clear()
+        cache.stats.reset()
+        patches = [
+            mock.patch.object(cache.cache, 'get_client', return_value=self.client),
+            mock.patch.dict(os.environ, {'FEC_LEGAL_CACHE': 'true'}),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch.object(es, 'search')
+    def test_hit_and_miss(self, es_search):
+        es_search.side_effect = es_advisory_opinion
+        url = '/v1/legal/docs/advisory_opinions/1993-02?api_key=1234'
+        first = json.loads(codecs.decode(self.app.get(url).data))
+        second = json.loads(codecs.decode(self.app.get(url + '&api_key=5678').data))
+        assert first == second == {'docs': [{'text': 'abc'}, {'no': '123'}]}
+        assert es_search.call_count == 1
+        assert cache.stats.summary()['lru_hits'] == 1
+        assert cache.stats.summary()['hit_ratio'] == 0.5
+
+    @patch.object(es, 'search')
+    def test_bump_generation(self, es_search):
+        es_search.side_effect = es_advisory_opinion
+        url = '/v1/legal/docs/advisory_opinions/1993-02?api_key=1234'
+        self.app.get(url)
+        cache.bump_generation()
+        self.app.get(url)
+        assert es_search.call_count == 2
+
+    @patch.object(es, 'search')
+    def test_redis_tier(self, search):
+        search.side_effect = es_search
+        url = '/v1/legal/search/?q=president&type=advisory_opinions'
+        with mock.patch.dict(os.environ, {'FEC_LEGAL_CACHE_REDIS': 'true'}):
+            self.app.get(url)
+            cache.lru.clear()
+            result = json.loads(codecs.decode(self.app.get(url).data))
+        assert search.call_count == 1
+        assert result['total_advisory_opinions'] == 2
+        assert cache.stats.summary()['redis_hits'] == 1
+
+    @patch.object(es, 'search')
+    def test_disabled(self, es_search):
+        es_search.side_effect = es_advisory_opinion
+        url = '/v1/legal/docs/advisory_opinions/1993-02?api_key=1234'
+        with mock.patch.dict(os.environ, {'FEC_LEGAL_CACHE': ''}):
+            self.app.get(url)
+            self.app.get(url)
+        assert es_search.call_count == 2
+        assert len(cache.lru) == 0
+
+    @patch('webservices.rest.legal.es.msearch', es_msearch_failure)
+    def test_partial_not_cached(self):
+        url = '/v1/legal/search/?q=president'
+        with mock.patch.dict(os.environ, {'FEC_LEGAL_CACHE_REDIS': 'true'}):
+            result = json.loads(codecs.decode(self.app.get(url).data))
+        assert result['total_regulations'] == 0
+        assert result['total_statutes'] == 3
+        assert len(cache.lru) == 0
+        assert not any('UniversalSearch' in key for key in self.client.data)
+
+    @patch.object(es, 'search')
+    def test_timed_out_not_cached(self, search):
+        search.side_effect = lambda **kwargs: dict(es_search(**kwargs), timed_out=True)
+        url = '/v1/legal/search/?q=president&type=advisory_opinions'
+        self.app.get(url)
+        result = json.loads(codecs.decode(self.app.get(url).data))
+        assert result['total_advisory_opinions'] == 2
+        assert search.call_count == 2
+        assert len(cache.lru) == 0
+
+    def test_lru_eviction(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        assert lru.get('a') == 1
+        assert lru.get('b') is None
+        assert lru.get('c') == 3
@@ -8,8 +8,7 @@ import pytest
 
 import manage
 from webservices import rest
-from webservices.legal_docs import DOCS_INDEX
-from webservices.legal_docs.current_murs import parse_regulatory_citations, parse_statutory_citations
+from webservices.legal_docs.current_murs import get_murs, parse_regulatory_citations, parse_statutory_citations
 from tests.common import TEST_CONN, BaseTestCase
 
 @pytest.mark.parametrize("test_input,case_id,entity_id,expected", [
@@ -117,8 +116,8 @@ class TestLoadCurrentMURs(BaseTestCase):
         rest.db.session.remove()
 
     @patch('webservices.legal_docs.current_murs.get_bucket')
-    @patch('webservices.legal_docs.current_murs.get_elasticsearch_connection')
-    def test_simple_mur(self, get_es_conn, get_bucket):
+    @patch('webservices.legal_docs.current_murs.bulk.index_documents')
+    def test_simple_mur(self, index_documents, get_bucket):
         mur_subject = 'Fraudulent misrepresentation'
         expected_mur = {
             'no': '1',
@@ -140,16 +139,35 @@ class TestLoadCurrentMURs(BaseTestCase):
         }
         self.create_mur(1, expected_mur['no'], expected_mur['name'], mur_subject)
         manage.legal_docs.load_current_murs()
-        index, doc_type, mur = get_es_conn.return_value.index.call_args[0]
+        es, doc_type, murs = index_documents.call_args[0]
+        mur = next(murs)
 
-        assert index == DOCS_INDEX
         assert doc_type == 'murs'
         assert mur == expected_mur
 
     @patch('webservices.env.env.get_credential', return_value='BUCKET_NAME')
     @patch('webservices.legal_docs.current_murs.get_bucket')
-    @patch('webservices.legal_docs.current_murs.get_elasticsearch_connection')
-    def test_mur_with_participants_and_documents(self, get_es_conn, get_bucket, get_credential):
+    def test_multiple_murs(self, get_bucket, get_credential):
+        self.create_mur(1, '1', 'First MUR', 'Fraudulent misrepresentation')
+        self.create_mur(2, '2', 'Second MUR', 'Allocation')
+        self.create_mur(3, '3', 'Third MUR', 'Committees')
+        self.create_participant(1, 1, 'Respondent', 'Bilbo Baggins')
+        self.create_document(2, 1, 'A Category', 'Some text')
+        self.create_document(2, 2, 'Another Category', 'Different text')
+
+        murs = list(get_murs())
+
+        assert [mur['no'] for mur in murs] == ['1', '2', '3']
+        assert [mur['subjects'] for mur in murs] == [
+            ['Fraudulent misrepresentation'], ['Allocation'], ['Committees']]
+        assert [mur['respondents'] for mur in murs] == [['Bilbo Baggins'], [], []]
+        assert [[d['text'] for d in mur['documents']] for mur in murs] == [
+            [], ['Some text', 'Different text'], []]
+
+    @patch('webservices.env.env.get_credential', return_value='BUCKET_NAME')
+    @patch('webservices.legal_docs.current_murs.get_bucket')
+    @patch('webservices.legal_docs.current_murs.bulk.index_documents')
+    def test_mur_with_participants_and_documents(self, index_documents, get_bucket, get_credential):
         case_id = 1
         mur_subject = 'Fraudulent misrepresentation'
         expected_mur = {
@@ -181,9 +199,9 @@ class TestLoadCurrentMURs(BaseTestCase):
             self.create_document(case_id, document_id, category, ocrtext)
 
         manage.legal_docs.load_current_murs()
-        index, doc_type, mur = get_es_conn.return_value.index.call_args[0]
+        es, doc_type, murs = index_documents.call_args[0]
+        mur = next(murs)
 
-        assert index == DOCS_INDEX
         assert doc_type == 'murs'
         for key in expected_mur:
             assert mur[key] == expected_mur[key]
@@ -198,8 +216,8 @@ class TestLoadCurrentMURs(BaseTestCase):
 
     @patch('webservices.env.env.get_credential', return_value='BUCKET_NAME')
     @patch('webservices.legal_docs.current_murs.get_bucket')
-    @patch('webservices.legal_docs.current_murs.get_elasticsearch_connection')
-    def test_mur_with_disposition(self, get_es_conn, get_bucket, get_credential):
+    @patch('webservices.legal_docs.current_murs.bulk.index_documents')
+    def test_mur_with_disposition(self, index_documents, get_bucket, get_credential):
         case_id = 1
         case_no = '1'
         name = 'Open Elections LLC'
@@ -255,7 +273,8 @@ class TestLoadCurrentMURs(BaseTestCase):
         self.create_commission(commission_id, agenda_date, vote_date, action, case_id, pg_date)
 
         manage.legal_docs.load_current_murs()
-        index, doc_type, mur = get_es_conn.return_value.index.call_args[0]
+        es, doc_type, murs = index_documents.call_args[0]
+        mur = next(murs)
 
         expected_mur = {'disposition': {'data': [{'disposition': 'Conciliation-PPC',
             'respondent': 'Open Elections LLC', 'penalty': Decimal('50000.00'),
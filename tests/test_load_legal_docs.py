@@ -1,5 +1,8 @@
 import unittest
 from mock import patch
+
+from elasticsearch.helpers import BulkIndexError
+from elasticsearch.serializer import JSONSerializer
 from webservices.legal_docs import (
     delete_murs_from_es,
     delete_murs_from_s3,
@@ -16,10 +19,12 @@ from webservices.legal_docs.load_legal_docs import (
     get_xml_tree_from_url,
 )
 from webservices.legal_docs import DOCS_INDEX
+from webservices.legal_docs import bulk, relations
 
 from zipfile import ZipFile
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 import json
+import os
 
 def test_get_subject_tree():
     assert get_subject_tree("foo") == [{"text": "Foo"}]
@@ -28,6 +33,17 @@ def test_get_subject_tree():
         "foo<ul class='no-top-margin'><li>bar</li><li>baz</li></ul>") == [
             {"text": "Foo", "children": [{"text": "Bar"}, {"text": "Baz"}]}]
 
+def test_get_batches():
+    assert list(relations.get_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(relations.get_batches([], 2)) == []
+
+def test_align_groups():
+    groups = [(0, ['a']), (2, ['b', 'c']), (5, ['d']), (6, ['e'])]
+    assert list(relations.align_groups([1, 2, 3, 5], groups)) == [[], ['b', 'c'], [], ['d']]
+
+class TransportMock:
+    serializer = JSONSerializer()
+
 class ElasticSearchMock:
     class ElasticSearchIndicesMock:
         def delete(self, index):
@@ -40,10 +56,20 @@ class ElasticSearchMock:
     def __init__(self, dictToIndex):
         self.dictToIndex = dictToIndex
         self.indices = ElasticSearchMock.ElasticSearchIndicesMock()
+        self.transport = TransportMock()
 
     def index(self, index, doc_type, doc, id):
         assert self.dictToIndex == doc
 
+    def bulk(self, body, **kwargs):
+        lines = body.splitlines()
+        items = []
+        for action, doc in zip(lines[::2], lines[1::2]):
+            assert json.loads(action)['index']['_index'] == DOCS_INDEX
+            assert self.dictToIndex == json.loads(doc)
+            items.append({'index': {'status': 201}})
+        return {'items': items}
+
     def delete_by_query(self, index, body, doc_type):
         assert index == DOCS_INDEX
 
@@ -169,6 +195,10 @@ class BucketMock:
     def put_object(self, Key, Body, ContentType, ACL):
         assert Key == self.key
 
+class SessionMock:
+    def get(self, url, stream=False):
+        return [b'ABC', b'def']
+
 def get_bucket_mock(existing_pdfs, key):
     def get_bucket():
         return BucketMock(existing_pdfs, key)
@@ -248,6 +278,7 @@ class InitializeLegalDocsTest(unittest.TestCase):
 def raise_pdf_exception(PDF):
     raise Exception('Could not parse PDF')
 
+@patch('webservices.legal_docs.load_legal_docs.requests.Session', SessionMock)
 class LoadArchivedMursTest(unittest.TestCase):
     @patch('webservices.utils.get_elasticsearch_connection',
         get_es_with_doc(json.load(open('tests/data/archived_mur_doc.json'))))
@@ -306,6 +337,28 @@ class LoadArchivedMursTest(unittest.TestCase):
     def test_with_bad_pdf(self):
         load_archived_murs()
 
+    @patch('webservices.utils.get_elasticsearch_connection',
+        get_es_with_doc(json.load(open('tests/data/archived_mur_doc.json'))))
+    @patch('webservices.legal_docs.load_legal_docs.get_bucket',
+        get_bucket_mock([obj('legal/murs/2.pdf')], 'legal/murs/1.pdf'))
+    @patch('webservices.legal_docs.load_legal_docs.slate.PDF', lambda t: ['page1', 'page2'])
+    @patch('webservices.legal_docs.load_legal_docs.env.get_credential', lambda e: 'bucket123')
+    @patch('webservices.legal_docs.load_legal_docs.requests.get',
+        mock_archived_murs_get_request(open('tests/data/archived_mur_data.html').read()))
+    def test_checkpoint(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archived_murs.checkpoint')
+            load_archived_murs(processes=2, checkpoint=path)
+            with open(path) as fp:
+                assert fp.read().split() == ['2', '1']
+
+            indexed = []
+            with patch('webservices.legal_docs.load_legal_docs.bulk.index_documents') as index_documents:
+                index_documents.side_effect = lambda es, doc_type, docs, **kwargs: indexed.extend(docs)
+                load_archived_murs(checkpoint=path)
+            assert index_documents.called
+            assert indexed == []
+
     @patch('webservices.legal_docs.load_legal_docs.get_bucket',
         get_bucket_mock([obj('legal/murs/2.pdf')], 'legal/murs/1.pdf'))
     def test_delete_murs_from_s3(self):
@@ -314,3 +367,53 @@ class LoadArchivedMursTest(unittest.TestCase):
     @patch('webservices.utils.get_elasticsearch_connection', get_es_with_doc({}))
     def test_delete_murs_from_es(self):
         delete_murs_from_es()
+
+
+class BulkElasticSearchMock:
+    """Respond to each bulk request with the next list of statuses.
+    """
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.transport = TransportMock()
+
+    def bulk(self, body, **kwargs):
+        ids = [json.loads(line)['index']['_id'] for line in body.splitlines()[::2]]
+        self.requests.append(ids)
+        statuses = self.responses.pop(0)
+        return {'items': [{'index': {'_id': id, 'status': status}} for id, status in zip(ids, statuses)]}
+
+
+class BulkIndexTest(unittest.TestCase):
+    def make_docs(self, count, text='text'):
+        return [{'doc_id': str(index), 'text': text} for index in range(count)]
+
+    def test_chunk_size(self):
+        es = BulkElasticSearchMock([201, 201], [201, 201], [201])
+        count = bulk.index_documents(es, 'murs', self.make_docs(5), chunk_size=2)
+        assert count == 5
+        assert es.requests == [['0', '1'], ['2', '3'], ['4']]
+
+    def test_max_chunk_bytes(self):
+        es = BulkElasticSearchMock([201], [201], [201])
+        docs = self.make_docs(3, text='x' * 100)
+        bulk.index_documents(es, 'murs', docs, max_chunk_bytes=150)
+        assert es.requests == [['0'], ['1'], ['2']]
+
+    @patch('webservices.legal_docs.bulk.time.sleep')
+    def test_retry_rejected(self, sleep):
+        es = BulkElasticSearchMock([201, 429, 201], [429], [201])
+        bulk.index_documents(es, 'murs', self.make_docs(3), initial_backoff=1)
+        assert es.requests == [['0', '1', '2'], ['1'], ['1']]
+        assert [call[0][0] for call in sleep.call_args_list] == [1, 2]
+
+    @patch('webservices.legal_docs.bulk.time.sleep')
+    def test_retries_exhausted(self, sleep):
+        es = BulkElasticSearchMock([429], [429])
+        with self.assertRaises(BulkIndexError):
+            bulk.index_documents(es, 'murs', self.make_docs(1), max_retries=1)
+
+    def test_error(self):
+        es = BulkElasticSearchMock([201, 400])
+        with self.assertRaises(BulkIndexError):
+            bulk.index_documents(es, 'murs', self.make_docs(2))
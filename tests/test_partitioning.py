@@ -1,5 +1,6 @@
 import datetime
 
+import mock
 import sqlalchemy as sa
 
 from tests import factories
@@ -50,3 +51,37 @@ class TestPartitioning(ApiBaseTest):
         )
 
         self.assertIsNone(temp_table.scalar())
+
+    def test_run_jobs(self):
+        self.assertEqual(utils.run_jobs(abs, [-1, 2, -3]), [1, 2, 3])
+
+    def test_create_indexes(self):
+        indexes = [mock.Mock() for _ in range(6)]
+        with mock.patch.object(sched_a.SchedAGroup, 'index_factory', return_value=indexes):
+            sched_a.SchedAGroup.create_indexes(mock.Mock())
+        for index in indexes:
+            index.drop.assert_called_once_with(db.engine)
+            index.create.assert_called_once_with(db.engine)
+
+    def test_create_indexes_in_threads(self):
+        table = sa.Table(
+            'test_partition_indexes', sa.MetaData(),
+            sa.Column('a', sa.Integer), sa.Column('b', sa.Integer), sa.Column('c', sa.Integer),
+        )
+        table.create(db.engine)
+        self.addCleanup(table.drop, db.engine)
+        indexes = [sa.Index('ix_test_partition_indexes_{0}'.format(column.name), column) for column in table.columns]
+        with mock.patch.object(sched_a.SchedAGroup, 'index_factory', return_value=indexes), \
+                mock.patch.object(sched_a.SchedAGroup, 'index_workers', 2):
+            sched_a.SchedAGroup.create_indexes(table)
+        names = db.engine.execute(
+            "select indexname from pg_indexes where tablename = 'test_partition_indexes'"
+        ).fetchall()
+        self.assertEqual(sorted(name for name, in names), sorted(index.name for index in indexes))
+
+    def test_create_indexes_error(self):
+        indexes = [mock.Mock(), mock.Mock()]
+        indexes[1].create.side_effect = sa.exc.InternalError('create index', {}, None)
+        with mock.patch.object(sched_a.SchedAGroup, 'index_factory', return_value=indexes):
+            with self.assertRaises(sa.exc.InternalError):
+                sched_a.SchedAGroup.create_indexes(mock.Mock())
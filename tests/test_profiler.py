@@ -0,0 +1,100 @@
+import os
+import unittest
+
+import mock
+import flask
+import sqlalchemy as sa
+
+from tests.common import ApiBaseTest
+
+from webservices.rest import api
+from webservices.common import profiler
+from webservices.resources.metrics import InternalMetrics
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        profiler.metrics.reset()
+        self.addCleanup(profiler.metrics.reset)
+        self.engine = sa.create_engine('sqlite://')
+        self.app = flask.Flask(__name__)
+
+        @self.app.route('/things/')
+        def things():
+            with profiler.phase('count'):
+                pass
+            with profiler.phase('hydrate', sql='page_query'):
+                self.engine.execute('select 1').fetchall()
+            return 'things'
+
+    def init_app(self):
+        with mock.patch.dict(os.environ, {'FEC_PROFILER': 'true'}):
+            profiler.init_app(self.app)
+        for name, listener in [
+                ('before_cursor_execute', profiler.before_cursor_execute),
+                ('after_cursor_execute', profiler.after_cursor_execute)]:
+            self.addCleanup(sa.event.remove, sa.engine.Engine, name, listener)
+
+    def test_server_timing(self):
+        self.init_app()
+        response = self.app.test_client().get('/things/')
+        timings = dict(
+            each.split(';dur=')
+            for each in response.headers['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timings), {'count', 'hydrate', 'page_query', 'total'})
+        self.assertGreater(float(timings['page_query']), 0)
+
+    def test_metrics(self):
+        self.init_app()
+        client = self.app.test_client()
+        client.get('/things/')
+        client.get('/things/')
+        endpoints = profiler.metrics.summary()['endpoints']
+        self.assertEqual(endpoints['things']['total']['count'], 2)
+        self.assertEqual(endpoints['things']['count']['buckets']['+Inf'], 2)
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {'FEC_PROFILER': ''}):
+            profiler.init_app(self.app)
+        response = self.app.test_client().get('/things/')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(profiler.metrics.summary()['endpoints'], {})
+        self.assertIs(profiler.phase('count'), profiler.NULL_PHASE)
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_summary(self):
+        histogram = profiler.Histogram(buckets=(1, 10, 100))
+        for value in [0.5, 5, 5, 50, 500]:
+            histogram.observe(value)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 5)
+        self.assertEqual(summary['max'], 500)
+        self.assertEqual(summary['buckets'], {'1': 1, '10': 3, '100': 4, '+Inf': 5})
+        self.assertEqual(summary['p50'], 10)
+        self.assertEqual(summary['p99'], 500)
+
+    def test_empty(self):
+        summary = profiler.Histogram().summary()
+        self.assertEqual(summary['count'], 0)
+        self.assertEqual(summary['p95'], 0.0)
+
+
+class TestInternalMetrics(ApiBaseTest):
+
+    def test_metrics(self):
+        profiler.metrics.reset()
+        profiler.metrics.record('v1.candidatelist', {'count': 0.01, 'total': 0.02})
+        with mock.patch.dict(os.environ, {'FEC_PROFILER': 'true'}):
+            results = self._response(api.url_for(InternalMetrics))
+        self.assertEqual(results['endpoints']['v1.candidatelist']['total']['count'], 1)
+        self.assertIn('hit_ratio', results['legal_cache'])
+        self.assertIn('indexes', results['catalog'])
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {'FEC_PROFILER': ''}):
+            response = self.app.get(api.url_for(InternalMetrics), expect_errors=True)
+        self.assertEqual(response.status_code, 404)
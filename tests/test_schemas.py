@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import mock
+
+from webservices import schemas, decoders
+
+
+class TestSummaryLines(unittest.TestCase):
+
+    def test_compile_summary_lines(self):
+        lines = schemas.compile_summary_lines(
+            ['coh per', 'net contributions per'],
+            ['coh ytd', 'net contributions ytd'],
+            ['cash', 'contributions'],
+        )
+        self.assertEqual(lines[0], ('cash_period', 'cash_ytd'))
+        self.assertEqual(lines[1].column_a, 'contributions_period')
+        self.assertEqual(lines[1].column_b, 'contributions_ytd')
+
+    def test_extract_columns(self):
+        lines = schemas.compile_summary_lines(
+            ['coh per', 'receipts per'],
+            ['coh ytd', 'receipts ytd'],
+            ['cash', 'receipts'],
+        )
+        filing = SimpleNamespace(summary_lines=[
+            SimpleNamespace(line_number=2, column_a=10, column_b=20),
+            SimpleNamespace(line_number=1, column_a=1, column_b=2),
+        ])
+        self.assertEqual(
+            schemas.extract_columns(filing, lines),
+            {'receipts_period': 10, 'receipts_ytd': 20, 'cash_period': 1, 'cash_ytd': 2},
+        )
+
+    def test_extract_columns_no_lines(self):
+        filing = SimpleNamespace(summary_lines=[])
+        self.assertIsNone(schemas.extract_columns(filing, schemas.get_summary_lines('f3x')))
+
+    def test_guides_compiled(self):
+        for form in decoders.EFILE_FORMS:
+            lines = schemas.get_summary_lines(form)
+            self.assertTrue(lines)
+            self.assertTrue(all(' ' not in key for keys in lines for key in keys))
+
+
+class TestEfileGuides(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        pickle_path = os.path.join(self.directory.name, decoders.EFILE_GUIDES_PICKLE)
+        patcher = mock.patch.object(decoders, 'get_pickle_path', return_value=pickle_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        decoders.get_efile_guides.cache_clear()
+        self.addCleanup(decoders.get_efile_guides.cache_clear)
+
+    def test_parse_json(self):
+        guide = decoders.get_efile_guide('f3x')
+        self.assertEqual(len(guide.col_a), len(guide.col_b))
+        self.assertEqual(len(guide.col_a), len(guide.description))
+
+    def test_pickle(self):
+        parsed = decoders.get_efile_guides()
+        decoders.dump_efile_guides()
+        with mock.patch.object(decoders, 'parse_efile_guide') as parse_efile_guide:
+            self.assertEqual(decoders.get_efile_guides(), parsed)
+        self.assertFalse(parse_efile_guide.called)
+
+    def test_stale_pickle(self):
+        decoders.dump_efile_guides()
+        os.utime(decoders.get_pickle_path(), (0, 0))
+        self.assertIsNone(decoders.load_pickled_guides())
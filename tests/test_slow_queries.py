@@ -0,0 +1,140 @@
+import os
+import unittest
+from types import SimpleNamespace
+
+import mock
+import flask
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from tests.test_cache import FakeRedis
+
+from webservices.common import cache
+from webservices.common import counts
+from webservices.common import slow_queries
+from webservices.tasks import slow_queries as tasks
+
+
+class TestSlowQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+        patcher = mock.patch.object(cache, 'get_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = sa.create_engine('sqlite://')
+        self.app = flask.Flask(__name__)
+        self.app.add_url_rule('/things/', 'things', lambda: 'things')
+
+    def init_app(self, **env):
+        environ = dict({'FEC_SLOW_QUERY_MS': '0.000001'}, **env)
+        patcher = mock.patch.dict(os.environ, environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        slow_queries.init_app(self.app)
+        for name, listener in [
+                ('before_cursor_execute', slow_queries.before_cursor_execute),
+                ('after_cursor_execute', slow_queries.after_cursor_execute)]:
+            self.addCleanup(sa.event.remove, sa.engine.Engine, name, listener)
+
+    def execute(self, *args):
+        with self.app.test_request_context('/things/'):
+            self.engine.execute(*args).fetchall()
+
+    def test_record(self):
+        self.init_app()
+        self.execute('select ?', 1)
+        entries = slow_queries.get_entries(self.client)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['endpoint'], 'things')
+        self.assertEqual(entries[0]['statement'], 'select ?')
+        self.assertEqual(entries[0]['parameters'], ['1'])
+        self.assertIsNone(entries[0]['plan'])
+
+    def test_origin_ignores_api_key(self):
+        with self.app.test_request_context('/things/?api_key=1234&contributor_state=VA'):
+            origin = slow_queries.get_origin()
+        self.assertEqual(origin['args'], {'contributor_state': ['VA']})
+
+    def test_no_origin(self):
+        self.init_app()
+        self.engine.execute('select 1').fetchall()
+        with self.app.test_request_context('/nothing/'):
+            self.engine.execute('select 1').fetchall()
+        self.assertEqual(slow_queries.get_entries(self.client), [])
+
+    def test_threshold(self):
+        self.init_app(FEC_SLOW_QUERY_MS='60000')
+        self.execute('select 1')
+        self.assertEqual(slow_queries.get_entries(self.client), [])
+
+    def test_max_entries(self):
+        self.init_app(FEC_SLOW_QUERY_MAX_ENTRIES='2')
+        for value in range(3):
+            self.execute('select ?', value)
+        entries = slow_queries.get_entries(self.client)
+        self.assertEqual([entry['parameters'] for entry in entries], [['2'], ['1']])
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {'FEC_SLOW_QUERY_MS': ''}):
+            slow_queries.init_app(self.app)
+        self.execute('select 1')
+        self.assertEqual(slow_queries.get_entries(self.client), [])
+
+    def test_explain_sample(self):
+        self.app.config['SQLALCHEMY_FOLLOWERS'] = [self.engine]
+        conn = SimpleNamespace(info={'slow_query_start': 0})
+        cursor = SimpleNamespace(query=b"select * from ofec_sched_a_master where contbr_st = 'VA'")
+        environ = {'FEC_SLOW_QUERY_MS': '1', 'FEC_SLOW_QUERY_EXPLAIN_RATE': '1'}
+        with self.app.test_request_context('/things/'), mock.patch.dict(os.environ, environ), \
+                mock.patch.object(tasks.explain_slow_query, 'delay') as delay:
+            slow_queries.after_cursor_execute(
+                conn, cursor, 'select * from ofec_sched_a_master where contbr_st = %(st)s',
+                {'st': 'VA'}, None, False,
+            )
+            slow_queries.after_cursor_execute(
+                SimpleNamespace(info={'slow_query_start': 0}), cursor,
+                'update ofec_sched_a_master set contbr_st = %(st)s', {'st': 'VA'}, None, False,
+            )
+        entry_id, sql, duration = delay.call_args[0]
+        self.assertEqual((entry_id, sql), (1, cursor.query.decode()))
+        self.assertGreater(duration, 0)
+        self.assertEqual(delay.call_count, 1)
+
+    def test_explain_timeout(self):
+        engine = mock.MagicMock()
+        conn = engine.connect.return_value.__enter__.return_value
+        conn.execution_options.return_value.execute.return_value.scalar.return_value = '[{"Plan": {}}]'
+        plan = slow_queries.explain_query(engine, 'select 1', 2000)
+        self.assertEqual(plan, [{'Plan': {}}])
+        conn.execute.assert_called_once_with('set local statement_timeout = 10000')
+        conn.begin.return_value.rollback.assert_called_once_with()
+        self.assertEqual(slow_queries.get_explain_timeout(1), slow_queries.MIN_EXPLAIN_TIMEOUT)
+
+    def test_store_plan(self):
+        self.client.lpush(slow_queries.KEY, '{"id": 1, "statement": "select 1", "duration": 5}')
+        slow_queries.store_plan(1, [{'Plan': {'Node Type': 'Result'}}])
+        entries = slow_queries.get_entries(self.client)
+        self.assertEqual(entries[0]['plan'][0]['Plan']['Node Type'], 'Result')
+
+    def test_top_offenders(self):
+        entries = [
+            {'statement': 'a', 'duration': 100, 'endpoint': 'v1.scheduleaview', 'plan': None},
+            {'statement': 'b', 'duration': 150, 'task': 'export_query', 'plan': None},
+            {'statement': 'a', 'duration': 200, 'endpoint': 'v1.scheduleaview', 'plan': ['plan']},
+        ]
+        offenders = slow_queries.get_top_offenders(entries, limit=1)
+        self.assertEqual(len(offenders), 1)
+        self.assertEqual(offenders[0]['statement'], 'a')
+        self.assertEqual(offenders[0]['count'], 2)
+        self.assertEqual(offenders[0]['total'], 300)
+        self.assertEqual(offenders[0]['max'], 200)
+        self.assertEqual(offenders[0]['endpoints'], ['v1.scheduleaview'])
+        self.assertEqual(offenders[0]['plan'], ['plan'])
+
+    def test_explain_buffers(self):
+        statement = counts.explain(sa.text('select 1'), analyze=True, buffers=True, format='json')
+        self.assertEqual(
+            str(statement.compile(dialect=postgresql.dialect())),
+            'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) select 1',
+        )
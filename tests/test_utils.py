@@ -1,14 +1,23 @@
+import os
+import decimal
+import datetime
 import unittest
 
+import mock
+import redis
 from flask import request
 from webargs import flaskparser
 
 from tests import factories
 from tests.common import ApiBaseTest
+from tests.test_cache import FakeRedis
 
 from webservices import args
+from webservices import utils
+from webservices import exceptions
 from webservices import rest
 from webservices import sorting
+from webservices.env import env_flag
 from webservices.resources import candidate_aggregates
 from webservices.resources import elections
 from webservices.rest import db
@@ -16,6 +25,8 @@ from webservices.rest import db
 from sqlalchemy.dialects import postgresql
 
 from webservices.common import models
+from webservices.common import counts
+from webservices.common import catalog
 
 
 class TestSort(ApiBaseTest):
@@ -136,3 +147,127 @@ class TestArgs(unittest.TestCase):
         with rest.app.test_request_context('?dollars=$24.50'):
             parsed = flaskparser.parser.parse({'dollars': args.Currency()}, request)
             self.assertEqual(parsed, {'dollars': 24.50})
+
+
+class TestEnvFlag(unittest.TestCase):
+
+    def test_env_flag(self):
+        for value, expected in [('true', True), ('1', True), ('', False), ('false', False), ('0', False)]:
+            with mock.patch.dict(os.environ, {'FEC_TEST_FLAG': value}):
+                self.assertEqual(env_flag('FEC_TEST_FLAG'), expected)
+
+    def test_env_flag_unset(self):
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertFalse(env_flag('FEC_TEST_FLAG'))
+
+
+class TestIndexCatalog(ApiBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client = FakeRedis()
+        patcher = mock.patch('webservices.common.cache.get_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        catalog.generation._value = None
+        for watch in (catalog.indexes.watch, catalog.tables.watch):
+            watch.value = None
+            watch._retry = 0
+        catalog.invalidate()
+
+    def test_index_validator_values(self):
+        validator = args.IndexValidator(models.Candidate)
+        self.assertIn('district', validator.values)
+
+    def test_index_lookups_cached(self):
+        validator = args.IndexValidator(models.Candidate)
+        stats = catalog.indexes.stats()
+        first = validator.values
+        second = validator.values
+        self.assertEqual(first, second)
+        self.assertEqual(catalog.indexes.misses, stats['misses'] + 1)
+        self.assertEqual(catalog.indexes.hits, stats['hits'] + 1)
+
+    def test_invalidate(self):
+        validator = args.IndexValidator(models.Candidate)
+        validator.values
+        refreshes = catalog.indexes.refreshes
+        catalog.invalidate()
+        self.assertEqual(catalog.indexes.stats()['tables'], 0)
+        self.assertEqual(catalog.indexes.refreshes, refreshes + 1)
+
+    def test_shared_generation(self):
+        validator = args.IndexValidator(models.Candidate)
+        validator.values
+        # Bumped by a command in another process
+        self.client.incr(catalog.GENERATION_KEY)
+        catalog.generation._expires = 0
+        misses = catalog.indexes.misses
+        validator.values
+        self.assertEqual(catalog.indexes.misses, misses + 1)
+        validator.values
+        self.assertEqual(catalog.indexes.misses, misses + 1)
+
+    def test_generation_unavailable(self):
+        validator = args.IndexValidator(models.Candidate)
+        validator.values
+        catalog.generation._expires = 0
+        self.client.mget = mock.Mock(side_effect=redis.exceptions.ConnectionError)
+        misses = catalog.indexes.misses
+        validator.values
+        self.assertEqual(catalog.indexes.misses, misses)
+
+
+class TestCounts(ApiBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        [factories.CandidateFactory(district='01') for _ in range(3)]
+        factories.CandidateFactory(district='02')
+        db.session.flush()
+        self.query = models.Candidate.query.filter(models.Candidate.district == '01')
+
+    def test_estimate_count_exact_below_threshold(self):
+        strategy = counts.EstimateCount(threshold=5000)
+        self.assertEqual(strategy.count(self.query, db.session), 3)
+
+    def test_probe_count(self):
+        strategy = counts.ProbeCount(threshold=5000)
+        self.assertEqual(strategy.count(self.query, db.session), 3)
+
+    def test_probe_count_over_threshold(self):
+        strategy = counts.ProbeCount(threshold=1)
+        self.assertGreaterEqual(strategy.count(self.query, db.session), 2)
+
+    def test_cached_count(self):
+        strategy = counts.CachedCount(counts.ProbeCount())
+        kwargs = {'district': ['01'], 'page': 1}
+        self.assertEqual(strategy.count(self.query, db.session, kwargs), 3)
+        factories.CandidateFactory(district='01')
+        db.session.flush()
+        # Pagination arguments and list order do not change the cache key
+        self.assertEqual(strategy.count(self.query, db.session, {'district': ['01'], 'page': 2}), 3)
+        strategy.clear()
+        self.assertEqual(strategy.count(self.query, db.session, kwargs), 4)
+
+    def test_normalize_kwargs(self):
+        first = counts.normalize_kwargs({'state': ['VA', 'CA'], 'page': 1, 'last_index': 3})
+        second = counts.normalize_kwargs({'state': ['CA', 'VA'], 'page': 2})
+        self.assertEqual(first, second)
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trip(self):
+        values = [datetime.date(2016, 1, 1), decimal.Decimal('1.50'), None, 'C001', 3]
+        cursor = utils.encode_cursor(values, ['-receipt_date'])
+        self.assertEqual(utils.decode_cursor(cursor, ['-receipt_date']), values)
+
+    def test_sort_mismatch(self):
+        cursor = utils.encode_cursor([1], ['name'])
+        with self.assertRaises(exceptions.ApiError):
+            utils.decode_cursor(cursor, ['-name'])
+
+    def test_seek_paginator_rejects_cursor(self):
+        with self.assertRaises(exceptions.ApiError):
+            utils.fetch_seek_paginator(None, {'per_page': 20, 'cursor': 'abc'}, None)
@@ -1,13 +1,11 @@
 import functools
 
-import sqlalchemy as sa
-
 from webargs import fields, validate, ValidationError
 from marshmallow.compat import text_type
 
 from webservices import docs
 from webservices.config import SQL_CONFIG
-from webservices.common.models import db
+from webservices.common import catalog
 
 
 def _validate_natural(value):
@@ -59,6 +57,20 @@ paging = {
     'per_page': per_page,
 }
 
+# Keyset pagination; only for resources paginated by `utils.fetch_page` with a
+# model or index column to break ties
+cursor_paging = {
+    'seek': fields.Bool(
+        missing=False,
+        description='Paginate using cursors instead of page numbers. Faster for deep pages; '
+                    'pass `last_cursor` from the response as `cursor` to get the next page.',
+    ),
+    'cursor': fields.Str(
+        missing=None,
+        description='Cursor from `last_cursor` of the previous page; implies `seek`',
+    ),
+}
+
 
 class OptionValidator(object):
     """Ensure that value is one of acceptable options.
@@ -90,15 +102,15 @@ class IndexValidator(OptionValidator):
 
     @property
     def values(self):
-        inspector = sa.inspect(db.engine)
         column_map = {
             column.key: label
             for label, column in self.model.__mapper__.columns.items()
         }
+        indexed = catalog.indexes.get_indexed_columns(self.model.__tablename__, self.database_schema)
         return [
-            column_map[column['column_names'][0]]
-            for column in inspector.get_indexes(self.model.__tablename__, self.database_schema)
-            if not self._is_excluded(column_map.get(column['column_names'][0]))
+            column_map[column]
+            for column in indexed
+            if not self._is_excluded(column_map.get(column))
         ] + self.extra
 
     def _is_excluded(self, value):
@@ -0,0 +1,275 @@
+"""Redis-backed response cache and conditional requests for read-only
+resources.
+
+Most resources read from materialized views and aggregates that only change
+when `manage.py refresh_materialized` or `manage.py update_aggregates` run.
+Cached responses and validators (`ETag` and `Last-Modified`) are derived from
+a refresh generation that those commands bump, so a refresh invalidates every
+cached response at once; keys from older generations simply expire.
+
+Validators are added to the responses of every resource with
+`conditional_requests = True`, which includes all `ApiResource` subclasses, by
+`check_not_modified` and `add_validators`, which `webservices.rest` runs
+before and after each request. Caching response bodies is opt-in per resource
+by setting `cache_responses = True`, and is only active if the
+`FEC_RESPONSE_CACHE` environment variable is set.
+"""
+import time
+import datetime
+import hashlib
+import logging
+import functools
+
+import flask
+import redis
+import ujson
+
+from webservices.env import env_flag
+from webservices.tasks import redis_url
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'openfec:response'
+GENERATION_KEY = 'openfec:generation'
+
+# Seconds to trust the in-process copy of the generation
+GENERATION_CACHE_SECONDS = 10
+# Seconds a worker may hold the lock while rendering a response
+LOCK_TIMEOUT = 30
+# Seconds other workers wait for the lock holder before rendering themselves
+LOCK_WAIT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+DEFAULT_TTL = 24 * 60 * 60
+
+# Arguments that don't change the response
+IGNORE_FIELDS = {'api_key'}
+
+HIT = 'HIT'
+MISS = 'MISS'
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.StrictRedis.from_url(redis_url())
+    return _client
+
+
+def is_enabled():
+    return env_flag('FEC_RESPONSE_CACHE')
+
+
+class Generation(object):
+    """Refresh generation shared by all processes through Redis, along with
+    the time of the latest refresh.
+    """
+
+    def __init__(self, key=GENERATION_KEY, max_age=GENERATION_CACHE_SECONDS):
+        self.key = key
+        self.modified_key = '{0}:modified'.format(key)
+        self.max_age = max_age
+        self._value = None
+        self._modified = None
+        self._expires = 0
+
+    def get(self):
+        self._load()
+        return self._value
+
+    @property
+    def modified(self):
+        """Time of the latest refresh as a naive UTC datetime, or `None` if
+        the generation has never been bumped.
+        """
+        self._load()
+        return self._modified
+
+    def _load(self):
+        now = time.monotonic()
+        if self._value is None or now >= self._expires:
+            value, modified = get_client().mget(self.key, self.modified_key)
+            self._set(int(value or 0), int(modified) if modified else None)
+
+    def _set(self, value, modified):
+        self._value = value
+        self._modified = datetime.datetime.utcfromtimestamp(modified) if modified else None
+        self._expires = time.monotonic() + self.max_age
+
+    def bump(self):
+        modified = int(time.time())
+        pipe = get_client().pipeline()
+        pipe.incr(self.key)
+        pipe.set(self.modified_key, modified)
+        value, _ = pipe.execute()
+        self._set(value, modified)
+        return value
+
+
+generation = Generation()
+
+
+def bump_generation():
+    """Invalidate all cached responses. Errors are logged rather than raised
+    so that refreshes don't fail if Redis is unavailable.
+    """
+    try:
+        value = generation.bump()
+    except redis.exceptions.RedisError as error:
+        logger.warning('Could not bump response cache generation: {0}'.format(error))
+    else:
+        logger.info('Bumped response cache generation to {0}'.format(value))
+
+
+def make_digest(kwargs):
+    args = '&'.join(
+        '{0}={1!r}'.format(key, value)
+        for key, value in sorted(kwargs.items())
+        if key not in IGNORE_FIELDS
+    )
+    return hashlib.sha1(args.encode('utf-8')).hexdigest()
+
+
+def make_key(resource, kwargs):
+    return '{0}:{1}:{2}:{3}'.format(
+        KEY_PREFIX, generation.get(), type(resource).__name__, make_digest(kwargs),
+    )
+
+
+def make_etag(endpoint, kwargs):
+    raw = '{0}:{1}:{2}'.format(generation.get(), endpoint, make_digest(kwargs))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def supports_conditional_requests():
+    request = flask.request
+    if request.method not in ('GET', 'HEAD') or request.endpoint is None:
+        return False
+    view = flask.current_app.view_functions.get(request.endpoint)
+    return getattr(getattr(view, 'view_class', None), 'conditional_requests', False)
+
+
+def get_validators():
+    """Get the `ETag` and `Last-Modified` values for the current request,
+    derived from the refresh generation, endpoint, arguments and requested
+    format.
+    """
+    request = flask.request
+    kwargs = dict(
+        request.args.to_dict(flat=False),
+        _view_args=request.view_args,
+        _accept=request.headers.get('Accept'),
+    )
+    return make_etag(request.endpoint, kwargs), generation.modified
+
+
+def check_not_modified():
+    """Store the validators of the current request, and return a 304 if the
+    client's copy is current, without calling the resource.
+    """
+    if not supports_conditional_requests():
+        return None
+    try:
+        etag, modified = get_validators()
+    except redis.exceptions.RedisError as error:
+        logger.warning('Could not get response validators: {0}'.format(error))
+        return None
+    flask.g.validators = etag, modified
+    if is_not_modified(etag, modified):
+        return flask.Response(status=304)
+    return None
+
+
+def is_not_modified(etag, modified):
+    """Check the conditional request headers against the current validators.
+    `If-None-Match` takes precedence over `If-Modified-Since`.
+    """
+    request = flask.request
+    if request.if_none_match:
+        return etag in request.if_none_match
+    since = request.if_modified_since
+    if since and modified:
+        if since.tzinfo is not None:
+            since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return modified <= since
+    return False
+
+
+def add_validators(response):
+    """Add the validators stored by `check_not_modified` to `response`."""
+    validators = getattr(flask.g, 'validators', None)
+    if validators and response.status_code in (200, 304):
+        etag, modified = validators
+        response.set_etag(etag)
+        if modified:
+            response.last_modified = modified
+    return response
+
+
+def get_or_render(client, key, render, ttl):
+    """Get cached body at `key`, or render and store it. Only one worker
+    renders a given key at a time; others wait for its result.
+
+    :returns: Tuple of body and `HIT` or `MISS`
+    """
+    body = client.get(key)
+    if body is not None:
+        return body, HIT
+    lock = '{0}:lock'.format(key)
+    if client.set(lock, '1', nx=True, ex=LOCK_TIMEOUT):
+        try:
+            body = render()
+            store(client, key, body, ttl)
+        finally:
+            client.delete(lock)
+        return body, MISS
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        body = client.get(key)
+        if body is not None:
+            return body, HIT
+    return render(), MISS
+
+
+def store(client, key, body, ttl):
+    try:
+        client.setex(key, ttl, body)
+    except redis.exceptions.RedisError as error:
+        logger.warning('Could not cache response: {0}'.format(error))
+
+
+def make_response(body, status):
+    response = flask.make_response(body)
+    response.mimetype = 'application/json'
+    response.headers['X-Cache'] = status
+    return response
+
+
+def cached(func):
+    """Cache responses of a resource `get` method. Must be applied beneath the
+    `use_kwargs` and `marshal_with` decorators; cached responses are
+    serialized with the resource's `page_schema`.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not (self.cache_responses and is_enabled()):
+            return func(self, *args, **kwargs)
+
+        def render():
+            page = func(self, *args, **kwargs)
+            schema = self.page_schema
+            schema = schema() if isinstance(schema, type) else schema
+            return ujson.dumps(schema.dump(page).data) + '\n'
+
+        ttl = self.cache_ttl or DEFAULT_TTL
+        try:
+            body, status = get_or_render(get_client(), make_key(self, kwargs), render, ttl)
+        except redis.exceptions.RedisError as error:
+            logger.warning('Response cache unavailable: {0}'.format(error))
+            return func(self, *args, **kwargs)
+        return make_response(body, status)
+    return wrapper
@@ -0,0 +1,207 @@
+"""Process-wide cache of database catalog lookups.
+
+Reflecting indexes through `sa.inspect(db.engine)` or tables through
+`autoload_with` issues several queries against the Postgres system catalogs.
+The results only change when the schema is rebuilt, so we look them up once
+per process and keep them until the schema changes.
+
+Commands that rebuild the schema call `bump_generation`, which bumps a catalog
+generation shared through Redis. Each process compares the generation against
+the one its lookups were loaded under and drops them once it changes, so API
+workers pick up rebuilt tables without restarting.
+"""
+import time
+import logging
+import threading
+
+import redis
+import sqlalchemy as sa
+
+from webservices.common import cache
+from webservices.common.models import db
+
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'openfec:catalog:generation'
+
+# Tables without declarative models that resources join against
+PRELOAD_TABLES = (
+    'ofec_totals_combined_mv',
+    'ofec_fips_states',
+    'ofec_zips_districts',
+)
+
+
+class GenerationWatch(object):
+    """Track changes to a shared `cache.Generation`. If Redis is unavailable,
+    the generation is assumed unchanged and checked again after `interval`
+    seconds.
+    """
+
+    def __init__(self, generation, interval=cache.GENERATION_CACHE_SECONDS):
+        self.generation = generation
+        self.interval = interval
+        self.value = None
+        self._retry = 0
+
+    def changed(self):
+        """Whether the generation changed since the last call."""
+        if time.monotonic() < self._retry:
+            return False
+        try:
+            value = self.generation.get()
+        except redis.exceptions.RedisError as error:
+            logger.warning('Could not check catalog generation: {0}'.format(error))
+            self._retry = time.monotonic() + self.interval
+            return False
+        changed = self.value is not None and value != self.value
+        self.value = value
+        return changed
+
+
+class IndexCatalog(object):
+    """Cache of indexed column names by table.
+
+    Lookups are keyed on `(tablename, schema)`; each value is the list of
+    first columns of the indexes defined on that table. Lookups are dropped
+    when `watch` reports a new generation, or when `invalidate` is called.
+    """
+
+    def __init__(self, watch=None):
+        self.watch = watch
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def get_indexed_columns(self, tablename, schema=None):
+        if self.watch is not None and self.watch.changed():
+            self.invalidate()
+        key = (tablename, schema)
+        try:
+            columns = self._indexes[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return columns
+        with self._lock:
+            if key not in self._indexes:
+                self.misses += 1
+                self._indexes[key] = self._reflect(tablename, schema)
+            return self._indexes[key]
+
+    def _reflect(self, tablename, schema=None):
+        inspector = sa.inspect(db.engine)
+        return [
+            index['column_names'][0]
+            for index in inspector.get_indexes(tablename, schema)
+        ]
+
+    def invalidate(self):
+        with self._lock:
+            self._indexes.clear()
+            self.refreshes += 1
+
+    def stats(self):
+        return {
+            'tables': len(self._indexes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
+
+
+class TableRegistry(object):
+    """Cache of reflected tables by name.
+
+    Tables are reflected into a private `MetaData` the first time they are
+    requested, so that resources can join against tables that are not mapped
+    to models without reflecting them on every request. Tables are dropped
+    when `watch` reports a new generation, or when `invalidate` is called.
+    """
+
+    def __init__(self, watch=None):
+        self.watch = watch
+        self._metadata = sa.MetaData()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def get(self, name, schema=None):
+        """Get reflected table `name`.
+
+        :raises: `sa.exc.NoSuchTableError` if the table does not exist
+        """
+        if self.watch is not None and self.watch.changed():
+            self.invalidate()
+        key = '{0}.{1}'.format(schema, name) if schema else name
+        table = self._metadata.tables.get(key)
+        if table is not None:
+            self.hits += 1
+            return table
+        with self._lock:
+            table = self._metadata.tables.get(key)
+            if table is None:
+                self.misses += 1
+                table = sa.Table(name, self._metadata, schema=schema, autoload_with=db.engine)
+            return table
+
+    def invalidate(self):
+        with self._lock:
+            self._metadata = sa.MetaData()
+            self.refreshes += 1
+
+    def warm(self, names):
+        """Reflect each of `names` ahead of the first request; missing tables
+        are logged and skipped.
+        """
+        for name in names:
+            try:
+                self.get(name)
+            except sa.exc.NoSuchTableError:
+                logger.warning('Could not preload missing table {0}'.format(name))
+
+    def stats(self):
+        return {
+            'tables': len(self._metadata.tables),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
+
+
+generation = cache.Generation(key=GENERATION_KEY)
+indexes = IndexCatalog(watch=GenerationWatch(generation))
+tables = TableRegistry(watch=GenerationWatch(generation))
+
+
+def invalidate():
+    """Clear all cached catalog lookups for this process.
+    """
+    indexes.invalidate()
+    tables.invalidate()
+
+
+def bump_generation():
+    """Clear cached catalog lookups in this process, and in all other
+    processes as they next look up the catalog. Errors are logged rather than
+    raised so that schema updates don't fail if Redis is unavailable.
+    """
+    invalidate()
+    try:
+        value = generation.bump()
+    except redis.exceptions.RedisError as error:
+        logger.warning('Could not bump catalog generation: {0}'.format(error))
+    else:
+        logger.info('Bumped catalog generation to {0}'.format(value))
+
+
+def warm():
+    """Preload catalog lookups used by request handlers. Must be called from
+    within an application context.
+    """
+    tables.warm(PRELOAD_TABLES)
@@ -2,23 +2,66 @@
 
 Count logic borrowed from https://wiki.postgresql.org/wiki/Count_estimate
 ANALYZE borrowed from https://bitbucket.org/zzzeek/sqlalchemy/wiki/UsageRecipes/Explain
+
+Resources choose how to count their results by setting `count_strategy` to
+one of the strategies below:
+
+* `EstimateCount`: planner estimate, exact (capped) count below a threshold
+* `ProbeCount`: capped exact count, planner estimate above the threshold
+* `WindowCount`: `count(*) over ()` fused into the page query
+* `CachedCount`: cache the result of another strategy by filter set
 """
 
 import re
+import json
+import time
+import threading
+import collections
 
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.expression import Executable, ClauseElement, _literal_as_text
 
 
 count_pattern = re.compile(r'rows=(\d+)')
 
+# Arguments that select a page of results rather than filtering them
+PAGINATION_FIELDS = {
+    'page',
+    'per_page',
+    'sort',
+    'sort_hide_null',
+    'sort_null_only',
+    'sort_reverse_nulls',
+    'last_index',
+    'seek',
+    'cursor',
+}
+
 
 def count_estimate(query, session, threshold=None):
-    rows = session.execute(explain(query)).fetchall()
-    count = extract_analyze_count(rows)
-    if threshold is not None and count < threshold:
-        return query.count()
-    return count
+    return EstimateCount(threshold=threshold).count(query, session)
+
+
+def estimate_count(query, session):
+    """Get the planner's row estimate for `query` using `EXPLAIN (FORMAT JSON)`.
+    """
+    plan = session.execute(explain(query, format='json')).scalar()
+    return extract_plan_count(plan)
+
+
+def capped_count(query, session, limit):
+    """Count rows matching `query`, scanning no more than `limit` rows.
+    """
+    subquery = query.order_by(None).limit(limit).subquery()
+    return session.query(sa.func.count()).select_from(subquery).scalar()
+
+
+def extract_plan_count(plan):
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
 
 
 def extract_analyze_count(rows):
@@ -28,18 +71,148 @@ def extract_analyze_count(rows):
             return int(match.groups()[0])
 
 
+class CountStrategy(object):
+    """Base class for count strategies.
+
+    :param bool window: Whether the count is computed by the page query itself
+    """
+    window = False
+
+    def count(self, query, session, kwargs=None):
+        raise NotImplementedError
+
+
+class EstimateCount(CountStrategy):
+    """Use the planner estimate; if the estimate is below `threshold`, count
+    exactly instead. Large result sets cost a single `EXPLAIN`.
+    """
+
+    def __init__(self, threshold=5000):
+        self.threshold = threshold
+
+    def count(self, query, session, kwargs=None):
+        estimate = estimate_count(query, session)
+        if self.threshold is None or estimate >= self.threshold:
+            return estimate
+        count = capped_count(query, session, self.threshold + 1)
+        if count > self.threshold:
+            # The planner underestimated; fall back to a full count
+            return query.count()
+        return count
+
+
+class ProbeCount(CountStrategy):
+    """Count up to `threshold + 1` rows; if the cap is reached, use the larger
+    of the cap and the planner estimate. Small result sets cost a single
+    capped `count(*)`.
+    """
+
+    def __init__(self, threshold=5000):
+        self.threshold = threshold
+
+    def count(self, query, session, kwargs=None):
+        count = capped_count(query, session, self.threshold + 1)
+        if count <= self.threshold:
+            return count
+        return max(count, estimate_count(query, session))
+
+
+class WindowCount(CountStrategy):
+    """Compute the total with `count(*) over ()` in the page query. Only
+    supported by offset pagination; `count` uses `fallback` elsewhere.
+    """
+    window = True
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or ProbeCount()
+
+    def count(self, query, session, kwargs=None):
+        return self.fallback.count(query, session, kwargs)
+
+
+class CachedCount(CountStrategy):
+    """Cache counts computed by `strategy`, keyed on the query and the
+    normalized filter arguments; pagination and sort arguments are ignored.
+
+    :param CountStrategy strategy: Strategy used on cache misses
+    :param int ttl: Seconds before a cached count expires
+    :param int maxsize: Maximum number of cached counts
+    """
+
+    def __init__(self, strategy=None, ttl=60 * 60, maxsize=1024):
+        self.strategy = strategy or EstimateCount()
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, query, session, kwargs=None):
+        statement = str(query.statement.compile(dialect=postgresql.dialect()))
+        key = (statement, normalize_kwargs(kwargs or {}))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end(key)
+                return cached[0]
+        count = self.strategy.count(query, session, kwargs)
+        with self._lock:
+            self._cache[key] = (count, now + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def normalize_kwargs(kwargs):
+    """Build a hashable representation of the filters in `kwargs`, ignoring
+    pagination and sort arguments and the order of list values.
+    """
+    return tuple(
+        (key, normalize_value(value))
+        for key, value in sorted(kwargs.items())
+        if key not in PAGINATION_FIELDS and not key.startswith('last_')
+    )
+
+
+def normalize_value(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(str(each) for each in value))
+    return str(value)
+
+
 class explain(Executable, ClauseElement):
-    def __init__(self, stmt, analyze=False):
+    def __init__(self, stmt, analyze=False, buffers=False, format=None):
         self.statement = _literal_as_text(stmt)
         self.analyze = analyze
+        self.buffers = buffers
+        self.format = format
         # helps with INSERT statements
         self.inline = getattr(stmt, 'inline', None)
 
 
-@compiles(explain, 'postgresql')
-def pg_explain(element, compiler, **kw):
+def explain_prefix(analyze=False, buffers=False, format=None):
+    """Build the `EXPLAIN` prefix for a statement with the given options.
+    `BUFFERS` is only valid along with `ANALYZE`.
+    """
+    options = []
+    if analyze:
+        options.append('ANALYZE')
+        if buffers:
+            options.append('BUFFERS')
+    if format:
+        options.append('FORMAT {0}'.format(format.upper()))
     text = 'EXPLAIN '
-    if element.analyze:
-        text += 'ANALYZE '
-    text += compiler.process(element.statement, **kw)
+    if options:
+        text += '({0}) '.format(', '.join(options))
     return text
+
+
+@compiles(explain, 'postgresql')
+def pg_explain(element, compiler, **kw):
+    text = explain_prefix(analyze=element.analyze, buffers=element.buffers, format=element.format)
+    return text + compiler.process(element.statement, **kw)
@@ -0,0 +1,227 @@
+"""Per-request timing of the phases of API requests.
+
+Resources, pagination and serialization wrap their work in `phase` blocks:
+argument parsing (`parse`), query construction (`build_query`), counting
+(`count`), the page query (`page_query`), building ORM objects from its rows
+(`hydrate`), dumping through marshmallow (`dump`) and JSON encoding
+(`serialize`). Time spent executing SQL within a phase is measured through
+SQLAlchemy cursor events, which is how the page fetch is split into the query
+and hydration.
+
+Phase timings are returned in a `Server-Timing` header and aggregated into
+histograms by endpoint and phase, served from `/v1/_internal/metrics`.
+Histograms are kept per process, so each worker reports its own requests.
+
+Profiling is only active if the `FEC_PROFILER` environment variable is set;
+otherwise no hooks are installed and `phase` returns a shared no-op.
+"""
+import os
+import time
+import bisect
+import datetime
+import threading
+
+import flask
+import sqlalchemy as sa
+
+from webservices.env import env_flag
+
+
+# Upper bounds of histogram buckets in milliseconds
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+TOTAL = 'total'
+
+
+def is_enabled():
+    return env_flag('FEC_PROFILER')
+
+
+class Profile(object):
+    """Phase timings of a single request, in seconds."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.sql = 0.0
+
+    def record(self, name, duration):
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def finish(self):
+        self.record(TOTAL, time.perf_counter() - self.start)
+        return self.phases
+
+
+def get_profile():
+    if not flask.has_request_context():
+        return None
+    return getattr(flask.g, '_profile', None)
+
+
+class NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Phase(object):
+    """Record the time spent in a block under `name`. If `sql` is given,
+    time spent executing SQL within the block is recorded under `sql` instead.
+    """
+
+    def __init__(self, profile, name, sql=None):
+        self.profile = profile
+        self.name = name
+        self.sql = sql
+
+    def __enter__(self):
+        self.sql_start = self.profile.sql
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        if self.sql is not None:
+            sql = self.profile.sql - self.sql_start
+            self.profile.record(self.sql, sql)
+            duration -= sql
+        self.profile.record(self.name, duration)
+        return False
+
+
+def phase(name, sql=None):
+    profile = get_profile()
+    if profile is None:
+        return NULL_PHASE
+    return Phase(profile, name, sql=sql)
+
+
+class Histogram(object):
+    """Distribution of durations in milliseconds over `BUCKETS`."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate quantile `q` as the upper bound of the bucket it falls
+        in, or the maximum if it falls past the last bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf', ), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': buckets,
+        }
+
+
+class Metrics(object):
+    """Histograms of phase durations by endpoint and phase."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, endpoint, phases):
+        with self._lock:
+            histograms = self._histograms.setdefault(endpoint, {})
+            for name, duration in phases.items():
+                if name not in histograms:
+                    histograms[name] = Histogram()
+                histograms[name].observe(duration * 1000)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'since': self.since.isoformat(),
+                'pid': os.getpid(),
+                'endpoints': {
+                    endpoint: {name: histogram.summary() for name, histogram in histograms.items()}
+                    for endpoint, histograms in self._histograms.items()
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.since = datetime.datetime.utcnow()
+
+
+metrics = Metrics()
+
+
+def format_server_timing(phases):
+    return ', '.join(
+        '{0};dur={1:.2f}'.format(name, duration * 1000)
+        for name, duration in sorted(phases.items())
+    )
+
+
+def start_profile():
+    flask.g._profile = Profile()
+
+
+def finish_profile(response):
+    profile = get_profile()
+    if profile is None:
+        return response
+    phases = profile.finish()
+    response.headers['Server-Timing'] = format_server_timing(phases)
+    metrics.record(flask.request.endpoint or 'unknown', phases)
+    return response
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['profiler_start'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('profiler_start', None)
+    profile = get_profile()
+    if profile is not None and start is not None:
+        profile.sql += time.perf_counter() - start
+
+
+def init_app(app):
+    """Install profiling hooks on `app` if profiling is enabled."""
+    if not is_enabled():
+        return
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    sa.event.listen(sa.engine.Engine, 'before_cursor_execute', before_cursor_execute)
+    sa.event.listen(sa.engine.Engine, 'after_cursor_execute', after_cursor_execute)
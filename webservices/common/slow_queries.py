@@ -0,0 +1,243 @@
+"""Record slow SQL statements and sample their query plans.
+
+Statements that take longer than `FEC_SLOW_QUERY_MS` milliseconds are recorded
+along with their literal SQL, bound parameters, duration and origin: the
+endpoint and query string arguments of the request, or the name of the Celery
+task, that issued them. Statements issued outside of requests and tasks,
+such as by `manage.py` commands, are not recorded. Entries are kept in a Redis
+list shared by all workers and capped at `FEC_SLOW_QUERY_MAX_ENTRIES`, so
+older entries fall off as new ones are recorded.
+
+A fraction `FEC_SLOW_QUERY_EXPLAIN_RATE` of slow `SELECT` statements are
+re-run with `EXPLAIN (ANALYZE, BUFFERS)` on one of `SQLALCHEMY_FOLLOWERS` by
+the `explain_slow_query` task, and the plans are stored alongside the
+entries. `manage.py dump_slow_queries` reports the statements with the most
+total time.
+
+Recording is only active if `FEC_SLOW_QUERY_MS` is set.
+"""
+import os
+import time
+import random
+import logging
+import datetime
+import collections
+
+import flask
+import celery
+import redis
+import ujson
+import sqlalchemy as sa
+
+from webservices.common import cache
+from webservices.common import counts
+
+
+logger = logging.getLogger(__name__)
+
+KEY = 'openfec:slow_queries'
+ID_KEY = 'openfec:slow_queries:id'
+PLAN_KEY = 'openfec:slow_queries:plan:{0}'
+
+DEFAULT_MAX_ENTRIES = 1000
+# Seconds to keep sampled plans
+PLAN_TTL = 7 * 24 * 60 * 60
+DEFAULT_LIMIT = 20
+
+EXPLAINABLE = ('SELECT', 'WITH')
+
+# Limit sampled explains to a multiple of the recorded duration, in case the
+# follower is slower than the primary; the limit is at least
+# `MIN_EXPLAIN_TIMEOUT` milliseconds
+EXPLAIN_TIMEOUT_FACTOR = 5
+MIN_EXPLAIN_TIMEOUT = 1000
+
+
+def get_threshold():
+    """Get the slow query threshold in milliseconds, or 0 if disabled."""
+    return float(os.getenv('FEC_SLOW_QUERY_MS') or 0)
+
+
+def is_enabled():
+    return get_threshold() > 0
+
+
+def get_explain_rate():
+    return float(os.getenv('FEC_SLOW_QUERY_EXPLAIN_RATE') or 0)
+
+
+def get_max_entries():
+    return int(os.getenv('FEC_SLOW_QUERY_MAX_ENTRIES') or DEFAULT_MAX_ENTRIES)
+
+
+def get_origin():
+    """Describe the request or task issuing the current statement, or return
+    `None` if it wasn't issued by an API request or Celery task.
+    """
+    if flask.has_request_context() and flask.request.endpoint:
+        args = flask.request.args.to_dict(flat=False)
+        return {
+            'endpoint': flask.request.endpoint,
+            'args': {
+                key: value for key, value in args.items()
+                if key not in cache.IGNORE_FIELDS
+            },
+        }
+    if celery.current_task:
+        return {'task': celery.current_task.name}
+    return None
+
+
+def get_literal_sql(cursor, statement):
+    """Get the statement as sent to the database, with parameters bound by
+    the driver, or `None` if the driver does not expose it.
+    """
+    query = getattr(cursor, 'query', None)
+    if isinstance(query, bytes):
+        return query.decode('utf-8', errors='replace')
+    return query
+
+
+def format_parameters(parameters):
+    if isinstance(parameters, dict):
+        return {key: str(value) for key, value in parameters.items()}
+    return [str(value) for value in parameters or ()]
+
+
+def is_explainable(statement):
+    return statement.lstrip().upper().startswith(EXPLAINABLE)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['slow_query_start'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('slow_query_start', None)
+    if start is None or executemany:
+        return
+    duration = (time.perf_counter() - start) * 1000
+    if duration < get_threshold() or statement.lstrip().upper().startswith('EXPLAIN'):
+        return
+    origin = get_origin()
+    if origin is None:
+        return
+    entry = dict(
+        origin,
+        time=datetime.datetime.utcnow().isoformat(),
+        duration=duration,
+        statement=statement,
+        sql=get_literal_sql(cursor, statement),
+        parameters=format_parameters(parameters),
+    )
+    entry_id = record(entry)
+    if entry_id is not None and entry['sql'] and should_explain(statement):
+        # Imported here to avoid importing the Celery app with the models
+        from webservices.tasks import slow_queries as tasks
+        try:
+            tasks.explain_slow_query.delay(entry_id, entry['sql'], duration)
+        except Exception as error:
+            logger.warning('Could not queue slow query {0} to explain: {1}'.format(entry_id, error))
+
+
+def should_explain(statement):
+    if not is_explainable(statement):
+        return False
+    if not (flask.has_app_context() and flask.current_app.config.get('SQLALCHEMY_FOLLOWERS')):
+        return False
+    return random.random() < get_explain_rate()
+
+
+def record(entry):
+    """Push `entry` onto the list of slow queries. Errors are logged rather
+    than raised so that requests don't fail if Redis is unavailable.
+
+    :returns: ID of the entry, or `None` if it could not be recorded
+    """
+    client = cache.get_client()
+    try:
+        entry['id'] = client.incr(ID_KEY)
+        pipe = client.pipeline()
+        pipe.lpush(KEY, ujson.dumps(entry))
+        pipe.ltrim(KEY, 0, get_max_entries() - 1)
+        pipe.execute()
+    except redis.exceptions.RedisError as error:
+        logger.warning('Could not record slow query: {0}'.format(error))
+        return None
+    return entry['id']
+
+
+def get_explain_timeout(duration):
+    """Get the statement timeout in milliseconds for explaining a statement
+    that took `duration` milliseconds.
+    """
+    return max(int(duration * EXPLAIN_TIMEOUT_FACTOR), MIN_EXPLAIN_TIMEOUT)
+
+
+def explain_query(engine, sql, duration):
+    """Run `sql` with `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` on `engine`,
+    cancelling it after `get_explain_timeout(duration)` milliseconds. The
+    transaction is rolled back, since `ANALYZE` executes the statement.
+    """
+    text = counts.explain_prefix(analyze=True, buffers=True, format='json') + sql
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            conn.execute('set local statement_timeout = {0:d}'.format(get_explain_timeout(duration)))
+            # Run the literal SQL as is, without interpolating parameters
+            plan = conn.execution_options(no_parameters=True).execute(text).scalar()
+        finally:
+            trans.rollback()
+    return ujson.loads(plan) if isinstance(plan, str) else plan
+
+
+def store_plan(entry_id, plan):
+    cache.get_client().setex(PLAN_KEY.format(entry_id), PLAN_TTL, ujson.dumps(plan))
+
+
+def get_entries(client):
+    """Get recorded slow queries, newest first, with their sampled plans."""
+    entries = [ujson.loads(each) for each in client.lrange(KEY, 0, -1)]
+    if entries:
+        plans = client.mget(*[PLAN_KEY.format(entry['id']) for entry in entries])
+        for entry, plan in zip(entries, plans):
+            entry['plan'] = ujson.loads(plan) if plan is not None else None
+    return entries
+
+
+def get_top_offenders(entries, limit=DEFAULT_LIMIT):
+    """Group `entries` by statement and return the `limit` groups with the
+    most total time. Each group includes its slowest entry and, if any were
+    sampled, the plan of its slowest explained entry.
+    """
+    groups = collections.OrderedDict()
+    for entry in entries:
+        groups.setdefault(entry['statement'], []).append(entry)
+    offenders = []
+    for statement, group in groups.items():
+        durations = [entry['duration'] for entry in group]
+        explained = [entry for entry in group if entry.get('plan') is not None]
+        offenders.append({
+            'statement': statement,
+            'count': len(group),
+            'total': sum(durations),
+            'mean': sum(durations) / len(durations),
+            'max': max(durations),
+            'endpoints': sorted(set(entry.get('endpoint') or entry.get('task') or 'unknown' for entry in group)),
+            'slowest': max(group, key=lambda entry: entry['duration']),
+            'plan': max(explained, key=lambda entry: entry['duration'])['plan'] if explained else None,
+        })
+    offenders.sort(key=lambda offender: offender['total'], reverse=True)
+    return offenders[:limit]
+
+
+def clear():
+    cache.get_client().delete(KEY)
+
+
+def init_app(app):
+    """Install slow query listeners if recording is enabled."""
+    if not is_enabled():
+        return
+    sa.event.listen(sa.engine.Engine, 'before_cursor_execute', before_cursor_execute)
+    sa.event.listen(sa.engine.Engine, 'after_cursor_execute', after_cursor_execute)
@@ -0,0 +1,135 @@
+"""Streaming exports of resource results as newline-delimited JSON or CSV.
+
+Clients that need every row matching a set of filters can send an `Accept`
+header of `application/x-ndjson` or `text/csv` instead of paging through
+results or requesting a download. Rows are read through a server-side cursor
+and written as they are fetched, so memory use doesn't grow with the size of
+the result. Columns match those of the CSV downloads, and each response is
+capped at `FEC_STREAM_MAX_ROWS` rows. Since headers are sent before the rows
+are read, a response cut off at the cap ends with a marker instead: a
+`{"truncated": true, "row_cap": ...}` line in NDJSON, or a `# truncated ...`
+row in CSV.
+"""
+import io
+import os
+import csv
+import datetime
+import functools
+
+import flask
+import ujson
+
+from webservices import utils
+from webservices import exceptions
+
+
+NDJSON = 'application/x-ndjson'
+CSV = 'text/csv'
+FORMATS = (NDJSON, CSV)
+
+DEFAULT_MAX_ROWS = 100000
+# Rows fetched from the server-side cursor and written per chunk
+BATCH_SIZE = 1000
+
+
+def get_max_rows():
+    return int(os.getenv('FEC_STREAM_MAX_ROWS', DEFAULT_MAX_ROWS))
+
+
+def requested_format():
+    """Get the streaming format preferred by the `Accept` header, or `None`
+    if the client accepts JSON.
+    """
+    best = flask.request.accept_mimetypes.best_match(('application/json', ) + FORMATS)
+    return best if best in FORMATS else None
+
+
+def encode_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def cap_rows(rows, max_rows, state):
+    """Yield up to `max_rows` of `rows`, setting `state['truncated']` if
+    there are more.
+    """
+    for index, row in enumerate(rows):
+        if index >= max_rows:
+            state['truncated'] = True
+            return
+        yield row
+
+
+def render_ndjson(rows, columns, max_rows):
+    lines = []
+    state = {}
+    for row in cap_rows(rows, max_rows, state):
+        record = {column: encode_value(value) for column, value in zip(columns, row)}
+        lines.append(ujson.dumps(record))
+        if len(lines) >= BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if state.get('truncated'):
+        lines.append(ujson.dumps({'truncated': True, 'row_cap': max_rows}))
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def render_csv(rows, columns, max_rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    state = {}
+    for index, row in enumerate(cap_rows(rows, max_rows, state), 1):
+        writer.writerow(row)
+        if index % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if state.get('truncated'):
+        writer.writerow(['# truncated at row cap of {0}'.format(max_rows)])
+    yield buffer.getvalue()
+
+
+RENDERERS = {
+    NDJSON: render_ndjson,
+    CSV: render_csv,
+}
+
+
+def make_response(query, mimetype, max_rows):
+    """Stream up to `max_rows` rows of `query` in format `mimetype`. The query
+    is executed with a server-side cursor when the response body is iterated.
+    One extra row is fetched to tell whether the results were truncated.
+    """
+    query = query.limit(max_rows + 1).yield_per(BATCH_SIZE)
+    columns = [description['name'] for description in query.column_descriptions]
+    body = RENDERERS[mimetype](query, columns, max_rows)
+    response = flask.Response(flask.stream_with_context(body), mimetype=mimetype)
+    response.headers['X-Row-Cap'] = str(max_rows)
+    return response
+
+
+def streamable(func):
+    """Stream all results of a resource `get` method if the client requests a
+    streaming format; otherwise, call `func`. Must be applied beneath the
+    `use_kwargs` and `marshal_with` decorators and above `cache.cached`.
+
+    The streamed query is built by the resource's `build_stream_query` and
+    labeled with the resource's `schema`.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        mimetype = requested_format()
+        if mimetype is None:
+            return func(self, *args, **kwargs)
+        if self.schema is None:
+            raise exceptions.ApiError(
+                'Streaming is not supported on this endpoint',
+                status_code=406,
+            )
+        query = self.build_stream_query(*args, **kwargs)
+        query = utils.query_with_labels(query, self.schema)
+        return make_response(query, mimetype, self.stream_max_rows or get_max_rows())
+    return wrapper
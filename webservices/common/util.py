@@ -3,6 +3,8 @@ import os
 import flask
 import ujson
 
+from webservices.common import profiler
+
 
 dirname = os.path.dirname
 MAIN_DIRECTORY = dirname(dirname(dirname(__file__)))
@@ -28,7 +30,8 @@ def output_json(data, code, headers=None):
 
     # always end the json dumps with a new line
     # see https://github.com/mitsuhiko/flask/pull/1262
-    dumped = ujson.dumps(data, **settings) + '\n'
+    with profiler.phase('serialize'):
+        dumped = ujson.dumps(data, **settings) + '\n'
 
     resp = flask.make_response(dumped, code)
     resp.headers.extend(headers or {})
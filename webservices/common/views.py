@@ -5,8 +5,11 @@ from webservices import utils
 from webservices import filters
 from webservices import sorting
 from webservices import exceptions
+from webservices.common import cache
 from webservices.common import counts
 from webservices.common import models
+from webservices.common import profiler
+from webservices.common import streaming
 from webservices.utils import use_kwargs
 
 
@@ -26,18 +29,49 @@ class ApiResource(utils.Resource):
     join_columns = {}
     aliases = {}
     cap = 100
+    count_strategy = counts.EstimateCount(threshold=5000)
+    conditional_requests = True
+    cache_responses = False
+    cache_ttl = None
+    stream_max_rows = None
 
     @use_kwargs(Ref('args'))
     @marshal_with(Ref('page_schema'))
+    @streaming.streamable
+    @cache.cached
     def get(self, *args, **kwargs):
-        query = self.build_query(*args, **kwargs)
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
+        with profiler.phase('build_query'):
+            query = self.build_query(*args, **kwargs)
+        count = self.count(query, kwargs)
         return utils.fetch_page(
             query, kwargs,
             count=count, model=self.model, join_columns=self.join_columns, aliases=self.aliases,
-            index_column=self.index_column, cap=self.cap,
+            index_column=self.index_column, cap=self.cap, window=self.count_strategy.window,
         )
 
+    def count(self, query, kwargs):
+        """Count results using `count_strategy`. Returns `None` if the count
+        is computed by the page query.
+        """
+        if self.count_strategy.window:
+            return None
+        with profiler.phase('count'):
+            return self.count_strategy.count(query, models.db.session, kwargs)
+
+    def build_stream_query(self, *args, **kwargs):
+        """Build the query for a streaming export, sorted like the paginated
+        results. Eager loads are skipped since only columns are selected.
+        """
+        query = self.build_query(*args, _apply_options=False, **kwargs)
+        if kwargs.get('sort'):
+            sort = sorting.multi_sort if isinstance(kwargs['sort'], list) else sorting.sort
+            query, _ = sort(
+                query, kwargs['sort'], model=self.model, aliases=self.aliases,
+                join_columns=self.join_columns, hide_null=kwargs.get('sort_hide_null'),
+                index_column=self.index_column,
+            )
+        return query
+
     def build_query(self, *args, _apply_options=True, **kwargs):
         query = self.model.query
         query = filters.filter_match(query, kwargs, self.filter_match_fields)
@@ -59,7 +93,10 @@ class ItemizedResource(ApiResource):
 
     year_column = None
     index_column = None
+    count_strategy = counts.CachedCount(counts.EstimateCount(threshold=5000))
 
+    @streaming.streamable
+    @cache.cached
     def get(self, **kwargs):
         """Get itemized resources. If multiple values are passed for `committee_id`,
         create a subquery for each and combine with `UNION ALL`. This is necessary
@@ -73,12 +110,24 @@ class ItemizedResource(ApiResource):
                 status_code=422,
             )
         if len(committee_ids) > 1:
-            query, count = self.join_committee_queries(kwargs)
+            # Per-committee subqueries are built along with their counts
+            with profiler.phase('count'):
+                query, count = self.join_committee_queries(kwargs)
             return utils.fetch_seek_page(query, kwargs, self.index_column, count=count)
-        query = self.build_query(**kwargs)
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
+        with profiler.phase('build_query'):
+            query = self.build_query(**kwargs)
+        with profiler.phase('count'):
+            count = self.count_strategy.count(query, models.db.session, kwargs)
         return utils.fetch_seek_page(query, kwargs, self.index_column, count=count, cap=self.cap)
 
+    def build_stream_query(self, **kwargs):
+        query = self.build_query(_apply_options=False, **kwargs)
+        if kwargs.get('sort'):
+            query, _ = sorting.sort(
+                query, kwargs['sort'], model=self.model, hide_null=kwargs.get('sort_hide_null'),
+            )
+        return query.order_by(self.index_column)
+
     def join_committee_queries(self, kwargs):
         """Build and compose per-committee subqueries using `UNION ALL`.
         """
@@ -99,9 +148,10 @@ class ItemizedResource(ApiResource):
     def build_committee_query(self, kwargs, committee_id):
         """Build a subquery by committee.
         """
-        query = self.build_query(_apply_options=False, **utils.extend(kwargs, {'committee_id': [committee_id]}))
+        committee_kwargs = utils.extend(kwargs, {'committee_id': [committee_id]})
+        query = self.build_query(_apply_options=False, **committee_kwargs)
         sort, hide_null = kwargs['sort'], kwargs['sort_hide_null']
         query, _ = sorting.sort(query, sort, model=self.model, hide_null=hide_null)
         page_query = utils.fetch_seek_page(query, kwargs, self.index_column, count=-1, eager=False).results
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
+        count = self.count_strategy.count(query, models.db.session, committee_kwargs)
         return page_query, count
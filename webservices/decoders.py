@@ -1,6 +1,10 @@
+import os
 import json
+import pickle
+import functools
+from collections import namedtuple
 
-
+from webservices.common.util import get_full_path
 
 
 election_types = {
@@ -30,37 +34,65 @@ form_types = {
     'F6': '48-hour notice of contribution/loans received',
 }
 
-def dumper(f3p_col_a, f3p_col_b, f3p_description, dumped):
-    for row in dumped:
-        description, col_a, col_b = row
-        f3p_col_a.append(col_a)
-        f3p_col_b.append(col_b)
-        f3p_description.append(description)
+EFILE_FORMS = ('f3', 'f3p', 'f3x')
+EFILE_GUIDES_PICKLE = 'efile_guides.pickle'
+
+# Column A and column B names and the description of each summary line of a
+# form, from the efile guides built by `manage.py load_efile_sheets`
+EfileGuide = namedtuple('EfileGuide', 'col_a col_b description')
+
+
+def get_guide_path(form):
+    return get_full_path('data', 'efile_guide_{0}.json'.format(form))
+
+
+def get_pickle_path():
+    return get_full_path('data', EFILE_GUIDES_PICKLE)
 
 
-fp = open("data/" + "efile_guide_f3p.json", 'r')
-dumped = json.load(fp)
-f3p_col_a = []
-f3p_col_b = []
-f3p_description = []
-dumper(f3p_col_a, f3p_col_b, f3p_description, dumped)
+def parse_efile_guide(form):
+    with open(get_guide_path(form)) as fp:
+        rows = json.load(fp)
+    descriptions, col_a, col_b = zip(*rows) if rows else ((), (), ())
+    return EfileGuide(col_a, col_b, descriptions)
 
-f3_col_a = []
-f3_col_b = []
-f3_description = []
-fp = open("data/" + "efile_guide_f3.json", 'r')
-dumped = json.load(fp)
-dumper(f3_col_a, f3_col_b, f3_description, dumped)
 
-fp = open("data/" + "efile_guide_f3x.json", 'r')
-dumped = json.load(fp)
-f3x_col_a = []
-f3x_col_b = []
-f3x_description = []
-dumper(f3x_col_a, f3x_col_b, f3x_description, dumped)
+def load_pickled_guides():
+    """Load the guides pickled by `dump_efile_guides`, or return `None` if
+    there are none or they are older than any of the JSON guides.
+    """
+    path = get_pickle_path()
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+    if any(os.path.getmtime(get_guide_path(form)) > modified for form in EFILE_FORMS):
+        return None
+    with open(path, 'rb') as fp:
+        guides = pickle.load(fp)
+    return {form: EfileGuide(*guide) for form, guide in guides.items()}
 
 
+@functools.lru_cache(maxsize=None)
+def get_efile_guides():
+    guides = load_pickled_guides()
+    if guides is None:
+        guides = {form: parse_efile_guide(form) for form in EFILE_FORMS}
+    return guides
 
 
+def get_efile_guide(form):
+    """Get the guide for `form`, one of `EFILE_FORMS`, loading all guides on
+    first use.
+    """
+    return get_efile_guides()[form]
 
 
+def dump_efile_guides():
+    """Pickle the JSON guides so that processes can load them without parsing
+    JSON.
+    """
+    guides = {form: tuple(parse_efile_guide(form)) for form in EFILE_FORMS}
+    with open(get_pickle_path(), 'wb') as fp:
+        pickle.dump(guides, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    get_efile_guides.cache_clear()
@@ -1,5 +1,15 @@
+import os
+
 import cfenv
 
 env = cfenv.AppEnv()
 
-__all__ = ['env']
+FALSES = ('', 'False', 'false', 'f', '0')
+
+
+def env_flag(name):
+    """Whether environment variable `name` is set to a true value."""
+    return os.getenv(name, '') not in FALSES
+
+
+__all__ = ['env', 'env_flag']
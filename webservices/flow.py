@@ -1,92 +1,321 @@
 import os
+import re
+import time
+import queue
+import logging
+import multiprocessing
 
 import networkx as nx
 
+logger = logging.getLogger(__name__)
+
 here, _ = os.path.split(__file__)
 home = os.path.join(here, os.pardir)
 script_path = os.path.join(home, 'data', 'sql_updates')
 
+view_pattern = re.compile(r'create\s+materialized\s+view\s+(\w+)_tmp\b', re.IGNORECASE)
+create_pattern = re.compile(
+    r'create\s+(?:materialized\s+view|(?:unlogged\s+)?table|(?:or\s+replace\s+)?view)'
+    r'\s+(?:if\s+not\s+exists\s+)?(?:public\.)?(\w+)',
+    re.IGNORECASE,
+)
+identifier_pattern = re.compile(r'\b\w+\b')
+comment_pattern = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+
+# Dependencies that can't be discovered from the scripts, or that should hold
+# even if a script stops referencing the other's objects. These are unioned
+# with discovered dependencies.
+EXPLICIT_EDGES = [
+    ('candidate_history', 'candidate_detail'),
+    ('candidate_detail', 'candidate_election'),
+
+    ('candidate_history', 'candidate_history_latest'),
+    ('candidate_election', 'candidate_history_latest'),
+
+    ('committee_history', 'committee_detail'),
+
+    ('candidate_history', 'filings'),
+    ('committee_history', 'filings'),
+
+    ('filing_amendments_presidential', 'filings'),
+    ('filing_amendments_house_senate', 'filings'),
+    ('filing_amendments_pac_party', 'filings'),
+    ('filing_amendments_all', 'filings'),
+
+    ('candidate_history', 'candidate_flags'),
+    ('candidate_aggregates', 'candidate_flags'),
+
+    ('filing_amendments_presidential', 'reports_presidential'),
+    ('filing_amendments_house_senate', 'reports_house_senate'),
+    ('filing_amendments_pac_party', 'reports_pac_party'),
+    ('filing_amendments_all', 'reports_presidential'),
+    ('filing_amendments_all', 'reports_house_senate'),
+    ('filing_amendments_all', 'reports_pac_party'),
+
+    ('totals_house_senate', 'totals_combined'),
+    ('totals_presidential', 'totals_combined'),
+    ('totals_pac_party', 'totals_combined'),
+
+    ('committee_detail', 'committee_fulltext'),
+    ('totals_combined', 'committee_fulltext'),
+
+    ('committee_detail', 'totals_party'),
+    ('committee_detail', 'totals_pac'),
+
+    ('candidate_detail', 'candidate_fulltext'),
+    ('totals_combined', 'candidate_fulltext'),
+
+    ('totals_combined', 'sched_a_by_size_merged'),
+
+    ('totals_house_senate', 'candidate_aggregates'),
+    ('totals_presidential', 'candidate_aggregates'),
+    ('candidate_election', 'candidate_aggregates'),
+    ('cand_cmte_linkage', 'candidate_aggregates'),
+
+    ('committee_detail', 'large_aggregates'),
+    ('reports_ie', 'large_aggregates'),
+    ('communication_cost', 'large_aggregates'),
+
+    ('committee_history', 'communication_cost'),
+    ('committee_detail', 'sched_a_by_state_recipient_totals'),
+]
+
+
+def get_script_names():
+    return sorted(
+        name for name, ext in map(os.path.splitext, os.listdir(script_path))
+        if ext == '.sql'
+    )
+
+
+def parse_script(name):
+    """Find the tables and views created by migration script `name`, and the
+    identifiers it uses, ignoring comments.
+
+    :returns: Tuple of sets of created names and identifiers, in lower case
+    """
+    with open(os.path.join(script_path, '{}.sql'.format(name))) as fp:
+        text = comment_pattern.sub(' ', fp.read()).lower()
+    created = set(create_pattern.findall(text))
+    identifiers = set(identifier_pattern.findall(text))
+    return created, identifiers
+
+
+def get_discovered_edges(names):
+    """Find dependencies between migration scripts `names`: a script depends
+    on another if it uses a table or view the other creates.
+
+    :returns: Dict mapping each `(parent, child)` edge to the sorted names
+        that the child uses
+    """
+    parsed = {name: parse_script(name) for name in names}
+    creators = {}
+    for name, (created, _) in parsed.items():
+        for obj in created:
+            if obj in creators:
+                raise ValueError('{} is created by both {} and {}'.format(obj, creators[obj], name))
+            creators[obj] = name
+    edges = {}
+    for name, (created, identifiers) in parsed.items():
+        for obj in sorted(identifiers - created):
+            parent = creators.get(obj)
+            if parent:
+                edges.setdefault((parent, name), []).append(obj)
+    return edges
+
+
 def get_graph():
     """Build a `DiGraph` that captures dependencies between database migration
     tasks. Each node represents a migration script, and each edge represents
     a dependency between tasks. Tasks can be ordered using topological sort.
+
+    Edges are discovered from the tables and views each script creates and
+    uses, and unioned with `EXPLICIT_EDGES`. Each edge has a `source` of
+    `discovered`, `explicit` or `both`, and the `objects` it was discovered
+    from.
+
+    :raises ValueError: If the dependencies contain a cycle
     """
     graph = nx.DiGraph()
-    for path in os.listdir(script_path):
-        name, ext = os.path.splitext(path)
-        if ext == '.sql':
-            graph.add_node(name)
-
-    graph.add_edge('candidate_history', 'candidate_detail')
-    graph.add_edge('candidate_detail', 'candidate_election')
-
-    graph.add_edges_from([
-        ('candidate_history', 'candidate_history_latest'),
-        ('candidate_election', 'candidate_history_latest')
-    ])
-
-    graph.add_edge('committee_history', 'committee_detail')
-
-    graph.add_edges_from([
-        ('candidate_history', 'filings'),
-        ('committee_history', 'filings'),
-    ])
-
-    graph.add_edges_from([
-        ('filing_amendments_presidential', 'filings'),
-        ('filing_amendments_house_senate', 'filings'),
-        ('filing_amendments_pac_party','filings'),
-        ('filing_amendments_all', 'filings'),
-    ])
-
-    graph.add_edges_from([
-        ('candidate_history', 'candidate_flags'),
-        ('candidate_aggregates', 'candidate_flags'),
-    ])
-
-    graph.add_edges_from([
-        ('filing_amendments_presidential', 'reports_presidential'),
-        ('filing_amendments_house_senate', 'reports_house_senate'),
-        ('filing_amendments_pac_party', 'reports_pac_party'),
-        ('filing_amendments_all', 'reports_presidential'),
-        ('filing_amendments_all', 'reports_house_senate'),
-        ('filing_amendments_all', 'reports_pac_party'),
-    ])
-    graph.add_edges_from([
-        ('totals_house_senate', 'totals_combined'),
-        ('totals_presidential', 'totals_combined'),
-        ('totals_pac_party', 'totals_combined'),
-    ])
-
-    graph.add_edges_from([
-        ('committee_detail', 'committee_fulltext'),
-        ('totals_combined', 'committee_fulltext'),
-    ])
-
-    graph.add_edge('committee_detail', 'totals_party')
-    graph.add_edge('committee_detail', 'totals_pac')
-
-    graph.add_edges_from([
-        ('candidate_detail', 'candidate_fulltext'),
-        ('totals_combined', 'candidate_fulltext'),
-    ])
-
-    graph.add_edge('totals_combined', 'sched_a_by_size_merged')
-
-    graph.add_edges_from([
-        ('totals_house_senate', 'candidate_aggregates'),
-        ('totals_presidential', 'candidate_aggregates'),
-        ('candidate_election', 'candidate_aggregates'),
-        ('cand_cmte_linkage', 'candidate_aggregates'),
-    ])
-
-    graph.add_edges_from([
-        ('committee_detail', 'large_aggregates'),
-        ('reports_ie', 'large_aggregates'),
-        ('communication_cost', 'large_aggregates'),
-    ])
-
-    graph.add_edge('committee_history', 'communication_cost')
-    graph.add_edge('committee_detail', 'sched_a_by_state_recipient_totals')
-
+    names = get_script_names()
+    graph.add_nodes_from(names)
+    for (parent, child), objects in get_discovered_edges(names).items():
+        graph.add_edge(parent, child, source='discovered', objects=objects)
+    for parent, child in EXPLICIT_EDGES:
+        if graph.has_edge(parent, child):
+            graph[parent][child]['source'] = 'both'
+        else:
+            graph.add_edge(parent, child, source='explicit', objects=[])
+    if not nx.is_directed_acyclic_graph(graph):
+        cycles = [' -> '.join(cycle) for cycle in nx.simple_cycles(graph)]
+        raise ValueError('Migration dependencies contain cycles: {}'.format('; '.join(cycles)))
     return graph
+
+
+def get_descendant_graph(graph, names):
+    """Get the subgraph of `graph` made up of `names` and every node that
+    depends on them, directly or not.
+
+    :raises ValueError: If any of `names` isn't in `graph`
+    """
+    missing = sorted(set(names) - set(graph.nodes()))
+    if missing:
+        raise ValueError('Unknown migration scripts: {}'.format(', '.join(missing)))
+    nodes = set(names)
+    for name in names:
+        nodes.update(nx.descendants(graph, name))
+    return graph.subgraph(nodes)
+
+
+def get_outside_views(graph, subgraph):
+    """Get the views created by the scripts in `graph` that aren't in
+    `subgraph`. When only `subgraph` is rebuilt, these views keep their final
+    names, so its scripts must read them by those names; see
+    `replace_temporary_names`.
+    """
+    return sorted(
+        view
+        for name in graph.nodes() if name not in subgraph
+        for view in get_views(name)
+    )
+
+
+def replace_temporary_names(text, views):
+    """Replace references to the temporary names of `views` in `text` with
+    their final names.
+    """
+    if not views:
+        return text
+    pattern = re.compile(
+        r'\b({})_tmp\b'.format('|'.join(re.escape(view) for view in views)),
+        re.IGNORECASE,
+    )
+    return pattern.sub(r'\1', text)
+
+
+def get_report(graph):
+    """Describe the dependencies of each migration script in `graph`, for
+    review when scripts change.
+    """
+    return {
+        name: {
+            'depends_on': {
+                parent: {
+                    'source': graph[parent][name]['source'],
+                    'objects': graph[parent][name]['objects'],
+                }
+                for parent in sorted(graph.predecessors(name))
+            },
+            'views': get_views(name),
+        }
+        for name in sorted(graph.nodes())
+    }
+
+
+def get_views(name):
+    """Get the materialized views created by migration script `name`, in the
+    order they are created. Scripts create views with a `_tmp` suffix that is
+    removed by `rename_temporary_views.sql`; the final names are returned.
+    """
+    with open(os.path.join(script_path, '{}.sql'.format(name))) as fp:
+        return view_pattern.findall(fp.read())
+
+
+def get_waves(graph):
+    """Group the nodes of `graph` into waves, such that every node comes at
+    least one wave after all of its predecessors. Nodes within a wave don't
+    depend on each other and can be run in parallel.
+    """
+    depths = {}
+    for node in nx.topological_sort(graph):
+        depths[node] = max(
+            (depths[parent] + 1 for parent in graph.predecessors(node)),
+            default=0,
+        )
+    waves = [[] for _ in range(max(depths.values(), default=-1) + 1)]
+    for node in sorted(depths):
+        waves[depths[node]].append(node)
+    return waves
+
+
+def call_timed(func, node):
+    start = time.time()
+    try:
+        error = func(node)
+    except Exception as exc:
+        logger.exception(exc)
+        error = str(exc)
+    return node, time.time() - start, error
+
+
+def run_graph(graph, func, processes=1):
+    """Call `func` on each node of `graph`, starting each node as soon as all
+    of its predecessors have succeeded, with up to `processes` nodes running
+    at once in a multiprocessing pool. `func` must be picklable and return
+    `None` on success or an error message on failure; nodes that depend on a
+    failed node are skipped.
+
+    :returns: Tuple of durations by node, errors by node, and skipped nodes
+    """
+    remaining = {node: set(graph.predecessors(node)) for node in graph.nodes()}
+    ready = sorted(node for node, parents in remaining.items() if not parents)
+    durations, errors, skipped = {}, {}, set()
+    results = queue.Queue()
+    running = 0
+    pool = multiprocessing.Pool(processes=processes) if processes > 1 else None
+    try:
+        while ready or running:
+            for node in ready:
+                del remaining[node]
+                if pool:
+                    pool.apply_async(
+                        call_timed, (func, node), callback=results.put,
+                        error_callback=lambda exc, node=node: results.put((node, 0.0, str(exc))),
+                    )
+                else:
+                    results.put(call_timed(func, node))
+                running += 1
+            ready = []
+            node, duration, error = results.get()
+            running -= 1
+            durations[node] = duration
+            if error:
+                errors[node] = error
+                for descendant in nx.descendants(graph, node):
+                    if descendant in remaining:
+                        del remaining[descendant]
+                        skipped.add(descendant)
+                continue
+            for child in graph.successors(node):
+                if child in remaining:
+                    remaining[child].discard(node)
+                    if not remaining[child]:
+                        ready.append(child)
+            ready.sort()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return durations, errors, skipped
+
+
+def get_critical_path(graph, durations):
+    """Find the chain of dependent nodes with the longest total duration,
+    which bounds the time to run `graph` however many processes are used.
+
+    :returns: Tuple of total duration and list of nodes
+    """
+    finish, previous = {}, {}
+    for node in nx.topological_sort(graph):
+        parents = [parent for parent in graph.predecessors(node) if parent in finish]
+        parent = max(parents, key=finish.get, default=None)
+        previous[node] = parent
+        finish[node] = durations.get(node, 0) + (finish[parent] if parent else 0)
+    if not finish:
+        return 0, []
+    node = max(finish, key=finish.get)
+    length, path = finish[node], []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return length, path[::-1]
@@ -0,0 +1,298 @@
+"""Incremental refresh of the report and totals views in `data/sql_updates`.
+
+These views are keyed on committee and cycle, and only a small fraction of
+committees file on a given day. If `FEC_INCREMENTAL_VIEWS` is set,
+`update_schemas` builds them as plain tables instead of materialized views,
+under the same names, so models and dependent views read them unchanged.
+Triggers created by `data/sql_setup/prepare_filing_queue.sql` record the
+committee and cycle of every changed filing in `ofec_filing_queue`, and
+`refresh_materialized` recomputes only the queued committees and cycles of
+each table from the view's definition.
+
+Only changes to the Form 3 summaries are queued, and only if they are tables,
+since row-level triggers can't be attached to views. The views also read
+inputs that aren't queued, such as amendment chains and committee history, so
+`refresh_materialized` rebuilds the tables in full instead if the triggers
+are missing or the last full rebuild is more than
+`FEC_INCREMENTAL_REBUILD_DAYS` days old; see `needs_rebuild`.
+
+`IncrementalView.rebuild` recomputes a whole table as a fallback, and
+`IncrementalView.check` compares a table against a full evaluation of its
+definition.
+"""
+import os
+import re
+import logging
+import collections
+
+import sqlalchemy as sa
+
+from webservices import flow
+from webservices.rest import db
+from webservices.env import env_flag
+from webservices.config import SQL_CONFIG
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE = 'ofec_filing_queue'
+PROCESSING = 'ofec_filing_queue_processing'
+REBUILDS = 'ofec_filing_queue_rebuilds'
+TRIGGER = 'ofec_filing_queue_trigger'
+QUEUED_RELATIONS = ['fec_vsum_f3_vw', 'fec_vsum_f3p_vw', 'fec_vsum_f3x_vw']
+
+DEFAULT_REBUILD_DAYS = 7
+
+row_number_pattern = re.compile(r'row_number\(\)\s+over\s*\(\)\s+as\s+idx\s*,', re.IGNORECASE)
+temporary_pattern = re.compile(r'\b(ofec_\w+?)_tmp\b')
+
+
+def is_enabled():
+    return env_flag('FEC_INCREMENTAL_VIEWS')
+
+
+def get_rebuild_days():
+    return int(os.getenv('FEC_INCREMENTAL_REBUILD_DAYS') or DEFAULT_REBUILD_DAYS)
+
+
+class IncrementalView(object):
+    """Materialized view `name`, created by migration script `script`, that
+    can be maintained as a table by recomputing rows for changed committees
+    and cycles. The view must have an `idx` row number column and
+    `committee_id` and `cycle` columns.
+    """
+
+    def __init__(self, name, script):
+        self.name = name
+        self.script = script
+
+    @property
+    def temporary_name(self):
+        return '{0}_tmp'.format(self.name)
+
+    def read_script(self):
+        path = os.path.join(flow.script_path, '{0}.sql'.format(self.script))
+        with open(path) as fp:
+            return '\n'.join(
+                line for line in fp.readlines()
+                if not line.strip().startswith('--')
+            )
+
+    def get_definition(self):
+        """Get the query that defines the view, without its `idx` column and
+        with temporary view names replaced by their final names.
+        """
+        pattern = r'create\s+materialized\s+view\s+{0}\s+as\s+(.*?);'.format(self.temporary_name)
+        match = re.search(pattern, self.read_script(), re.IGNORECASE | re.DOTALL)
+        if match is None:
+            raise ValueError('Script {0} does not create {1}'.format(self.script, self.name))
+        query = row_number_pattern.sub('', match.group(1), count=1)
+        # End with a newline in case the last line has a trailing comment
+        return temporary_pattern.sub(r'\1', query).strip() + '\n'
+
+    def get_index_statements(self):
+        pattern = r'create\s+(?:unique\s+)?index\s+on\s+{0}\s*\(.*?\);'.format(self.temporary_name)
+        return re.findall(pattern, self.read_script(), re.IGNORECASE | re.DOTALL)
+
+    def get_columns(self, connection):
+        rows = connection.execute(
+            sa.text(
+                'select column_name from information_schema.columns '
+                'where table_schema = current_schema() and table_name = :name '
+                'order by ordinal_position'
+            ),
+            name=self.name,
+        )
+        return [row[0] for row in rows if row[0] != 'idx']
+
+    def is_table(self, connection):
+        kind = connection.execute(
+            sa.text('select relkind from pg_class where oid = to_regclass(:name)'),
+            name=self.name,
+        ).scalar()
+        return kind == 'r'
+
+    def convert(self, connection):
+        """Replace the temporary materialized view created by the migration
+        script with a table with the same name, contents, and indexes. Must
+        run before views that depend on this one are created.
+        """
+        staging = '{0}_staging'.format(self.temporary_name)
+        connection.execute('drop table if exists {0}'.format(staging))
+        connection.execute('create table {0} as select * from {1}'.format(staging, self.temporary_name))
+        connection.execute('drop materialized view {0}'.format(self.temporary_name))
+        connection.execute('alter table {0} rename to {1}'.format(staging, self.temporary_name))
+        for statement in self.get_index_statements():
+            connection.execute(statement)
+        connection.execute('analyze {0}'.format(self.temporary_name))
+
+    def rename(self, connection):
+        """Swap the temporary table in for the current view or table.
+        """
+        kind = connection.execute(
+            sa.text('select relkind from pg_class where oid = to_regclass(:name)'),
+            name=self.name,
+        ).scalar()
+        if kind == 'm':
+            connection.execute('drop materialized view {0} cascade'.format(self.name))
+        elif kind == 'r':
+            connection.execute('drop table {0} cascade'.format(self.name))
+        connection.execute('alter table {0} rename to {1}'.format(self.temporary_name, self.name))
+        indexes = connection.execute(
+            sa.text('select indexname from pg_indexes where tablename = :name'),
+            name=self.name,
+        )
+        for index, in indexes.fetchall():
+            if '_tmp' in index:
+                connection.execute('alter index {0} rename to {1}'.format(index, index.replace('_tmp', '')))
+
+    def drop(self, connection):
+        """Drop the table, if this view was built as one, so that
+        `rename_temporary_views.sql` can replace it with a materialized view.
+        """
+        if self.is_table(connection):
+            connection.execute('drop table {0} cascade'.format(self.name))
+
+    def refresh(self, connection):
+        """Recompute rows for the committees and cycles being processed.
+        """
+        keys = 'select distinct cmte_id, cycle from {0}'.format(PROCESSING)
+        connection.execute(
+            'delete from {0} where (committee_id, cycle) in ({1})'.format(self.name, keys)
+        )
+        insert = (
+            'insert into {name} '
+            'select (select coalesce(max(idx), 0) from {name}) + row_number() over (), definition.* '
+            'from ({definition}) definition '
+            'where (definition.committee_id, definition.cycle) in ({keys})'
+        ).format(name=self.name, definition=self.get_definition(), keys=keys)
+        return connection.execute(sa.text(insert), **SQL_CONFIG).rowcount
+
+    def rebuild(self, connection):
+        """Recompute every row of the table.
+        """
+        connection.execute('delete from {0}'.format(self.name))
+        insert = 'insert into {0} select row_number() over (), definition.* from ({1}) definition'.format(
+            self.name, self.get_definition(),
+        )
+        connection.execute(sa.text(insert), **SQL_CONFIG)
+        connection.execute('analyze {0}'.format(self.name))
+
+    def check(self, connection):
+        """Count rows that differ between the table and a full evaluation of
+        its definition, ignoring `idx`.
+        """
+        columns = ', '.join(self.get_columns(connection))
+        query = (
+            'select count(*) from ('
+            '(select {columns} from {name} except all select * from ({definition}) definition) '
+            'union all '
+            '(select * from ({definition}) definition except all select {columns} from {name})'
+            ') diff'
+        ).format(columns=columns, name=self.name, definition=self.get_definition())
+        return connection.execute(sa.text(query), **SQL_CONFIG).scalar()
+
+
+VIEWS = collections.OrderedDict(
+    (view.name, view) for view in [
+        IncrementalView('ofec_reports_house_senate_mv', 'reports_house_senate'),
+        IncrementalView('ofec_reports_presidential_mv', 'reports_presidential'),
+        IncrementalView('ofec_reports_pacs_parties_mv', 'reports_pac_party'),
+        IncrementalView('ofec_totals_house_senate_mv', 'totals_house_senate'),
+        IncrementalView('ofec_totals_presidential_mv', 'totals_presidential'),
+        IncrementalView('ofec_totals_pacs_parties_mv', 'totals_pac_party'),
+    ]
+)
+
+
+def get_views(names=None):
+    """Get registered views by name; defaults to all views.
+    """
+    if not names:
+        return list(VIEWS.values())
+    try:
+        return [VIEWS[name] for name in names]
+    except KeyError as error:
+        raise ValueError('{0} is not an incremental view'.format(error))
+
+
+def get_script_views(script):
+    return [view for view in VIEWS.values() if view.script == script]
+
+
+def get_tables():
+    """Get the names of views currently built as tables.
+    """
+    with db.engine.connect() as connection:
+        return {view.name for view in VIEWS.values() if view.is_table(connection)}
+
+
+def begin_refresh():
+    """Move queued changes to the processing table, where they remain until
+    every table has been refreshed. Changes committed after this point wait
+    for the next refresh.
+    """
+    with db.engine.begin() as connection:
+        connection.execute(
+            'with queued as (delete from {0} returning *) '
+            'insert into {1} select * from queued'.format(QUEUE, PROCESSING)
+        )
+
+
+def finish_refresh(rebuilt=False):
+    with db.engine.begin() as connection:
+        connection.execute('delete from {0}'.format(PROCESSING))
+        if rebuilt:
+            record_rebuild(connection)
+
+
+def needs_rebuild():
+    """Whether the tables should be rebuilt in full rather than refreshed
+    from the queue: if the queue triggers are missing from any of
+    `QUEUED_RELATIONS`, or if the last full rebuild was more than
+    `get_rebuild_days()` days ago.
+    """
+    with db.engine.connect() as connection:
+        triggers = connection.execute(
+            sa.text('select count(distinct tgrelid) from pg_trigger where tgname = :name'),
+            name=TRIGGER,
+        ).scalar()
+        if triggers < len(QUEUED_RELATIONS):
+            logger.warning('Filing queue triggers are missing; rebuilding incremental views')
+            return True
+        return connection.execute(
+            sa.text(
+                "select coalesce(max(timestamp) < current_timestamp - interval '1 day' * :days, true) "
+                'from {0}'.format(REBUILDS)
+            ),
+            days=get_rebuild_days(),
+        ).scalar()
+
+
+def record_rebuild(connection):
+    connection.execute('insert into {0} values (current_timestamp)'.format(REBUILDS))
+
+
+def convert_script(script):
+    """Convert the views created by migration script `script` to tables.
+    """
+    views = get_script_views(script)
+    if views:
+        with db.engine.begin() as connection:
+            for view in views:
+                logger.info('Converting {} to a table'.format(view.temporary_name))
+                view.convert(connection)
+
+
+def rename_tables(connection):
+    """Swap in the temporary tables on `connection`, which should be in the
+    same transaction as the other views are swapped in, since replacing a
+    table drops the views that depend on it.
+    """
+    for view in VIEWS.values():
+        view.rename(connection)
+
+
+def drop_tables(connection):
+    for view in VIEWS.values():
+        view.drop(connection)
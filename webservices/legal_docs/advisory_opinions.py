@@ -3,7 +3,7 @@ import logging
 import re
 
 from webservices.env import env
-from webservices.legal_docs import DOCS_INDEX
+from webservices.legal_docs import bulk, relations
 from webservices.rest import db
 from webservices.utils import get_elasticsearch_connection
 from webservices.tasks.utils import get_bucket
@@ -24,20 +24,23 @@ ALL_AOS = """
                FROM aouser.document
                WHERE category IN ('Final Opinion', 'Withdrawal of Request')) AS finished
         ON ao.ao_id = finished.finished
+    ORDER BY ao_id
 """
 
 AO_REQUESTORS = """
     SELECT
+        p.ao_id,
         e.name,
         et.description
     FROM aouser.players p
     INNER JOIN aouser.entity e USING (entity_id)
     INNER JOIN aouser.entity_type et ON et.entity_type_id = e.type
-    WHERE p.ao_id = %s AND role_id IN (0, 1)
+    WHERE p.ao_id = ANY(%(ao_ids)s) AND role_id IN (0, 1)
 """
 
 AO_DOCUMENTS = """
     SELECT
+        ao_id,
         document_id,
         ocrtext,
         fileimage,
@@ -45,7 +48,8 @@ AO_DOCUMENTS = """
         category,
         document_date
     FROM aouser.document
-    WHERE ao_id = %s
+    WHERE ao_id = ANY(%(ao_ids)s)
+    ORDER BY ao_id
 """
 
 STATUTE_CITATION_REGEX = re.compile(r"(?P<title>\d+)\s+U.S.C.\s+§*(?P<section>\d+).*\.?")
@@ -62,9 +66,7 @@ def load_advisory_opinions():
     `legal/aos/`.
     """
     es = get_elasticsearch_connection()
-
-    for ao in get_advisory_opinions():
-        es.index(DOCS_INDEX, 'advisory_opinions', ao, id=ao['no'])
+    bulk.index_documents(es, 'advisory_opinions', get_advisory_opinions(), id_field='no')
 
 def get_advisory_opinions():
     bucket = get_bucket()
@@ -76,44 +78,56 @@ def get_advisory_opinions():
     citations = get_citations(ao_names)
 
     with db.engine.connect() as conn:
-        rs = conn.execute(ALL_AOS)
-        for row in rs:
-            ao_id = row["ao_id"]
-            year, serial = ao_no_to_component_map[row["ao_no"]]
-            ao = {
-                "no": row["ao_no"],
-                "name": row["name"],
-                "summary": row["summary"],
-                "issue_date": row["issue_date"],
-                "is_pending": row["is_pending"],
-                "ao_citations": citations[row["ao_no"]]["ao"],
-                "aos_cited_by": citations[row["ao_no"]]["aos_cited_by"],
-                "statutory_citations": citations[row["ao_no"]]["statutes"],
-                "regulatory_citations": citations[row["ao_no"]]["regulations"],
-                "sort1": -year,
-                "sort2": -serial,
-            }
-            ao["documents"] = get_documents(ao_id, bucket, bucket_name)
-            ao["requestor_names"], ao["requestor_types"] = get_requestors(ao_id)
-
-            yield ao
-
-
-def get_requestors(ao_id):
-    requestor_names = []
-    requestor_types = set()
-    with db.engine.connect() as conn:
-        rs = conn.execute(AO_REQUESTORS, ao_id)
-        for row in rs:
-            requestor_names.append(row["name"])
-            requestor_types.add(row["description"])
-    return requestor_names, list(requestor_types)
-
-def get_documents(ao_id, bucket, bucket_name):
-    documents = []
+        rows = conn.execute(ALL_AOS).fetchall()
+
+    for batch in relations.get_batches(rows):
+        ao_ids = [row["ao_id"] for row in batch]
+        requestors = get_requestors(ao_ids)
+        with db.engine.connect() as conn:
+            documents = get_documents(conn, ao_ids, bucket, bucket_name)
+            for row, ao_documents in zip(batch, documents):
+                ao_id = row["ao_id"]
+                year, serial = ao_no_to_component_map[row["ao_no"]]
+                ao = {
+                    "no": row["ao_no"],
+                    "name": row["name"],
+                    "summary": row["summary"],
+                    "issue_date": row["issue_date"],
+                    "is_pending": row["is_pending"],
+                    "ao_citations": citations[row["ao_no"]]["ao"],
+                    "aos_cited_by": citations[row["ao_no"]]["aos_cited_by"],
+                    "statutory_citations": citations[row["ao_no"]]["statutes"],
+                    "regulatory_citations": citations[row["ao_no"]]["regulations"],
+                    "sort1": -year,
+                    "sort2": -serial,
+                }
+                ao["documents"] = ao_documents
+                ao["requestor_names"], ao["requestor_types"] = requestors.get(ao_id, ([], []))
+
+                yield ao
+
+
+def get_requestors(ao_ids):
+    """Get the names and types of requestors for each of `ao_ids`.
+    """
     with db.engine.connect() as conn:
-        rs = conn.execute(AO_DOCUMENTS, ao_id)
-        for row in rs:
+        rs = conn.execute(AO_REQUESTORS, {"ao_ids": ao_ids})
+        groups = relations.group_rows(rs, "ao_id")
+    requestors = {}
+    for ao_id, rows in groups.items():
+        requestor_names = [row["name"] for row in rows]
+        requestor_types = set(row["description"] for row in rows)
+        requestors[ao_id] = (requestor_names, list(requestor_types))
+    return requestors
+
+def get_documents(conn, ao_ids, bucket, bucket_name):
+    """Yield the documents of each of `ao_ids`, in order, uploading their
+    PDFs to S3. Documents are streamed from `conn`.
+    """
+    groups = relations.stream_groups(conn, AO_DOCUMENTS, {"ao_ids": ao_ids}, "ao_id")
+    for rows in relations.align_groups(ao_ids, groups):
+        documents = []
+        for row in rows:
             document = {
                 "document_id": row["document_id"],
                 "category": row["category"],
@@ -127,7 +141,7 @@ def get_documents(ao_id, bucket, bucket_name):
                     ContentType="application/pdf", ACL="public-read")
             document["url"] = "https://%s.s3.amazonaws.com/%s" % (bucket_name, pdf_key)
             documents.append(document)
-    return documents
+        yield documents
 
 def get_ao_names():
     ao_names_results = db.engine.execute("""SELECT ao_no, name FROM aouser.ao""")
@@ -143,7 +157,7 @@ def get_citations(ao_names):
 
     logger.info("Getting citations...")
 
-    rs = db.engine.execute("""SELECT ao_no, ocrtext FROM aouser.document
+    rs = db.engine.execution_options(stream_results=True).execute("""SELECT ao_no, ocrtext FROM aouser.document
                                 INNER JOIN aouser.ao USING (ao_id)
                               WHERE category = 'Final Opinion'""")
 
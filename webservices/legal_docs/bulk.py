@@ -0,0 +1,136 @@
+"""Bulk indexing of legal documents.
+
+Loaders pass an iterable of documents to `index_documents`, which serializes
+each document once, groups them into chunks bounded by document count and
+request size, and sends each chunk with `elasticsearch.helpers.streaming_bulk`.
+Documents rejected because the cluster is overloaded are retried with
+exponential backoff; any other failure raises `BulkIndexError`. Indexing
+bumps the legal cache generation once all documents are sent.
+"""
+import os
+import time
+import logging
+
+import elasticsearch.helpers
+from elasticsearch.serializer import JSONSerializer
+
+from webservices.legal_docs import DOCS_INDEX
+from webservices.legal_docs import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+# Requests over 10 MB are rejected by some hosted clusters
+DEFAULT_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_INITIAL_BACKOFF = 2
+MAX_BACKOFF = 60
+
+# Statuses worth retrying: rejected executions, unavailable nodes, and
+# connection errors, which have no HTTP status
+RETRY_STATUSES = {429, 503, 'N/A'}
+
+serializer = JSONSerializer()
+
+
+def get_options():
+    return {
+        'chunk_size': int(os.getenv('FEC_ES_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)),
+        'max_chunk_bytes': int(os.getenv('FEC_ES_MAX_CHUNK_BYTES', DEFAULT_MAX_CHUNK_BYTES)),
+        'max_retries': int(os.getenv('FEC_ES_MAX_RETRIES', DEFAULT_MAX_RETRIES)),
+        'initial_backoff': float(os.getenv('FEC_ES_INITIAL_BACKOFF', DEFAULT_INITIAL_BACKOFF)),
+    }
+
+
+def index_documents(es, doc_type, docs, id_field='doc_id', index=DOCS_INDEX,
+                    on_indexed=None, **options):
+    """Index `docs` in `index` with type `doc_type`, using the value of
+    `id_field` in each document as its id. If given, `on_indexed` is called
+    with the ids of each chunk once it's indexed. Defaults for `chunk_size`,
+    `max_chunk_bytes`, `max_retries`, and `initial_backoff` are read from
+    the environment by `get_options`.
+
+    :returns: Number of documents indexed
+    """
+    options = dict(get_options(), **options)
+    actions = (make_action(index, doc_type, doc, id_field) for doc in docs)
+    count = 0
+    start = time.time()
+    for number, (chunk, size) in enumerate(
+            get_chunks(actions, options['chunk_size'], options['max_chunk_bytes']), 1):
+        index_chunk(
+            es, chunk, options['max_chunk_bytes'], options['max_retries'], options['initial_backoff'],
+        )
+        count += len(chunk)
+        if on_indexed:
+            on_indexed([action['_id'] for action in chunk])
+        logger.info(
+            'Indexed chunk %d of %d %s (%d bytes); %d indexed in %.1fs',
+            number, len(chunk), doc_type, size, count, time.time() - start,
+        )
+    if count:
+        cache.bump_generation()
+    return count
+
+
+def make_action(index, doc_type, doc, id_field):
+    # Serialize once, both to measure the request size and to send; the
+    # client passes strings through unchanged
+    return {
+        '_index': index,
+        '_type': doc_type,
+        '_id': doc[id_field],
+        '_source': serializer.dumps(doc),
+    }
+
+
+def get_chunks(actions, chunk_size, max_chunk_bytes):
+    """Group `actions` into chunks of at most `chunk_size` actions and
+    `max_chunk_bytes` bytes of source. A single document larger than
+    `max_chunk_bytes` is sent in a chunk of its own.
+    """
+    chunk, size = [], 0
+    for action in actions:
+        length = len(action['_source'].encode('utf-8'))
+        if chunk and (len(chunk) >= chunk_size or size + length > max_chunk_bytes):
+            yield chunk, size
+            chunk, size = [], 0
+        chunk.append(action)
+        size += length
+    if chunk:
+        yield chunk, size
+
+
+def index_chunk(es, chunk, max_chunk_bytes, max_retries, initial_backoff):
+    """Send `chunk` in a bulk request, retrying rejected documents up to
+    `max_retries` times. `max_chunk_bytes` also bounds the request including
+    action metadata, which may rarely split the chunk into two requests.
+    """
+    for attempt in range(max_retries + 1):
+        results = elasticsearch.helpers.streaming_bulk(
+            es,
+            chunk,
+            chunk_size=len(chunk),
+            max_chunk_bytes=max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+        retries, errors = [], []
+        for action, (ok, item) in zip(chunk, results):
+            if ok:
+                continue
+            _, info = next(iter(item.items()))
+            if info.get('status') in RETRY_STATUSES and attempt < max_retries:
+                retries.append(action)
+            else:
+                errors.append(item)
+        if errors:
+            raise elasticsearch.helpers.BulkIndexError(
+                '%i document(s) failed to index.' % len(errors), errors
+            )
+        if not retries:
+            return
+        backoff = min(initial_backoff * 2 ** attempt, MAX_BACKOFF)
+        logger.warning('Retrying %d rejected documents in %.1fs', len(retries), backoff)
+        time.sleep(backoff)
+        chunk = retries
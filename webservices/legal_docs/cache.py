@@ -0,0 +1,213 @@
+"""Result cache for legal search and document fetches.
+
+The legal index only changes when the loaders in `legal_docs` run or the
+staging index is swapped in. Those operations bump an index generation shared
+through Redis, and cached results are keyed on that generation along with the
+resource and its normalized arguments, so a reindex invalidates every cached
+result at once.
+
+Results are held in an in-process LRU tier and, if `FEC_LEGAL_CACHE_REDIS` is
+set, in a Redis tier shared by all workers. Caching is only active if the
+`FEC_LEGAL_CACHE` environment variable is set. Resources wrap partial
+results, such as a search in which one document type failed or timed out, in
+`Uncacheable` so that they are returned but not stored. Hit ratios for each
+tier are logged every `STATS_INTERVAL` lookups and available from `stats`.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+import functools
+import collections
+
+import redis
+import ujson
+
+from webservices.env import env_flag
+from webservices.common import cache
+from webservices.common.counts import normalize_value
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'openfec:legal'
+GENERATION_KEY = 'openfec:legal:generation'
+
+DEFAULT_MAXSIZE = 1024
+# Seconds before a cached result expires regardless of the generation
+DEFAULT_TTL = 24 * 60 * 60
+STATS_INTERVAL = 1000
+
+LRU_HIT = 'lru'
+REDIS_HIT = 'redis'
+MISS = 'miss'
+
+generation = cache.Generation(key=GENERATION_KEY)
+
+
+def is_enabled():
+    return env_flag('FEC_LEGAL_CACHE')
+
+
+def is_redis_enabled():
+    return env_flag('FEC_LEGAL_CACHE_REDIS')
+
+
+def bump_generation():
+    """Invalidate all cached legal results. Errors are logged rather than
+    raised so that loaders don't fail if Redis is unavailable.
+    """
+    try:
+        value = generation.bump()
+    except redis.exceptions.RedisError as error:
+        logger.warning('Could not bump legal cache generation: {0}'.format(error))
+    else:
+        logger.info('Bumped legal cache generation to {0}'.format(value))
+
+
+class LRUCache(object):
+    """Thread-safe in-process cache of at most `maxsize` values, each
+    expiring `ttl` seconds after it was stored.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                return None
+            if cached[1] <= now:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return cached[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._cache[key] = (value, time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class Stats(object):
+    """Counts of lookups served by each tier."""
+
+    def __init__(self, interval=STATS_INTERVAL):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, status):
+        with self._lock:
+            self.counts[status] += 1
+            total = sum(self.counts.values())
+        if self.interval and total % self.interval == 0:
+            logger.info('Legal cache: {0}'.format(self.summary()))
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        hits = counts.get(LRU_HIT, 0) + counts.get(REDIS_HIT, 0)
+        return {
+            'lookups': total,
+            'lru_hits': counts.get(LRU_HIT, 0),
+            'redis_hits': counts.get(REDIS_HIT, 0),
+            'misses': counts.get(MISS, 0),
+            'hit_ratio': hits / total if total else 0.0,
+            'lru_hit_ratio': counts.get(LRU_HIT, 0) / total if total else 0.0,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+class Uncacheable(object):
+    """Wraps a result that should be returned but not cached."""
+
+    def __init__(self, result):
+        self.result = result
+
+
+def unwrap(result):
+    return result.result if isinstance(result, Uncacheable) else result
+
+
+lru = LRUCache(maxsize=int(os.getenv('FEC_LEGAL_CACHE_SIZE', DEFAULT_MAXSIZE)))
+stats = Stats()
+
+
+def make_key(name, kwargs):
+    args = '&'.join(
+        '{0}={1}'.format(key, normalize_value(value))
+        for key, value in sorted(kwargs.items())
+        if key not in cache.IGNORE_FIELDS
+    )
+    digest = hashlib.sha1(args.encode('utf-8')).hexdigest()
+    return '{0}:{1}:{2}:{3}'.format(KEY_PREFIX, generation.get(), name, digest)
+
+
+def get_or_compute(key, compute):
+    """Get the result at `key` from the LRU tier, then the Redis tier, or
+    compute and store it in both unless `compute` returns an `Uncacheable`.
+
+    :returns: Tuple of result and the tier that served it, or `MISS`
+    """
+    result = lru.get(key)
+    if result is not None:
+        return result, LRU_HIT
+    use_redis = is_redis_enabled()
+    if use_redis:
+        try:
+            body = cache.get_client().get(key)
+        except redis.exceptions.RedisError as error:
+            logger.warning('Legal cache Redis tier unavailable: {0}'.format(error))
+            use_redis = False
+        else:
+            if body is not None:
+                result = ujson.loads(body)
+                lru.set(key, result)
+                return result, REDIS_HIT
+    result = compute()
+    if isinstance(result, Uncacheable):
+        return result.result, MISS
+    lru.set(key, result)
+    if use_redis:
+        cache.store(cache.get_client(), key, ujson.dumps(result), lru.ttl)
+    return result, MISS
+
+
+def cached(func):
+    """Cache the results of a legal resource `get` method. Must be applied
+    beneath the `use_kwargs` decorator, and the method must return a
+    JSON-serializable dict, optionally wrapped in `Uncacheable`.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not is_enabled():
+            return unwrap(func(self, *args, **kwargs))
+        try:
+            key = make_key(type(self).__name__, kwargs)
+        except redis.exceptions.RedisError as error:
+            logger.warning('Legal cache unavailable: {0}'.format(error))
+            return unwrap(func(self, *args, **kwargs))
+        result, status = get_or_compute(key, lambda: func(self, *args, **kwargs))
+        stats.record(status)
+        return result
+    return wrapper
@@ -4,7 +4,7 @@ from collections import defaultdict
 from urllib.parse import urlencode
 
 from webservices.env import env
-from webservices.legal_docs import DOCS_INDEX
+from webservices.legal_docs import bulk, relations
 from webservices.rest import db
 from webservices.utils import create_eregs_link, get_elasticsearch_connection
 from webservices.tasks.utils import get_bucket
@@ -17,37 +17,38 @@ ALL_MURS = """
     SELECT case_id, case_no, name
     FROM fecmur.case
     WHERE case_type = 'MUR'
+    ORDER BY case_id
 """
 
 MUR_SUBJECTS = """
-    SELECT subject.description AS subj, relatedsubject.description AS rel
+    SELECT case_id, subject.description AS subj, relatedsubject.description AS rel
     FROM fecmur.case_subject
     JOIN fecmur.subject USING (subject_id)
     LEFT OUTER JOIN fecmur.relatedsubject USING (subject_id, relatedsubject_id)
-    WHERE case_id = %s
+    WHERE case_id = ANY(%(case_ids)s)
 """
 
 MUR_ELECTION_CYCLES = """
-    SELECT election_cycle::INT
+    SELECT case_id, election_cycle::INT
     FROM fecmur.electioncycle
-    WHERE case_id = %s
+    WHERE case_id = ANY(%(case_ids)s)
 """
 
 MUR_PARTICIPANTS = """
-    SELECT entity_id, name, role.description AS role
+    SELECT case_id, entity_id, name, role.description AS role
     FROM fecmur.players
     JOIN fecmur.role USING (role_id)
     JOIN fecmur.entity USING (entity_id)
-    WHERE case_id = %s
+    WHERE case_id = ANY(%(case_ids)s)
 """
 
 MUR_DOCUMENTS = """
-    SELECT document_id, category, description, ocrtext,
+    SELECT case_id, document_id, category, description, ocrtext,
         fileimage, length(fileimage) AS length,
         doc_order_id, document_date
     FROM fecmur.document
-    WHERE case_id = %s
-    ORDER BY doc_order_id, document_date desc, document_id DESC;
+    WHERE case_id = ANY(%(case_ids)s)
+    ORDER BY case_id, doc_order_id, document_date desc, document_id DESC;
 """
 # TODO: Check if document order matters
 
@@ -59,13 +60,14 @@ MUR_VIOLATIONS = """
 """
 
 OPEN_AND_CLOSE_DATES = """
-    SELECT min(event_date), max(event_date)
+    SELECT case_id, min(event_date), max(event_date)
     FROM fecmur.calendar
-    WHERE case_id = %s;
+    WHERE case_id = ANY(%(case_ids)s)
+    GROUP BY case_id;
 """
 
 DISPOSITION_DATA = """
-    SELECT fecmur.event.event_name,
+    SELECT fecmur.calendar.case_id, fecmur.event.event_name,
         fecmur.settlement.final_amount, fecmur.entity.name, violations.statutory_citation,
         violations.regulatory_citation
     FROM fecmur.calendar
@@ -74,16 +76,17 @@ DISPOSITION_DATA = """
     LEFT JOIN (SELECT * FROM fecmur.relatedobjects WHERE relation_id = 1) AS relatedobjects
         ON relatedobjects.detail_key = fecmur.calendar.entity_id
     LEFT JOIN fecmur.settlement ON fecmur.settlement.settlement_id = relatedobjects.master_key
-    LEFT JOIN (SELECT * FROM fecmur.violations WHERE stage = 'Closed' AND case_id = {0}) AS violations
+    LEFT JOIN (SELECT * FROM fecmur.violations WHERE stage = 'Closed') AS violations
         ON violations.entity_id = fecmur.calendar.entity_id
-    WHERE fecmur.calendar.case_id = {0}
+        AND violations.case_id = fecmur.calendar.case_id
+    WHERE fecmur.calendar.case_id = ANY(%(case_ids)s)
         AND event_name NOT IN ('Complaint/Referral', 'Disposition')
     ORDER BY fecmur.event.event_name ASC, fecmur.settlement.final_amount DESC NULLS LAST, event_date DESC;
 """
 
 COMMISSION_VOTES = """
-SELECT vote_date, action from fecmur.commission
-WHERE case_id = %s
+SELECT case_id, vote_date, action from fecmur.commission
+WHERE case_id = ANY(%(case_ids)s)
 ORDER BY vote_date desc;
 """
 
@@ -98,81 +101,91 @@ def load_current_murs():
     the MUR are uploaded to an S3 bucket under the _directory_ `legal/murs/current/`.
     """
     es = get_elasticsearch_connection()
+    bulk.index_documents(es, 'murs', get_murs())
+
+def get_murs():
     bucket = get_bucket()
     bucket_name = env.get_credential('bucket')
     with db.engine.connect() as conn:
-        rs = conn.execute(ALL_MURS)
-        for row in rs:
-            case_id = row['case_id']
-            mur = {
-                'doc_id': 'mur_%s' % row['case_no'],
-                'no': row['case_no'],
-                'name': row['name'],
-                'mur_type': 'current',
-            }
-            mur['subjects'] = get_subjects(case_id)
-            mur['subject'] = {'text': mur['subjects']}
-            mur['election_cycles'] = get_election_cycles(case_id)
+        rows = conn.execute(ALL_MURS).fetchall()
 
-            participants = get_participants(case_id)
-            mur['participants'] = list(participants.values())
-            mur['respondents'] = get_sorted_respondents(mur['participants'])
-            mur['disposition'] = get_disposition(case_id)
-            mur['commission_votes'] = get_commission_votes(case_id)
-            mur['dispositions'] = mur['disposition']['data']
-            mur['documents'] = get_documents(case_id, bucket, bucket_name)
-            mur['open_date'], mur['close_date'] = get_open_and_close_dates(case_id)
-            mur['url'] = '/legal/matter-under-review/%s/' % row['case_no']
-            es.index(DOCS_INDEX, 'murs', mur, id=mur['doc_id'])
+    for batch in relations.get_batches(rows):
+        case_ids = [row['case_id'] for row in batch]
+        with db.engine.connect() as conn:
+            params = {'case_ids': case_ids}
+            subjects = get_subjects(conn, params)
+            election_cycles = get_election_cycles(conn, params)
+            participants = get_participants(conn, params)
+            dispositions = get_dispositions(conn, params)
+            commission_votes = get_commission_votes(conn, params)
+            dates = get_open_and_close_dates(conn, params)
+            documents = get_documents(conn, params, bucket, bucket_name)
+            for row, mur_documents in zip(batch, documents):
+                case_id = row['case_id']
+                mur = {
+                    'doc_id': 'mur_%s' % row['case_no'],
+                    'no': row['case_no'],
+                    'name': row['name'],
+                    'mur_type': 'current',
+                }
+                mur['subjects'] = subjects[case_id]
+                mur['subject'] = {'text': mur['subjects']}
+                mur['election_cycles'] = election_cycles[case_id]
 
-def get_election_cycles(case_id):
-    election_cycles = []
-    with db.engine.connect() as conn:
-        rs = conn.execute(MUR_ELECTION_CYCLES, case_id)
-        for row in rs:
-            election_cycles.append(row['election_cycle'])
-    return election_cycles
+                mur['participants'] = list(participants[case_id].values())
+                mur['respondents'] = get_sorted_respondents(mur['participants'])
+                mur['disposition'] = {
+                    'text': [
+                        {'vote_date': vote['vote_date'], 'text': vote['action']}
+                        for vote in commission_votes[case_id]
+                    ],
+                    'data': dispositions[case_id],
+                }
+                mur['commission_votes'] = commission_votes[case_id]
+                mur['dispositions'] = mur['disposition']['data']
+                mur['documents'] = mur_documents
+                mur['open_date'], mur['close_date'] = dates.get(case_id, (None, None))
+                mur['url'] = '/legal/matter-under-review/%s/' % row['case_no']
+                yield mur
 
-def get_open_and_close_dates(case_id):
-    with db.engine.connect() as conn:
-        rs = conn.execute(OPEN_AND_CLOSE_DATES, case_id)
-        open_date, close_date = rs.fetchone()
-    return open_date, close_date
+def get_election_cycles(conn, params):
+    election_cycles = defaultdict(list)
+    rs = conn.execute(MUR_ELECTION_CYCLES, params)
+    for row in rs:
+        election_cycles[row['case_id']].append(row['election_cycle'])
+    return election_cycles
 
-def get_disposition(case_id):
-    with db.engine.connect() as conn:
-        rs = conn.execute(DISPOSITION_DATA.format(case_id))
-        disposition_data = []
-        for row in rs:
-            citations = parse_statutory_citations(row['statutory_citation'], case_id, row['name'])
-            citations.extend(parse_regulatory_citations(row['regulatory_citation'], case_id, row['name']))
-            disposition_data.append({'disposition': row['event_name'], 'penalty': row['final_amount'],
-                'respondent': row['name'], 'citations': citations})
+def get_open_and_close_dates(conn, params):
+    rs = conn.execute(OPEN_AND_CLOSE_DATES, params)
+    return {case_id: (open_date, close_date) for case_id, open_date, close_date in rs}
 
-        rs = conn.execute(COMMISSION_VOTES, case_id)
-        disposition_text = []
-        for row in rs:
-            disposition_text.append({'vote_date': row['vote_date'], 'text': row['action']})
-        return {'text': disposition_text, 'data': disposition_data}
+def get_dispositions(conn, params):
+    rs = conn.execute(DISPOSITION_DATA, params)
+    dispositions = defaultdict(list)
+    for row in rs:
+        case_id = row['case_id']
+        citations = parse_statutory_citations(row['statutory_citation'], case_id, row['name'])
+        citations.extend(parse_regulatory_citations(row['regulatory_citation'], case_id, row['name']))
+        dispositions[case_id].append({'disposition': row['event_name'], 'penalty': row['final_amount'],
+            'respondent': row['name'], 'citations': citations})
+    return dispositions
 
-def get_commission_votes(case_id):
-    with db.engine.connect() as conn:
-        rs = conn.execute(COMMISSION_VOTES, case_id)
-        commission_votes = []
-        for row in rs:
-            commission_votes.append({'vote_date': row['vote_date'], 'action': row['action']})
-        return commission_votes
+def get_commission_votes(conn, params):
+    rs = conn.execute(COMMISSION_VOTES, params)
+    commission_votes = defaultdict(list)
+    for row in rs:
+        commission_votes[row['case_id']].append({'vote_date': row['vote_date'], 'action': row['action']})
+    return commission_votes
 
-def get_participants(case_id):
-    participants = {}
-    with db.engine.connect() as conn:
-        rs = conn.execute(MUR_PARTICIPANTS, case_id)
-        for row in rs:
-            participants[row['entity_id']] = {
-                'name': row['name'],
-                'role': row['role'],
-                'citations': defaultdict(list)
-            }
+def get_participants(conn, params):
+    participants = defaultdict(dict)
+    rs = conn.execute(MUR_PARTICIPANTS, params)
+    for row in rs:
+        participants[row['case_id']][row['entity_id']] = {
+            'name': row['name'],
+            'role': row['role'],
+            'citations': defaultdict(list)
+        }
     return participants
 
 def get_sorted_respondents(participants):
@@ -185,16 +198,15 @@ def get_sorted_respondents(participants):
         respondents.extend(sorted([p['name'] for p in participants if p['role'] == role]))
     return respondents
 
-def get_subjects(case_id):
-    subjects = []
-    with db.engine.connect() as conn:
-        rs = conn.execute(MUR_SUBJECTS, case_id)
-        for row in rs:
-            if row['rel']:
-                subject_str = row['subj'] + "-" + row['rel']
-            else:
-                subject_str = row['subj']
-            subjects.append(subject_str)
+def get_subjects(conn, params):
+    subjects = defaultdict(list)
+    rs = conn.execute(MUR_SUBJECTS, params)
+    for row in rs:
+        if row['rel']:
+            subject_str = row['subj'] + "-" + row['rel']
+        else:
+            subject_str = row['subj']
+        subjects[row['case_id']].append(subject_str)
     return subjects
 
 def assign_citations(participants, case_id):
@@ -256,11 +268,14 @@ def parse_regulatory_citations(regulatory_citation, case_id, entity_id):
                     regulatory_citation, entity_id, case_id)
     return citations
 
-def get_documents(case_id, bucket, bucket_name):
-    documents = []
-    with db.engine.connect() as conn:
-        rs = conn.execute(MUR_DOCUMENTS, case_id)
-        for row in rs:
+def get_documents(conn, params, bucket, bucket_name):
+    """Yield the documents of each case in `params`, in order, uploading
+    their PDFs to S3. Documents are streamed from `conn`.
+    """
+    groups = relations.stream_groups(conn, MUR_DOCUMENTS, params, 'case_id')
+    for rows in relations.align_groups(params['case_ids'], groups):
+        documents = []
+        for row in rows:
             document = {
                 'document_id': row['document_id'],
                 'category': row['category'],
@@ -275,7 +290,7 @@ def get_documents(case_id, bucket, bucket_name):
                     ContentType='application/pdf', ACL='public-read')
             document['url'] = "https://%s.s3.amazonaws.com/%s" % (bucket_name, pdf_key)
             documents.append(document)
-    return documents
+        yield documents
 
 def remove_reclassification_notes(statutory_citation):
     """ Statutory citations include notes on reclassification of the form
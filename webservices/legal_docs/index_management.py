@@ -5,7 +5,8 @@ import elasticsearch.helpers
 
 from . import (
     DOCS_INDEX,
-    DOCS_SEARCH
+    DOCS_SEARCH,
+    cache,
 )
 from webservices import utils
 
@@ -393,6 +394,7 @@ def initialize_legal_docs():
             DOCS_SEARCH: {}
         }
     })
+    cache.bump_generation()
 
 def create_staging_index():
     """
@@ -434,6 +436,7 @@ def restore_from_staging_index():
         {"remove": {"index": 'docs', "alias": DOCS_SEARCH}},
         {"add": {"index": 'docs_staging', "alias": DOCS_SEARCH}}
     ]})
+    cache.bump_generation()
 
     logger.info("Delete and re-create index 'docs'")
     es.indices.delete('docs')
@@ -452,5 +455,6 @@ def restore_from_staging_index():
         {"add": {"index": 'docs', "alias": DOCS_INDEX}},
         {"add": {"index": 'docs', "alias": DOCS_SEARCH}}
     ]})
+    cache.bump_generation()
     logger.info("Delete index 'docs_staging'")
     es.indices.delete('docs_staging')
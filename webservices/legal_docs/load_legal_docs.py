@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import os
 import re
 from zipfile import ZipFile
 from tempfile import NamedTemporaryFile
@@ -19,6 +20,8 @@ from webservices.env import env
 from webservices import utils
 from webservices.tasks.utils import get_bucket
 from webservices.legal_docs import DOCS_INDEX
+from webservices.legal_docs import bulk
+from webservices.legal_docs import cache
 
 from . import reclassify_statutory_citation
 
@@ -33,6 +36,14 @@ sys.path = sys.path[1:]
 
 logger = logging.getLogger('manager')
 
+DEFAULT_PROCESSES = 4
+# Replace workers periodically to bound memory used by PDF parsing
+MAX_TASKS_PER_CHILD = 100
+ARCHIVED_MUR_CHUNK_SIZE = 50
+
+# Connections reused by each MUR processed in a worker; see `init_worker`
+_worker = {}
+
 def get_sections(reg):
     sections = {}
     for subpart in reg['children']:
@@ -61,9 +72,12 @@ def index_regulations():
         logger.info("Regs could not be indexed, environment variable FEC_EREGS_API not set.")
         return
 
-    reg_versions = requests.get(eregs_api + 'regulation').json()['versions']
     es = utils.get_elasticsearch_connection()
-    reg_count = 0
+    count = bulk.index_documents(es, 'regulations', get_regulations(eregs_api))
+    logger.info("%d regulation sections indexed." % count)
+
+def get_regulations(eregs_api):
+    reg_versions = requests.get(eregs_api + 'regulation').json()['versions']
     for reg in reg_versions:
         url = '%sregulation/%s/%s' % (eregs_api, reg['regulation'],
                                         reg['version'])
@@ -82,9 +96,7 @@ def index_regulations():
                     "text": sections[section_label]['text'], 'url': reg_url,
                     "no": no}
 
-            es.index(DOCS_INDEX, 'regulations', doc, id=doc['doc_id'])
-        reg_count += 1
-    logger.info("%d regulation parts indexed." % reg_count)
+            yield doc
 
 def get_ao_citations():
     logger.info("getting citations...")
@@ -145,6 +157,9 @@ def get_title_52_statutes():
 
     title_parsed = get_xml_tree_from_url('http://uscode.house.gov/download/' +
                     'releasepoints/us/pl/114/219/xml_usc52@114-219.zip')
+    bulk.index_documents(es, 'statutes', get_title_52_sections(title_parsed))
+
+def get_title_52_sections(title_parsed):
     tag_name = '{{http://xml.house.gov/schemas/uslm/1.0}}{0}'
     for subtitle in title_parsed.iter(tag_name.format('subtitle')):
         if subtitle.attrib['identifier'] == '/us/usc/t52/stIII':
@@ -172,13 +187,16 @@ def get_title_52_statutes():
                            "chapter": chapter,
                            "subchapter": subchapter_no,
                            "url": pdf_url}
-                    es.index(DOCS_INDEX, 'statutes', doc, id=doc['doc_id'])
+                    yield doc
 
 def get_title_26_statutes():
     es = utils.get_elasticsearch_connection()
 
     title_parsed = get_xml_tree_from_url('http://uscode.house.gov/download/' +
                     'releasepoints/us/pl/114/219/xml_usc26@114-219.zip')
+    bulk.index_documents(es, 'statutes', get_title_26_sections(title_parsed))
+
+def get_title_26_sections(title_parsed):
     tag_name = '{{http://xml.house.gov/schemas/uslm/1.0}}{0}'
     for subtitle in title_parsed.iter(tag_name.format('subtitle')):
         if subtitle.attrib['identifier'] == '/us/usc/t26/stH':
@@ -204,7 +222,7 @@ def get_title_26_statutes():
                            "title": "26",
                            "chapter": chapter_no,
                            "url": pdf_url}
-                    es.index(DOCS_INDEX, 'statutes', doc, id=doc['doc_id'])
+                    yield doc
 
 
 def index_statutes():
@@ -216,9 +234,9 @@ def index_statutes():
     get_title_52_statutes()
 
 
-def process_mur_pdf(mur_no, pdf_key, bucket):
-    response = requests.get('http://www.fec.gov/disclosure_data/mur/%s.pdf'
-                            % mur_no, stream=True)
+def process_mur_pdf(mur_no, pdf_key, bucket, session=requests):
+    response = session.get('http://www.fec.gov/disclosure_data/mur/%s.pdf'
+                           % mur_no, stream=True)
 
     with NamedTemporaryFile('wb+') as pdf:
         for chunk in response:
@@ -343,6 +361,7 @@ def delete_from_es(index, doc_type):
     """
     es = utils.get_elasticsearch_connection()
     es.delete_by_query(index=index, body={'query': {'match_all': {}}}, doc_type=doc_type)
+    cache.bump_generation()
 
 def get_mur_names(mur_names={}):
     # Cache the mur names
@@ -355,21 +374,30 @@ def get_mur_names(mur_names={}):
                 mur_names[row[1]] = row[2]
     return mur_names
 
+def init_worker():
+    """Set up the connections reused by each MUR processed in a worker."""
+    _worker['bucket'] = get_bucket()
+    _worker['bucket_name'] = env.get_credential('bucket')
+    _worker['session'] = requests.Session()
+    get_mur_names()
+
+def get_worker():
+    if not _worker:
+        init_worker()
+    return _worker
+
 def process_mur(mur):
     logger.info("processing mur %d of %d" % (mur[0], mur[1]))
-    es = utils.get_elasticsearch_connection()
-    bucket = get_bucket()
-    bucket_name = env.get_credential('bucket')
+    worker = get_worker()
+    bucket = worker['bucket']
+    bucket_name = worker['bucket_name']
     mur_names = get_mur_names()
     (mur_no_td, open_date_td, close_date_td, parties_td, subject_td, citations_td)\
         = re.findall("<td[^>]*>(.*?)</td>", mur[2], re.S)
     mur_no = re.search("/disclosure_data/mur/([0-9_A-Z]+)\.pdf", mur_no_td).group(1)
     logger.info("processing mur %s" % mur_no)
     pdf_key = 'legal/murs/%s.pdf' % mur_no
-    if [k for k in bucket.objects.filter(Prefix=pdf_key)]:
-        logger.info('already processed %s' % pdf_key)
-        return
-    text, pdf_size, pdf_pages = process_mur_pdf(mur_no, pdf_key, bucket)
+    text, pdf_size, pdf_pages = process_mur_pdf(mur_no, pdf_key, bucket, worker['session'])
     pdf_url = "https://%s.s3.amazonaws.com/%s" % (bucket_name, pdf_key)
     open_date, close_date = (None, None)
     if open_date_td:
@@ -408,25 +436,85 @@ def process_mur(mur):
         'citations': citations,
         'url': pdf_url
     }
-    es.index(DOCS_INDEX, 'murs', doc, id=doc['doc_id'])
+    return doc
 
-def load_archived_murs():
+class Checkpoint(object):
+    """Numbers of archived MURs already indexed, one per line of the file at
+    `path`. Without a path, nothing is recorded.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def exists(self):
+        return bool(self.path) and os.path.exists(self.path)
+
+    def load(self):
+        if not self.exists():
+            return set()
+        with open(self.path) as fp:
+            return set(line.strip() for line in fp if line.strip())
+
+    def record(self, mur_nos):
+        if not self.path:
+            return
+        with open(self.path, 'a') as fp:
+            fp.writelines('%s\n' % mur_no for mur_no in mur_nos)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+def get_uploaded_murs(bucket):
+    """Get the numbers of archived MURs with a PDF in S3, in a single listing."""
+    return set([re.match("legal/murs/([0-9_A-Z]+).pdf", o.key).group(1)
+                for o in bucket.objects.filter(Prefix="legal/murs")
+                if re.match("legal/murs/([0-9_A-Z]+).pdf", o.key)])
+
+def load_archived_murs(processes=None, checkpoint=None):
     """
     Reads data for archived MURs from http://www.fec.gov/MUR, assembles a JSON
     document corresponding to the MUR and indexes this document in Elasticsearch
     in the index `docs_index` with a doc_type of `murs`. In addition, the MUR
     document is uploaded to an S3 bucket under the _directory_ `legal/murs/`.
+
+    PDFs are downloaded and parsed by `processes` workers, and the documents
+    are indexed in bulk as they're ready. If a `checkpoint` file is given, the
+    numbers of indexed MURs are appended to it and skipped on the next run, so
+    an interrupted run resumes where it left off; a new checkpoint is seeded
+    with the MURs already uploaded to S3. Without a checkpoint, MURs uploaded
+    to S3 are skipped. Defaults are read from `FEC_ARCHIVED_MUR_PROCESSES` and
+    `FEC_ARCHIVED_MUR_CHECKPOINT`.
     """
+    processes = int(processes or os.getenv('FEC_ARCHIVED_MUR_PROCESSES', DEFAULT_PROCESSES))
+    checkpoint = Checkpoint(checkpoint or os.getenv('FEC_ARCHIVED_MUR_CHECKPOINT'))
     table_text = requests.get('http://www.fec.gov/MUR/MURData.do').text
     rows = re.findall("<tr [^>]*>(.*?)</tr>", table_text, re.S)[1:]
-    bucket = get_bucket()
-    murs_completed = set([re.match("legal/murs/([0-9_A-Z]+).pdf", o.key).group(1)
-                        for o in bucket.objects.filter(Prefix="legal/murs")
-                        if re.match("legal/murs/([0-9_A-Z]+).pdf", o.key)])
+    if checkpoint.exists():
+        murs_completed = checkpoint.load()
+    else:
+        murs_completed = get_uploaded_murs(get_bucket())
+        checkpoint.record(sorted(murs_completed))
     rows = [r for r in rows
             if re.search('/disclosure_data/mur/([0-9_A-Z]+)\.pdf', r, re.M).group(1)
             not in murs_completed]
     shuffle(rows)
+    logger.info('Processing %d archived MURs with %d workers', len(rows), processes)
     murs = zip(range(len(rows)), [len(rows)] * len(rows), rows)
-    with Pool(processes=1, maxtasksperchild=1) as pool:
-        pool.map(process_mur, murs, chunksize=1)
+    es = utils.get_elasticsearch_connection()
+    if checkpoint.path:
+        chunk_size = ARCHIVED_MUR_CHUNK_SIZE
+    else:
+        # Without a checkpoint, an uploaded PDF marks a MUR as processed, so
+        # index each MUR as soon as it's ready rather than risk losing a
+        # partial chunk
+        chunk_size = 1
+
+    def on_indexed(doc_ids):
+        checkpoint.record(doc_id.replace('mur_', '', 1) for doc_id in doc_ids)
+
+    with Pool(processes=processes, initializer=init_worker,
+              maxtasksperchild=MAX_TASKS_PER_CHILD) as pool:
+        docs = pool.imap_unordered(process_mur, murs, chunksize=1)
+        bulk.index_documents(
+            es, 'murs', (doc for doc in docs if doc),
+            chunk_size=chunk_size, on_indexed=on_indexed,
+        )
@@ -0,0 +1,58 @@
+"""Helpers for loading the child relations of legal documents in batches.
+
+Loaders read parent rows (AOs or MURs) ordered by id, split them into
+batches, and run one query per child relation for each batch rather than
+one per parent. Small relations are grouped in memory by parent id; large
+relations, such as documents with OCR text and PDF images, are read through
+a server-side cursor ordered by parent id and matched to parents as they
+stream, so only one parent's documents are held in memory at a time.
+"""
+import itertools
+import collections
+
+BATCH_SIZE = 100
+
+
+def get_batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def group_rows(rows, key):
+    """Group `rows` into lists by the value of column `key`, preserving the
+    order of rows within each group.
+    """
+    groups = collections.defaultdict(list)
+    for row in rows:
+        groups[row[key]].append(row)
+    return groups
+
+
+def stream_groups(conn, query, params, key):
+    """Execute `query` with a dict of `params` using a server-side cursor,
+    and yield lists of consecutive rows sharing a value of column `key`. The
+    query must be ordered by `key`.
+    """
+    rows = conn.execution_options(stream_results=True).execute(query, params)
+    for value, group in itertools.groupby(rows, key=lambda row: row[key]):
+        yield value, list(group)
+
+
+def align_groups(ids, groups):
+    """For each of `ids`, yield the rows from `groups`, as returned by
+    `stream_groups`, whose key matches, or an empty list. Both must be in
+    ascending order.
+    """
+    groups = iter(groups)
+    current = next(groups, None)
+    for id in ids:
+        while current is not None and current[0] < id:
+            current = next(groups, None)
+        if current is not None and current[0] == id:
+            yield current[1]
+        else:
+            yield []
@@ -1,4 +1,6 @@
+import time
 import logging
+from concurrent import futures
 
 import sqlalchemy as sa
 
@@ -28,6 +30,13 @@ class TableGroup:
 
     columns = []
 
+    # Number of indexes to build at once on each child table
+    index_workers = 4
+    # Queued records applied per transaction by `refresh_child`
+    batch_size = 50000
+    # Seconds to pause between batches
+    batch_throttle = 0
+
     @classmethod
     def column_factory(cls, parent):
         return []
@@ -47,12 +56,16 @@ class TableGroup:
         ]
 
     @classmethod
-    def run(cls):
+    def run(cls, processes=1):
+        """Build the master and child tables, then swap them in for the
+        existing tables. Child tables are built by up to `processes` workers
+        at once.
+        """
         parent = utils.load_table(cls.parent)
         cls.create_master(parent)
-        cycles = get_cycles()
-        for cycle in cycles:
-            cls.create_child(parent, cycle)
+        jobs = [(cls, cycle) for cycle in get_cycles()]
+        timings = utils.run_jobs(create_child_job, jobs, processes=processes)
+        log_timings('Created', timings)
         cls.rename()
 
     @classmethod
@@ -159,12 +172,23 @@ class TableGroup:
 
     @classmethod
     def create_indexes(cls, child):
-        for index in cls.index_factory(child):
-            try:
-                index.drop(db.engine)
-            except sa.exc.ProgrammingError:
-                pass
-            index.create(db.engine)
+        """Build the indexes on `child`, up to `index_workers` at a time.
+        Each index is built on its own connection. The engine is resolved
+        here, since the worker threads have no application context.
+        """
+        engine = db.engine
+        indexes = cls.index_factory(child)
+        with futures.ThreadPoolExecutor(max_workers=cls.index_workers) as executor:
+            for future in [executor.submit(cls.create_index, index, engine) for index in indexes]:
+                future.result()
+
+    @classmethod
+    def create_index(cls, index, engine):
+        try:
+            index.drop(engine)
+        except sa.exc.ProgrammingError:
+            pass
+        index.create(engine)
 
     @classmethod
     def rename(cls):
@@ -207,88 +231,161 @@ class TableGroup:
             db.engine.execute(cmd)
 
     @classmethod
-    def refresh_children(cls):
-        queue_old = utils.load_table(cls.queue_old)
-        queue_new = utils.load_table(cls.queue_new)
-        cycles = get_cycles()
-
-        for cycle in cycles:
-            cls.refresh_child(cycle, queue_old, queue_new)
+    def refresh_children(cls, processes=1, batch_size=None, throttle=None):
+        """Apply queued changes to each child table, with up to `processes`
+        children refreshed at once. See `refresh_child` for `batch_size` and
+        `throttle`.
+        """
+        jobs = [(cls, cycle, batch_size, throttle) for cycle in get_cycles()]
+        timings = utils.run_jobs(refresh_child_job, jobs, processes=processes)
+        log_timings('Refreshed', timings)
 
     @classmethod
-    def refresh_child(cls, cycle, queue_old, queue_new):
-        start, stop = cycle - 1, cycle
-        name = '{base}_{start}_{stop}'.format(
-            base=cls.base_name, start=start, stop=stop
-        )
+    def refresh_child(cls, cycle, queue_old, queue_new, batch_size=None, throttle=None):
+        """Apply queued changes for `cycle` to its child table in batches of
+        up to `batch_size` records, ordered by primary key. Each batch is
+        committed separately and removes its records from the queues, so a
+        refresh that fails part way resumes where it stopped when run again.
+
+        :param int batch_size: Records per batch; defaults to `batch_size`
+        :param float throttle: Seconds to pause between batches; defaults to
+            `batch_throttle`
+        """
+        batch_size = batch_size or cls.batch_size
+        throttle = cls.batch_throttle if throttle is None else throttle
+        name = cls.get_child_name(cycle)
         child = utils.load_table(name)
         connection = db.engine.connect()
-        transaction = connection.begin()
 
+        lower, batches = None, 0
         try:
-            delete_select = sa.select([queue_old.c.get(cls.primary)]).where(
-                queue_old.c.two_year_transaction_period.in_([start, stop])
-            )
-            delete = sa.delete(child).where(
-                child.c.get(cls.primary).in_(delete_select)
-            )
-            connection.execute(delete)
-
-            # The queue tables already have the two_year_transaction_period
-            # column set in them so that we can insert the records into the
-            # proper child table. Because of this, we need to exclude the
-            # function call in the column factory normally used when
-            # populating the child tables during normal partitioning.
-            # Otherwise, an error is thrown due more values being specified
-            # than there are columns to accept them.
-            columns = [
-                column for column in cls.column_factory(queue_new)
-                if column.name != 'two_year_transaction_period'
-            ]
-
-            insert_select = sa.select(
-                queue_new.columns + columns
-            ).select_from(
-                queue_new.join(
-                    queue_old,
-                    sa.and_(
-                        queue_new.c.get(cls.primary) == queue_old.c.get(cls.primary),
-                        queue_old.c.timestamp > queue_new.c.timestamp,
-                    ),
-                    isouter=True,
+            while True:
+                upper = cls.get_batch_bound(connection, cycle, queue_old, queue_new, lower, batch_size)
+                if upper is None:
+                    break
+                with connection.begin():
+                    cls.refresh_batch(connection, child, cycle, queue_old, queue_new, lower, upper)
+                batches += 1
+                logger.info(
+                    'Refreshed batch {batches} of {name} through {primary} {upper}.'.format(
+                        batches=batches, name=name, primary=cls.primary, upper=upper
+                    )
                 )
-            ).where(
-                queue_new.c.two_year_transaction_period.in_([start, stop])
-            ).where(
-                queue_old.c.get(cls.primary) == None  # noqa
-            ).distinct(
-                queue_new.c.get(cls.primary)
-            )
-            insert = sa.insert(child).from_select(
-                insert_select.columns,
-                insert_select
-            )
-            connection.execute(insert)
-
-            # Clear the processed records out of the queues.
-            cls.clear_queue(queue_old, delete_select, connection)
-            cls.clear_queue(queue_new, insert_select.with_only_columns(
-                [queue_new.c.get(cls.primary)]
-            ), connection)
-
-            transaction.commit()
+                lower = upper
+                if throttle:
+                    time.sleep(throttle)
             logger.info('Successfully refreshed {name}.'.format(name=name))
         except Exception as e:
-            transaction.rollback()
             logger.error(
                 'Refreshing {name} failed: {error}'.format(name=name, error=e)
             )
 
         connection.close()
 
+    @classmethod
+    def queue_filter(cls, queue, cycle, lower, upper=None):
+        """Select queued records for `cycle` with primary keys greater than
+        `lower` and at most `upper`.
+        """
+        key = queue.c.get(cls.primary)
+        conditions = [queue.c.two_year_transaction_period.in_([cycle - 1, cycle])]
+        if lower is not None:
+            conditions.append(key > lower)
+        if upper is not None:
+            conditions.append(key <= upper)
+        return sa.and_(*conditions)
+
+    @classmethod
+    def get_batch_bound(cls, connection, cycle, queue_old, queue_new, lower, batch_size):
+        """Get the largest primary key among the next `batch_size` queued
+        records after `lower`, or `None` if the queues are drained.
+        """
+        keys = sa.union(*[
+            sa.select([queue.c.get(cls.primary).label('key')]).where(
+                cls.queue_filter(queue, cycle, lower)
+            )
+            for queue in (queue_old, queue_new)
+        ]).alias('keys')
+        batch = sa.select([keys.c.key]).order_by(keys.c.key).limit(batch_size).alias('batch')
+        return connection.execute(sa.select([sa.func.max(batch.c.key)])).scalar()
+
+    @classmethod
+    def refresh_batch(cls, connection, child, cycle, queue_old, queue_new, lower, upper):
+        delete_select = sa.select([queue_old.c.get(cls.primary)]).where(
+            cls.queue_filter(queue_old, cycle, lower, upper)
+        )
+        delete = sa.delete(child).where(
+            child.c.get(cls.primary).in_(delete_select)
+        )
+        connection.execute(delete)
+
+        # The queue tables already have the two_year_transaction_period
+        # column set in them so that we can insert the records into the
+        # proper child table. Because of this, we need to exclude the
+        # function call in the column factory normally used when
+        # populating the child tables during normal partitioning.
+        # Otherwise, an error is thrown due more values being specified
+        # than there are columns to accept them.
+        columns = [
+            column for column in cls.column_factory(queue_new)
+            if column.name != 'two_year_transaction_period'
+        ]
+
+        insert_select = sa.select(
+            queue_new.columns + columns
+        ).select_from(
+            queue_new.join(
+                queue_old,
+                sa.and_(
+                    queue_new.c.get(cls.primary) == queue_old.c.get(cls.primary),
+                    queue_old.c.timestamp > queue_new.c.timestamp,
+                ),
+                isouter=True,
+            )
+        ).where(
+            cls.queue_filter(queue_new, cycle, lower, upper)
+        ).where(
+            queue_old.c.get(cls.primary) == None  # noqa
+        ).distinct(
+            queue_new.c.get(cls.primary)
+        )
+        insert = sa.insert(child).from_select(
+            insert_select.columns,
+            insert_select
+        )
+        connection.execute(insert)
+
+        # Clear the processed records out of the queues.
+        cls.clear_queue(queue_old, delete_select, connection)
+        cls.clear_queue(queue_new, insert_select.with_only_columns(
+            [queue_new.c.get(cls.primary)]
+        ), connection)
+
     @classmethod
     def clear_queue(cls, queue, record_ids, connection):
         delete = sa.delete(queue).where(
             queue.c.get(cls.primary).in_(record_ids)
         )
         connection.execute(delete)
+
+
+def create_child_job(job):
+    cls, cycle = job
+    start = time.time()
+    parent = utils.load_table(cls.parent)
+    child = cls.create_child(parent, cycle)
+    return child.name, time.time() - start
+
+
+def refresh_child_job(job):
+    cls, cycle, batch_size, throttle = job
+    start = time.time()
+    queue_old = utils.load_table(cls.queue_old)
+    queue_new = utils.load_table(cls.queue_new)
+    cls.refresh_child(cycle, queue_old, queue_new, batch_size=batch_size, throttle=throttle)
+    return cls.get_child_name(cycle), time.time() - start
+
+
+def log_timings(action, timings):
+    for name, duration in timings:
+        logger.info('{0} {1} in {2:.1f}s'.format(action, name, duration))
@@ -1,3 +1,5 @@
+import multiprocessing
+
 import sqlalchemy as sa
 from sqlalchemy.schema import DDLElement
 from sqlalchemy.ext.compiler import compiles
@@ -36,3 +38,19 @@ def load_table(name):
         return sa.Table(name, db.metadata, autoload_with=db.engine)
     except sa.exc.NoSuchTableError:
         return None
+
+def run_jobs(func, jobs, processes=1):
+    """Call `func` on each of `jobs`, using a pool of `processes` workers if
+    `processes` is greater than one. Pooled connections are discarded before
+    forking so that workers don't share them.
+    """
+    processes = int(processes)
+    if processes <= 1:
+        return [func(job) for job in jobs]
+    db.engine.dispose()
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        return pool.map(func, jobs)
+    finally:
+        pool.close()
+        pool.join()
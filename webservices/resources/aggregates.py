@@ -8,8 +8,8 @@ from webservices import utils
 from webservices import filters
 from webservices import schemas
 from webservices import exceptions
-from webservices.common import counts
 from webservices.common import models
+from webservices.common import streaming
 from webservices.common.views import ApiResource
 
 
@@ -22,6 +22,7 @@ class AggregateResource(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             self.query_args,
             self.sort_args,
         )
@@ -116,10 +117,14 @@ class ScheduleAByEmployerView(AggregateResource):
         ('employer', models.ScheduleAByEmployer.employer),
     ]
 
+    @streaming.streamable
     def get(self, committee_id=None, **kwargs):
         query = self.build_query(committee_id=committee_id, **kwargs)
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
-        return utils.fetch_page(query, kwargs, model=self.model, count=count, index_column=self.index_column)
+        count = self.count(query, kwargs)
+        return utils.fetch_page(
+            query, kwargs, model=self.model, count=count, index_column=self.index_column,
+            window=self.count_strategy.window,
+        )
 
 
 @doc(
@@ -140,10 +145,14 @@ class ScheduleAByOccupationView(AggregateResource):
         ('occupation', models.ScheduleAByOccupation.occupation),
     ]
 
+    @streaming.streamable
     def get(self, committee_id=None, **kwargs):
         query = self.build_query(committee_id=committee_id, **kwargs)
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
-        return utils.fetch_page(query, kwargs, model=self.model, count=count, index_column=self.index_column)
+        count = self.count(query, kwargs)
+        return utils.fetch_page(
+            query, kwargs, model=self.model, count=count, index_column=self.index_column,
+            window=self.count_strategy.window,
+        )
 
 
 @doc(
@@ -129,6 +129,7 @@ class TotalsCandidateView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.candidate_totals,
             args.make_sort_args(),
         )
@@ -43,6 +43,7 @@ class CandidateList(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.candidate_list,
             args.candidate_detail,
             args.make_sort_args(
@@ -116,6 +117,7 @@ class CandidateView(ApiResource):
     model = models.CandidateDetail
     schema = schemas.CandidateDetailSchema
     page_schema = schemas.CandidateDetailPageSchema
+    cache_responses = True
     filter_multi_fields = filter_multi_fields(models.CandidateDetail)
 
     query_options = [
@@ -126,6 +128,7 @@ class CandidateView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.candidate_detail,
             args.make_sort_args(
                 default='name',
@@ -176,6 +179,7 @@ class CandidateHistoryView(ApiResource):
     model = models.CandidateHistory
     schema = schemas.CandidateHistorySchema
     page_schema = schemas.CandidateHistoryPageSchema
+    cache_responses = True
 
     query_options = [
         sa.orm.joinedload(models.CandidateHistory.flags),
@@ -185,6 +189,7 @@ class CandidateHistoryView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.candidate_history,
             args.make_sort_args(
                 default='-two_year_period',
@@ -8,7 +8,7 @@ from webservices import filters
 from webservices import schemas
 from webservices import exceptions
 from webservices.common import models
-from webservices.common.models import db
+from webservices.common import catalog
 from webservices.common.views import ApiResource
 
 
@@ -58,6 +58,7 @@ class CommitteeList(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.committee,
             args.committee_list,
             args.make_sort_args(
@@ -111,6 +112,7 @@ class CommitteeView(ApiResource):
     model = models.CommitteeDetail
     schema = schemas.CommitteeDetailSchema
     page_schema = schemas.CommitteeDetailPageSchema
+    cache_responses = True
 
     filter_multi_fields = [
         ('designation', models.CommitteeDetail.designation),
@@ -122,6 +124,7 @@ class CommitteeView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.committee,
             args.make_sort_args(
                 default='name',
@@ -165,11 +168,13 @@ class CommitteeHistoryView(ApiResource):
     model = models.CommitteeHistory
     schema = schemas.CommitteeHistorySchema
     page_schema = schemas.CommitteeHistoryPageSchema
+    cache_responses = True
 
     @property
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.committee_history,
             args.make_sort_args(
                 default='-cycle',
@@ -245,12 +250,13 @@ class TotalsCommitteeHistoryView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.make_sort_args(),
             args.totals_committee_aggregate,
         )
 
     def build_query(self, cycle, **kwargs):
-        totals = sa.Table('ofec_totals_combined_mv', db.metadata, autoload_with=db.engine)
+        totals = catalog.tables.get('ofec_totals_combined_mv')
         query = models.CommitteeHistory.query.with_entities(
             models.CommitteeHistory.__table__,
             totals,
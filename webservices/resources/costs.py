@@ -23,6 +23,7 @@ class CommunicationCostView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.itemized,
             args.communication_cost,
             args.make_sort_args(
@@ -65,6 +66,7 @@ class ElectioneeringView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.electioneering,
             args.make_seek_args(),
             args.make_sort_args(
@@ -28,6 +28,7 @@ class ReportingDatesView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.reporting_dates,
             args.make_sort_args(
                 default='-due_date',
@@ -59,6 +60,7 @@ class ElectionDatesView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.election_dates,
             args.make_sort_args(
                 default='-election_date',
@@ -98,6 +100,7 @@ class CalendarDatesView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.calendar_dates,
             args.make_sort_args(
                 default='-start_date',
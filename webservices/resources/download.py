@@ -25,7 +25,8 @@ class DownloadView(utils.Resource):
         parts = request.path.split('/')
         parts.remove('download')
         path = '/'.join(parts)
-        cached_file = get_cached_file(path, request.query_string, filename=filename)
+        fingerprint = download.get_fingerprint(path, request.query_string)
+        cached_file = get_cached_file(fingerprint, filename=filename)
         if cached_file:
             return {
                 'status': 'complete',
@@ -37,11 +38,11 @@ class DownloadView(utils.Resource):
                 'Cannot request downloads with more than {} records'.format(MAX_RECORDS),
                 status_code=http.client.FORBIDDEN,
             )
-        download.export_query.delay(path, request.query_string)
+        download.export_query.delay(path, request.query_string, fingerprint)
         return {'status': 'queued'}
 
-def get_cached_file(path, qs, filename=None):
-    key = download.get_s3_name(path, qs)
+def get_cached_file(fingerprint, filename=None):
+    key = download.make_s3_name(fingerprint)
     obj = task_utils.get_object(key)
     try:
         obj.metadata
@@ -7,6 +7,7 @@ from webservices import utils
 from webservices import filters
 from webservices import schemas
 from webservices.utils import use_kwargs
+from webservices.common import catalog
 from webservices.common.models import (
     db, CandidateHistory, CandidateCommitteeLink,
     CommitteeTotalsPresidential, CommitteeTotalsHouseSenate,
@@ -120,8 +121,8 @@ class ElectionList(utils.Resource):
 
     def _filter_zip(self, query, kwargs):
         """Filter query by zip codes."""
-        fips_states = sa.Table('ofec_fips_states', db.metadata, autoload_with=db.engine)
-        zips_districts = sa.Table('ofec_zips_districts', db.metadata, autoload_with=db.engine)
+        fips_states = catalog.tables.get('ofec_fips_states')
+        zips_districts = catalog.tables.get('ofec_zips_districts')
         districts = db.session.query(
             zips_districts,
             fips_states,
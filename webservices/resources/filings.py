@@ -7,6 +7,7 @@ from webservices import schemas
 from webservices.common import views
 from webservices.common import counts
 from webservices.common import models
+from webservices.common import streaming
 
 
 @doc(
@@ -50,6 +51,7 @@ class BaseFilings(views.ApiResource):
         default_sort = ['-receipt_date']
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.filings,
             args.make_multi_sort_args(
                 default=default_sort,
@@ -57,14 +59,22 @@ class BaseFilings(views.ApiResource):
             ),
         )
 
+    @streaming.streamable
     def get(self, **kwargs):
         query = self.build_query(**kwargs)
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
-        return utils.fetch_page(query, kwargs, model=models.Filings, count=count, multi=True)
+        count = self.count(query, kwargs)
+        return utils.fetch_page(
+            query, kwargs, model=models.Filings, count=count, multi=True,
+            window=self.count_strategy.window,
+        )
 
 
 class FilingsView(BaseFilings):
 
+    # Filings for a single committee or candidate are few enough that
+    # counting them in the page query is cheaper than a separate count
+    count_strategy = counts.WindowCount()
+
     def build_query(self, committee_id=None, candidate_id=None, **kwargs):
         query = super().build_query(**kwargs)
         if committee_id:
@@ -108,6 +118,7 @@ class EFilingsView(views.ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.efilings,
             args.make_sort_args(
                 default='-receipt_date',
@@ -115,10 +126,13 @@ class EFilingsView(views.ApiResource):
             ),
         )
 
+    @streaming.streamable
     def get(self, **kwargs):
         query = self.build_query(**kwargs)
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
-        return utils.fetch_page(query, kwargs, model=models.EFilings, count=count)
+        count = self.count(query, kwargs)
+        return utils.fetch_page(
+            query, kwargs, model=models.EFilings, count=count, window=self.count_strategy.window,
+        )
 
     @property
     def index_column(self):
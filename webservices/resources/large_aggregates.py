@@ -26,6 +26,7 @@ class EntityReceiptDisbursementTotalsView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.large_aggregates,
             args.make_sort_args(
                 default='date',
@@ -1,4 +1,5 @@
 import re
+import logging
 
 from elasticsearch_dsl import Search, Q
 from webargs import fields
@@ -7,14 +8,23 @@ from webservices import args
 from webservices import utils
 from webservices.utils import use_kwargs
 from webservices.legal_docs import DOCS_SEARCH
+from webservices.legal_docs import cache
 es = utils.get_elasticsearch_connection()
 
+logger = logging.getLogger(__name__)
+
+ALL_TYPES = ['statutes', 'regulations', 'advisory_opinions', 'murs']
+
+# Per-type time limit for searches sent together with `_msearch`
+SEARCH_TIMEOUT = '10s'
+
 class GetLegalDocument(utils.Resource):
     @property
     def args(self):
         return {"no": fields.Str(required=True, description='Document number to fetch.'),
                 "doc_type": fields.Str(required=True, description='Document type to fetch.')}
 
+    @cache.cached
     def get(self, doc_type, no, **kwargs):
         es_results = Search().using(es) \
             .query('bool', must=[Q('term', no=no), Q('term', _type=doc_type)]) \
@@ -67,9 +77,10 @@ def parse_query_string(query):
 
 class UniversalSearch(utils.Resource):
     @use_kwargs(args.query)
+    @cache.cached
     def get(self, q='', from_hit=0, hits_returned=20, type='all', **kwargs):
         if type == 'all':
-            types = ['statutes', 'regulations', 'advisory_opinions', 'murs']
+            types = ALL_TYPES
         else:
             types = [type]
 
@@ -78,61 +89,98 @@ class UniversalSearch(utils.Resource):
         phrases = parsed_query.get('phrases')
         hits_returned = min([200, hits_returned])
 
+        queries = [
+            (type, build_search_query(type, q, terms, phrases, hits_returned, from_hit, **kwargs))
+            for type in types
+        ]
+        if len(queries) == 1:
+            type, query = queries[0]
+            responses = [es.search(index=DOCS_SEARCH, doc_type=type, body=query.to_dict())]
+        else:
+            responses = execute_multi_search(queries)
+
         results = {}
         total_count = 0
-        for type in types:
-            must_query = [Q('term', _type=type)]
-            text_highlight_query = Q()
-
-            if len(terms):
-                term_query = Q('match', _all=' '.join(terms))
-                must_query.append(term_query)
-                text_highlight_query = text_highlight_query & term_query
-
-            if len(phrases):
-                phrase_queries = [Q('match_phrase', _all=phrase) for phrase in phrases]
-                must_query.extend(phrase_queries)
-                text_highlight_query = text_highlight_query & Q('bool', must=phrase_queries)
-
-            query = Search().using(es) \
-                .query(Q('bool',
-                         must=must_query,
-                         should=[Q('match', no=q), Q('match_phrase', _all={"query": q, "slop": 50})])) \
-                .highlight('text', 'name', 'no', 'summary', 'documents.text', 'documents.description') \
-                .source(exclude=['text', 'documents.text', 'sort1', 'sort2']) \
-                .extra(size=hits_returned, from_=from_hit) \
-                .index(DOCS_SEARCH) \
-                .sort("sort1", "sort2")
-
-            if type == 'advisory_opinions':
-                query = apply_ao_specific_query_params(query, **kwargs)
-
-            if type == 'murs':
-                query = apply_mur_specific_query_params(query, q, **kwargs)
-
-            if text_highlight_query:
-                query = query.highlight_options(highlight_query=text_highlight_query.to_dict())
-
-            es_results = query.execute()
-
-            formatted_hits = []
-            for hit in es_results:
-                formatted_hit = hit.to_dict()
-                formatted_hit['highlights'] = []
-                formatted_hits.append(formatted_hit)
-
-                if 'highlight' in hit.meta:
-                    for key in hit.meta.highlight:
-                        formatted_hit['highlights'].extend(hit.meta.highlight[key])
-
-            count = es_results.hits.total
+        complete = True
+        for (type, _), response in zip(queries, responses):
+            if 'error' in response:
+                # Leave out the failed type rather than failing the search
+                logger.error('Legal search for %s failed: %s', type, response['error'])
+                formatted_hits, count = [], 0
+                complete = False
+            else:
+                formatted_hits = format_hits(response['hits']['hits'])
+                count = response['hits']['total']
+                if response.get('timed_out'):
+                    logger.warning('Legal search for %s timed out', type)
+                    complete = False
             total_count += count
 
             results[type] = formatted_hits
             results['total_%s' % type] = count
 
         results['total_all'] = total_count
-        return results
+        # Return partial results, but don't cache them
+        return results if complete else cache.Uncacheable(results)
+
+def build_search_query(type, q, terms, phrases, hits_returned, from_hit, **kwargs):
+    must_query = [Q('term', _type=type)]
+    text_highlight_query = Q()
+
+    if len(terms):
+        term_query = Q('match', _all=' '.join(terms))
+        must_query.append(term_query)
+        text_highlight_query = text_highlight_query & term_query
+
+    if len(phrases):
+        phrase_queries = [Q('match_phrase', _all=phrase) for phrase in phrases]
+        must_query.extend(phrase_queries)
+        text_highlight_query = text_highlight_query & Q('bool', must=phrase_queries)
+
+    query = Search().using(es) \
+        .query(Q('bool',
+                 must=must_query,
+                 should=[Q('match', no=q), Q('match_phrase', _all={"query": q, "slop": 50})])) \
+        .highlight('text', 'name', 'no', 'summary', 'documents.text', 'documents.description') \
+        .source(exclude=['text', 'documents.text', 'sort1', 'sort2']) \
+        .extra(size=hits_returned, from_=from_hit) \
+        .index(DOCS_SEARCH) \
+        .sort("sort1", "sort2")
+
+    if type == 'advisory_opinions':
+        query = apply_ao_specific_query_params(query, **kwargs)
+
+    if type == 'murs':
+        query = apply_mur_specific_query_params(query, q, **kwargs)
+
+    if text_highlight_query:
+        query = query.highlight_options(highlight_query=text_highlight_query.to_dict())
+
+    return query
+
+def execute_multi_search(queries):
+    """Send the search for each `(type, query)` pair in `queries` in a single
+    `_msearch` request. Each search is bounded by `SEARCH_TIMEOUT`, after
+    which its shards return the hits found so far, so one slow type does not
+    hold up the others. Responses are returned in the order of `queries`;
+    a failed search is returned as a response with an `error` key.
+    """
+    body = []
+    for type, query in queries:
+        body.append({'index': DOCS_SEARCH, 'type': type})
+        body.append(dict(query.to_dict(), timeout=SEARCH_TIMEOUT))
+    return es.msearch(body=body)['responses']
+
+def format_hits(hits):
+    formatted_hits = []
+    for hit in hits:
+        formatted_hit = dict(hit.get('_source', {}))
+        formatted_hit['highlights'] = []
+        formatted_hits.append(formatted_hit)
+
+        for highlights in hit.get('highlight', {}).values():
+            formatted_hit['highlights'].extend(highlights)
+    return formatted_hits
 
 def apply_mur_specific_query_params(query, q='', **kwargs):
     if kwargs.get('mur_no'):
@@ -0,0 +1,24 @@
+from flask import abort
+
+from webservices import utils
+from webservices.common import catalog
+from webservices.common import profiler
+from webservices.legal_docs import cache as legal_cache
+
+
+class InternalMetrics(utils.Resource):
+    """Phase timing histograms and cache statistics of this worker process.
+    Only available if the profiler is enabled; see `webservices.common.profiler`.
+    """
+
+    def get(self, **kwargs):
+        if not profiler.is_enabled():
+            abort(404)
+        return dict(
+            profiler.metrics.summary(),
+            legal_cache=legal_cache.stats.summary(),
+            catalog={
+                'indexes': catalog.indexes.stats(),
+                'tables': catalog.tables.stats(),
+            },
+        )
@@ -35,6 +35,7 @@ class RadAnalystView(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.rad_analyst,
             args.make_sort_args(
                 validator=args.IndexValidator(models.RadAnalyst),
@@ -6,9 +6,9 @@ from webservices import docs
 from webservices import utils
 from webservices import schemas
 from webservices import filters
-from webservices.common import counts
 from webservices.common import models
 from webservices.common import views
+from webservices.common import streaming
 from webservices.utils import use_kwargs
 
 
@@ -101,6 +101,7 @@ class ReportsView(utils.Resource):
 
 
     @use_kwargs(args.paging)
+    @use_kwargs(args.cursor_paging)
     @use_kwargs(args.reports)
     @use_kwargs(args.make_sort_args(default='-coverage_end_date'))
     @marshal_with(schemas.CommitteeReportsPageSchema(), apply=False)
@@ -164,6 +165,7 @@ class CommitteeReportsView(utils.Resource):
 
 
     @use_kwargs(args.paging)
+    @use_kwargs(args.cursor_paging)
     @use_kwargs(args.committee_reports)
     @use_kwargs(args.make_sort_args(default='-coverage_end_date'))
     @marshal_with(schemas.CommitteeReportsPageSchema(), apply=False)
@@ -257,6 +259,7 @@ class EFilingSummaryView(views.ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.efilings,
             args.make_sort_args(
                 default='-receipt_date',
@@ -265,18 +268,26 @@ class EFilingSummaryView(views.ApiResource):
 
         )
 
+    @streaming.streamable
     def get(self, committee_type=None, **kwargs):
+        self.use_committee_type(committee_type)
+        query = self.build_query(**kwargs)
+
+        count = self.count(query, kwargs)
+        return utils.fetch_page(query, kwargs, model=self.model, count=count, window=self.count_strategy.window)
+
+
+    def build_stream_query(self, committee_type=None, **kwargs):
+        self.use_committee_type(committee_type)
+        return super().build_stream_query(**kwargs)
+
+    def use_committee_type(self, committee_type):
         if committee_type:
             self.model, self.schema, self.page_schema = \
                 efile_reports_schema_map.get(form_type_map.get(committee_type))
             #Filters need to be set dynamically at runtime (otherwise sql alchemy couldn't
             #determine proper table repid for the join operation)
             self.filter_multi_fields[0] = ('file_number', self.model.file_number)
-        query = self.build_query(**kwargs)
-
-        count = counts.count_estimate(query, models.db.session, threshold=5000)
-        return utils.fetch_page(query, kwargs, model=self.model, count=count)
-
 
     def build_query(self, **kwargs):
         query = super().build_query(**kwargs)
@@ -113,6 +113,7 @@ class ScheduleAEfileView(views.ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.schedule_a_e_file,
             args.itemized,
             args.make_sort_args(
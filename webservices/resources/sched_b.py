@@ -102,6 +102,7 @@ class ScheduleBEfileView(views.ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.schedule_b_efile,
             args.make_sort_args(
                 default='-disbursement_date',
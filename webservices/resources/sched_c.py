@@ -47,6 +47,7 @@ class ScheduleCView(ApiResource):
             args.itemized,
             args.schedule_c,
             args.paging,
+            args.cursor_paging,
             args.make_sort_args(
                 default='incurred_date',
             ),
@@ -82,4 +83,5 @@ class ScheduleCViewBySubId(ApiResource):
         return utils.extend(
             #needed to attach a page, trivial since length is one, but can't build this view without a pageschema
             args.paging,
+            args.cursor_paging,
         )
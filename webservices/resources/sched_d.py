@@ -49,6 +49,7 @@ class ScheduleDView(ApiResource):
             args.itemized,
             args.schedule_d,
             args.paging,
+            args.cursor_paging,
             args.make_sort_args(
                 default='load_date',
             )
@@ -83,4 +84,5 @@ class ScheduleDViewBySubId(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
         )
\ No newline at end of file
@@ -124,6 +124,7 @@ class ScheduleEEfileView(views.ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
             args.schedule_e_efile,
             args.make_sort_args(
                 default='-expenditure_date',
@@ -44,6 +44,7 @@ class ScheduleFView(ApiResource):
             args.itemized,
             args.schedule_f,
             args.paging,
+            args.cursor_paging,
             args.make_sort_args(
                 default='expenditure_date',
             )
@@ -78,4 +79,5 @@ class ScheduleFViewBySubId(ApiResource):
     def args(self):
         return utils.extend(
             args.paging,
+            args.cursor_paging,
         )
\ No newline at end of file
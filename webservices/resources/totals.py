@@ -36,6 +36,7 @@ default_schemas = (models.CommitteeTotalsPacParty, schemas.CommitteeTotalsPacPar
 class TotalsView(utils.Resource):
 
     @use_kwargs(args.paging)
+    @use_kwargs(args.cursor_paging)
     @use_kwargs(args.totals)
     @use_kwargs(args.make_sort_args(default='-cycle'))
     @marshal_with(schemas.CommitteeTotalsPageSchema(), apply=False)
@@ -99,6 +100,7 @@ class ScheduleAByStateRecipientTotalsView(ApiResource):
         return utils.extend(
             args.schedule_a_by_state_recipient_totals,
             args.paging,
+            args.cursor_paging,
             args.make_sort_args(
                 default='cycle',
                 validator=args.OptionValidator([
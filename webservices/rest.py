@@ -27,6 +27,9 @@ from flask_apispec import FlaskApiSpec
 from webservices import spec
 from webservices import exceptions
 from webservices.common import util
+from webservices.common import cache
+from webservices.common import profiler
+from webservices.common import slow_queries
 from webservices.common.models import db
 from webservices.resources import totals
 from webservices.resources import reports
@@ -50,6 +53,7 @@ from webservices.resources import costs
 from webservices.resources import legal
 from webservices.resources import load
 from webservices.resources import large_aggregates
+from webservices.resources import metrics
 from webservices.env import env
 
 
@@ -81,9 +85,15 @@ app.config['SQLALCHEMY_FOLLOWERS'] = [
 # app.config['SQLALCHEMY_ECHO'] = True
 db.init_app(app)
 cors.CORS(app)
+profiler.init_app(app)
+slow_queries.init_app(app)
 
 class FlaskRestParser(FlaskParser):
 
+    def parse(self, *args, **kwargs):
+        with profiler.phase('parse'):
+            return super().parse(*args, **kwargs)
+
     def handle_error(self, error):
         message = error.messages
         status_code = getattr(error, 'status_code', 422)
@@ -129,12 +139,20 @@ def limit_remote_addr():
                 abort(403)
 
 
+@app.before_request
+def check_not_modified():
+    """Respond with a 304 to conditional requests for unchanged resources;
+    see `webservices.common.cache`.
+    """
+    return cache.check_not_modified()
+
+
 @app.after_request
 def add_caching_headers(response):
     max_age = os.getenv('FEC_CACHE_AGE')
     if max_age is not None:
         response.headers.add('Cache-Control', 'public, max-age={}'.format(max_age))
-    return response
+    return cache.add_validators(response)
 
 
 api.add_resource(candidates.CandidateList, '/candidates/')
@@ -251,6 +269,7 @@ api.add_resource(download.DownloadView, '/download/<path:path>/')
 api.add_resource(legal.UniversalSearch, '/legal/search/')
 api.add_resource(legal.GetLegalDocument, '/legal/docs/<doc_type>/<no>')
 api.add_resource(load.Legal, '/load/legal/')
+api.add_resource(metrics.InternalMetrics, '/_internal/metrics/')
 
 app.config.update({
     'APISPEC_SWAGGER_URL': None,
@@ -11,6 +11,7 @@ from marshmallow_pagination import schemas as paging_schemas
 from webservices import utils, decoders
 from webservices.spec import spec
 from webservices.common import models
+from webservices.common import profiler
 from webservices.common.models import db
 from webservices import __API_VERSION__
 from webservices.calendar import format_start_date, format_end_date
@@ -86,28 +87,59 @@ class BaseEfileSchema(BaseSchema):
             obj.pop('amendment')
 
 
-def extract_columns(obj, column_a, column_b, descriptions):
-    line_list = {}
-    keys = zip(column_a, column_b)
-    keys = list(keys)
+def make_period_string(per_string=None):
+    if per_string[-4:] == '_per':
+        per_string += 'iod'
+    return per_string
+
+
+# Output field names of the column A and column B values of a summary line
+SummaryLineKeys = namedtuple('SummaryLineKeys', 'column_a column_b')
+
+
+def compile_summary_lines(column_a, column_b, descriptions):
+    """Build the output field names for each line of a form's summary page
+    from the columns of its efile guide. The result is indexed by line number
+    minus one.
+    """
     per = re.compile('(.+?(?=per))')
     ytd = re.compile('(.+?(?=ytd))')
+    return tuple(
+        SummaryLineKeys(
+            make_period_string(re.sub(per, description + '_', str(key_a)).replace(' ', '_')),
+            re.sub(ytd, description + '_', str(key_b)).replace(' ', '_'),
+        )
+        for key_a, key_b, description in zip(column_a, column_b, descriptions)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_summary_lines(form):
+    """Get the compiled summary lines of `form`, one of
+    `decoders.EFILE_FORMS`, building them on first use.
+    """
+    guide = decoders.get_efile_guide(form)
+    return compile_summary_lines(guide.col_a, guide.col_b, guide.description)
+
+
+@functools.lru_cache(maxsize=None)
+def get_state_lines():
+    """Get the summary lines of form 3P, keeping the guide's names for state
+    allocation lines.
+    """
+    guide = decoders.get_efile_guide('f3p')
+    return tuple(SummaryLineKeys(key_a, key_b) for key_a, key_b in zip(guide.col_a, guide.col_b))
+
+
+def extract_columns(obj, summary_lines):
     if obj.summary_lines:
+        line_list = {}
         for row in obj.summary_lines:
-            replace_a = re.sub(per, descriptions[int(row.line_number - 1)] + '_',
-                               str(keys[int(row.line_number - 1)][0])).replace(' ', '_')
-            replace_b = re.sub(ytd, descriptions[int(row.line_number - 1)] + '_',
-                               str(keys[int(row.line_number - 1)][1])).replace(' ', '_')
-            replace_a = make_period_string(replace_a)
-            line_list[replace_a] = row.column_a
-            line_list[replace_b] = row.column_b
+            keys = summary_lines[int(row.line_number - 1)]
+            line_list[keys.column_a] = row.column_a
+            line_list[keys.column_b] = row.column_b
         return line_list
 
-def make_period_string(per_string=None):
-    if per_string[-4:] == '_per':
-        per_string += 'iod'
-    return per_string
-
 
 class EFilingF3PSchema(BaseEfileSchema):
     treasurer_name = ma.fields.Str()
@@ -115,26 +147,20 @@ class EFilingF3PSchema(BaseEfileSchema):
     def parse_summary_rows(self, obj):
         line_list = {}
         state_map = {}
+        summary_lines = get_summary_lines('f3p')
+        state_lines = get_state_lines()
 
-        keys = zip(decoders.f3p_col_a, decoders.f3p_col_b)
-        per = re.compile('(.+?(?=per))')
-        ytd = re.compile('(.+?(?=ytd))')
-
-        descriptions = decoders.f3p_description
-        keys = list(keys)
         if obj.summary_lines:
 
             for row in obj.summary_lines:
                 if row.line_number >= 33 and row.line_number < 87:
-                    state_map[keys[int(row.line_number - 1)][0]] = row.column_a
-                    state_map[keys[int(row.line_number - 1)][1]] = row.column_b
+                    keys = state_lines[int(row.line_number - 1)]
+                    state_map[keys.column_a] = row.column_a
+                    state_map[keys.column_b] = row.column_b
                 else:
-                    replace_a = re.sub(per, descriptions[int(row.line_number - 1)] + '_', keys[int(row.line_number - 1)][0]).replace(' ', '_')
-                    replace_b = re.sub(ytd, descriptions[int(row.line_number - 1)] + '_',
-                                       str(keys[int(row.line_number - 1)][1])).replace(' ', '_')
-                    replace_a = make_period_string(replace_a)
-                    line_list[replace_a] = row.column_a
-                    line_list[replace_b] = row.column_b
+                    keys = summary_lines[int(row.line_number - 1)]
+                    line_list[keys.column_a] = row.column_a
+                    line_list[keys.column_b] = row.column_b
             line_list["state_allocations"] = state_map
             if not line_list.get('total_disbursements_per'):
                 line_list['total_disbursements_per'] = float("-inf")
@@ -152,8 +178,7 @@ class EFilingF3Schema(BaseEfileSchema):
     treasurer_name = ma.fields.Str()
 
     def parse_summary_rows(self, obj):
-        descriptions = decoders.f3_description
-        line_list = extract_columns(obj, decoders.f3_col_a, decoders.f3_col_b, descriptions)
+        line_list = extract_columns(obj, get_summary_lines('f3'))
         #final bit of data cleaning before json marshalling
         cash = max(line_list.get('coh_cop_i'), line_list.get('coh_cop_ii'))
         line_list["cash_on_hand_end_period"] = cash
@@ -175,8 +200,7 @@ class EFilingF3Schema(BaseEfileSchema):
 
 class EFilingF3XSchema(BaseEfileSchema):
     def parse_summary_rows(self, obj):
-        descriptions = decoders.f3x_description
-        line_list = extract_columns(obj, decoders.f3x_col_a, decoders.f3x_col_b, descriptions)
+        line_list = extract_columns(obj, get_summary_lines('f3x'))
         line_list['cash_on_hand_beginning_calendar_ytd'] = line_list.pop('coh_begin_calendar_yr')
         line_list['cash_on_hand_beginning_period'] = line_list.pop('coh_bop')
         return line_list
@@ -219,6 +243,16 @@ def make_schema(model, class_name=None, fields=None, options=None):
     )
 
 
+class ProfiledSchema(object):
+    """Record time spent dumping in the `dump` profiler phase. Only applied
+    to page schemas, so that nested results are not counted twice.
+    """
+
+    def dump(self, *args, **kwargs):
+        with profiler.phase('dump'):
+            return super().dump(*args, **kwargs)
+
+
 def make_page_schema(schema, page_type=paging_schemas.OffsetPageSchema, class_name=None,
                      definition_name=None):
     class_name = class_name or '{0}PageSchema'.format(re.sub(r'Schema$', '', schema.__name__))
@@ -228,7 +262,7 @@ def make_page_schema(schema, page_type=paging_schemas.OffsetPageSchema, class_na
 
     return type(
         class_name,
-        (page_type, ApiSchema),
+        (ProfiledSchema, page_type, ApiSchema),
         {'Meta': Meta},
     )
 
@@ -272,6 +306,9 @@ class ApiSchema(ma.Schema):
     def _postprocess(self, data, many, obj):
         ret = {'api_version': __API_VERSION__}
         ret.update(data)
+        # Pages fetched with cursor pagination carry the cursor for the next page
+        if hasattr(obj, 'last_cursor') and isinstance(ret.get('pagination'), dict):
+            ret['pagination']['last_cursor'] = obj.last_cursor
         return ret
 
 class BaseSearchSchema(ma.Schema):
@@ -48,9 +48,11 @@ def parse_option(option, model=None, aliases=None, join_columns=None, query=None
 
 def multi_sort(query, keys, model, aliases=None, join_columns=None, clear=False,
          hide_null=False, index_column=None):
+    columns = []
     for key in keys:
-        query,_ = sort(query, key, model, aliases, join_columns, clear, hide_null, index_column)
-    return query,_
+        query, column = sort(query, key, model, aliases, join_columns, clear, hide_null, index_column)
+        columns.append(column)
+    return query, columns
 
 
 def sort(query, key, model, aliases=None, join_columns=None, clear=False,
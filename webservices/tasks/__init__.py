@@ -36,6 +36,7 @@ app.conf.update(
     CELERY_IMPORTS=(
         'webservices.tasks.refresh',
         'webservices.tasks.download',
+        'webservices.tasks.slow_queries',
     ),
     CELERYBEAT_SCHEDULE=schedule,
 )
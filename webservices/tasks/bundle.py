@@ -0,0 +1,170 @@
+"""Streaming writers for download bundles.
+
+Exports are written as a pipeline of file-like objects: `COPY` output is
+counted by `RowCounter`, compressed into a zip entry by `ZipStream`, and
+uploaded in parts by `MultipartUpload`. Nothing is written to disk, and
+memory use is bounded by the size of an upload part.
+"""
+import io
+import zlib
+import struct
+import datetime
+
+from webservices.tasks import utils as task_utils
+
+
+# S3 requires all parts but the last to be at least 5 MB
+PART_SIZE = 8 * 1024 * 1024
+
+ZIP_VERSION = 20
+ZIP_FLAGS = 0x08  # Sizes and CRC follow the data in a data descriptor
+ZIP_MAX_SIZE = 0xffffffff
+
+
+class RowCounter(object):
+    """Pass CSV data through to `fileobj`, counting rows as they are written.
+    Newlines inside quoted values don't end a row.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.lines = 0
+        self.quoted = False
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        for index, segment in enumerate(data.split(b'"')):
+            if index:
+                self.quoted = not self.quoted
+            if not self.quoted:
+                self.lines += segment.count(b'\n')
+        self.fileobj.write(data)
+
+    def rows(self, header=True):
+        return self.lines - 1 if header and self.lines else self.lines
+
+
+class ZipStream(object):
+    """Write a zip archive to `fileobj` without seeking. Each entry is
+    deflated and followed by a data descriptor, so its size doesn't need to
+    be known in advance. ZIP64 isn't supported, so entries must be smaller
+    than 4 GB.
+    """
+
+    def __init__(self, fileobj, level=zlib.Z_DEFAULT_COMPRESSION):
+        self.fileobj = fileobj
+        self.level = level
+        self.offset = 0
+        self.entries = []
+
+    def open(self, name, timestamp=None):
+        return ZipEntry(self, name, timestamp or datetime.datetime.now())
+
+    def writestr(self, name, data, timestamp=None):
+        with self.open(name, timestamp) as entry:
+            entry.write(data)
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def close(self):
+        start = self.offset
+        for entry in self.entries:
+            self._write(entry.central_header())
+        size = self.offset - start
+        self._write(struct.pack(
+            '<4s4H2LH',
+            b'PK\x05\x06', 0, 0, len(self.entries), len(self.entries), size, start, 0,
+        ))
+
+
+class ZipEntry(object):
+
+    def __init__(self, archive, name, timestamp):
+        self.archive = archive
+        self.name = name.encode('utf-8')
+        self.time, self.date = dos_datetime(timestamp)
+        self.offset = archive.offset
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.compressor = zlib.compressobj(archive.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        archive._write(struct.pack(
+            '<4s5H3L2H',
+            b'PK\x03\x04', ZIP_VERSION, ZIP_FLAGS, zlib.DEFLATED, self.time, self.date,
+            0, 0, 0, len(self.name), 0,
+        ) + self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+        self.size += len(data)
+        self._write_compressed(self.compressor.compress(data))
+
+    def _write_compressed(self, data):
+        if data:
+            self.compressed_size += len(data)
+            self.archive._write(data)
+
+    def close(self):
+        self._write_compressed(self.compressor.flush())
+        if max(self.size, self.compressed_size, self.offset) > ZIP_MAX_SIZE:
+            raise ValueError('Entry {0} is too large for a zip archive'.format(self.name))
+        self.archive._write(struct.pack(
+            '<4s3L', b'PK\x07\x08', self.crc, self.compressed_size, self.size,
+        ))
+        self.archive.entries.append(self)
+
+    def central_header(self):
+        return struct.pack(
+            '<4s6H3L5H2L',
+            b'PK\x01\x02', ZIP_VERSION, ZIP_VERSION, ZIP_FLAGS, zlib.DEFLATED,
+            self.time, self.date, self.crc, self.compressed_size, self.size,
+            len(self.name), 0, 0, 0, 0, 0, self.offset,
+        ) + self.name
+
+
+def dos_datetime(timestamp):
+    time = (timestamp.hour << 11) | (timestamp.minute << 5) | (timestamp.second // 2)
+    date = ((timestamp.year - 1980) << 9) | (timestamp.month << 5) | timestamp.day
+    return time, date
+
+
+class MultipartUpload(object):
+    """Upload data written to this object to S3 at `key`, one part at a time.
+    Call `complete` when finished, or `abort` on failure.
+    """
+
+    def __init__(self, key, part_size=PART_SIZE):
+        self.upload = task_utils.get_object(key).initiate_multipart_upload()
+        self.part_size = part_size
+        self.buffer = io.BytesIO()
+        self.parts = []
+
+    def write(self, data):
+        self.buffer.write(data)
+        if self.buffer.tell() >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        number = len(self.parts) + 1
+        response = self.upload.Part(number).upload(Body=self.buffer.getvalue())
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self.buffer = io.BytesIO()
+
+    def complete(self):
+        if self.buffer.tell() or not self.parts:
+            self._upload_part()
+        self.upload.complete(MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.upload.abort()
@@ -1,13 +1,11 @@
-import os
+import json
 import hashlib
 import logging
-import zipfile
 import datetime
-import tempfile
 
 from webargs import flaskparser
 from flask_apispec.utils import resolve_annotations
-from postgres_copy import query_entities, copy_to
+from postgres_copy import copy_to
 from celery_once import QueueOnce
 
 from webservices import utils
@@ -19,11 +17,12 @@ from webservices.resources import (
 )
 
 from webservices.tasks import app
+from webservices.tasks import bundle
 from webservices.tasks import utils as task_utils
 
 logger = logging.getLogger(__name__)
 
-IGNORE_FIELDS = {'page', 'per_page', 'sort', 'sort_hide_null'}
+IGNORE_FIELDS = {'page', 'per_page', 'sort', 'sort_hide_null', 'seek', 'cursor'}
 RESOURCE_WHITELIST = {
     aggregates.ScheduleABySizeView,
     aggregates.ScheduleAByStateView,
@@ -59,23 +58,34 @@ COUNT_NOTE = (
     'CSV file.'
 )
 
-def call_resource(path, qs):
+def get_resource(path):
     app = task_utils.get_app()
     endpoint, arguments = app.url_map.bind('').match(path)
     resource_type = app.view_functions[endpoint].view_class
     if resource_type not in RESOURCE_WHITELIST:
         raise ValueError('Downloads on resource {} not supported'.format(resource_type.__name__))
-    resource = resource_type()
+    return endpoint, arguments, resource_type()
+
+def parse_query(path, qs):
+    """Parse the resource and arguments requested by `path` and `qs`.
+
+    :returns: Tuple of endpoint, resource, argument fields, and parsed arguments
+    """
+    endpoint, arguments, resource = get_resource(path)
     fields, kwargs = parse_kwargs(resource, qs)
     kwargs = utils.extend(arguments, kwargs)
     for field in IGNORE_FIELDS:
         kwargs.pop(field, None)
+    return endpoint, resource, fields, kwargs
+
+def call_resource(path, qs):
+    endpoint, resource, fields, kwargs = parse_query(path, qs)
     query, model, schema = unpack(resource.build_query(**kwargs), 3)
     count = counts.count_estimate(query, db.session, threshold=5000)
     return {
         'path': path,
         'qs': qs,
-        'name': get_s3_name(path, qs),
+        'name': make_s3_name(make_fingerprint(endpoint, fields, kwargs)),
         'query': query,
         'schema': schema or resource.schema,
         'resource': resource,
@@ -92,79 +102,65 @@ def parse_kwargs(resource, qs):
         kwargs = flaskparser.parser.parse(fields)
     return fields, kwargs
 
-def query_with_labels(query, schema, sort_columns=False):
-    """Create a new query that labels columns according to the SQLAlchemy
-    model.  Properties that are excluded by `schema` will be ignored.
-
-    Furthermore, if a "relationships" attribute is set on the schema (via the
-    Meta options object), those relationships will be followed to include the
-    specified nested fields in the output.  By default, only the fields
-    defined on the model mapped directly to columns in the corresponding table
-    will be included.
-
-    :param query: Original SQLAlchemy query
-    :param schema: Optional schema specifying properties to exclude
-    :param sort_columns: Optional flag to sort the column labels by name
-    :returns: Query with labeled entities
-    """
-    exclude = getattr(schema.Meta, 'exclude', ())
-    relationships = getattr(schema.Meta, 'relationships', [])
-    joins = []
-    entities = [
-        entity for entity in query_entities(query)
-        if entity.key not in exclude
-    ]
-
-    for relationship in relationships:
-        if relationship.position == -1:
-            entities.append(relationship.column.label(relationship.label))
-        else:
-            entities.insert(
-                relationship.position,
-                relationship.column.label(relationship.label)
-            )
-
-        if relationship.field not in joins:
-            joins.append(relationship.field)
-
-    if sort_columns:
-        entities.sort(key=lambda x: x.name)
-
-    if joins:
-        query = query.join(*joins).with_entities(*entities)
-    else:
-        query = query.with_entities(*entities)
-
-    return query
-
 def unpack(values, size):
     values = values if isinstance(values, tuple) else (values, )
     return values + (None, ) * (size - len(values))
 
+def get_fingerprint(path, qs):
+    """Get the canonical fingerprint of the export requested by `path` and
+    `qs`. Requests that differ only in argument order, ignored fields, or
+    explicitly passed defaults share a fingerprint.
+
+    Example .. code-block:: python
+
+        get_fingerprint('/v1/schedules/schedule_a/', b'committee_id=C01&sort=amount')
+    """
+    endpoint, _, fields, kwargs = parse_query(path, qs)
+    return make_fingerprint(endpoint, fields, kwargs)
+
+def make_fingerprint(endpoint, fields, kwargs):
+    canonical = sorted(
+        (key, canonicalize(value))
+        for key, value in kwargs.items()
+        if not is_default(fields.get(key), value)
+    )
+    raw = json.dumps([endpoint, canonical], default=str)
+    return hashlib.sha224(raw.encode('utf-8')).hexdigest()
+
+def canonicalize(value):
+    if isinstance(value, (list, tuple, set)):
+        return sorted(set(str(each) for each in value))
+    return str(value)
+
+def is_default(field, value):
+    if value is None or value == []:
+        return True
+    return field is not None and value == field.missing
+
 def get_s3_name(path, qs):
     """
 
     Example .. code-block:: python
 
-        get_s3_name('schedules/schedule_a', '?office=H&sort=amount')
+        get_s3_name('/v1/schedules/schedule_a/', b'office=H&sort=amount')
     """
-    # TODO: consider including path in name
-    # TODO: consider base64 vs hash
-    raw = '{}{}'.format(path, qs)
-    hashed = hashlib.sha224(raw.encode('utf-8')).hexdigest()
-    return '{}.zip'.format(hashed)
-
-def upload_s3(key, body):
-    task_utils.get_bucket().put_object(Key=key, Body=body)
-
-def make_manifest(resource, row_count, path):
-    with open(os.path.join(path, 'manifest.txt'), 'w') as fp:
-        fp.write('Time: {} (UTC)\n'.format(resource['timestamp']))
-        fp.write('Resource: {}\n'.format(resource['path']))
-        fp.write('*Count: {}\n'.format(row_count))
-        fp.write('Filters:\n\n')
-        fp.write('{}\n\n'.format(COUNT_NOTE))
-        fp.write(make_filters(resource))
+    return make_s3_name(get_fingerprint(path, qs))
+
+def make_s3_name(fingerprint):
+    return '{}.zip'.format(fingerprint)
+
+def make_manifest(resource, row_count):
+    lines = [
+        'Time: {} (UTC)'.format(resource['timestamp']),
+        'Resource: {}'.format(resource['path']),
+        '*Count: {}'.format(row_count),
+        'Filters:',
+        '',
+        COUNT_NOTE,
+        '',
+        make_filters(resource),
+    ]
+    return '\n'.join(lines)
 
 def make_filters(resource):
     lines = []
@@ -182,38 +178,39 @@ def make_filter(key, value, description):
         lines.append(description.strip())
     return '\n'.join(lines)
 
-def wc(path):
-    with open(path) as fp:
-        return sum(1 for _ in fp.readlines())
-
 def make_bundle(resource):
-    with tempfile.TemporaryDirectory(dir=os.getenv('TMPDIR')) as tmpdir:
-        csv_path = os.path.join(tmpdir, 'data.csv')
-        with open(csv_path, 'w') as fp:
-            query = query_with_labels(
+    """Stream the CSV export of `resource` into a zip archive uploaded to S3,
+    counting rows as they are copied; the manifest is appended last.
+    """
+    upload = bundle.MultipartUpload(resource['name'])
+    try:
+        archive = bundle.ZipStream(upload)
+        with archive.open('data.csv', resource['timestamp']) as entry:
+            counter = bundle.RowCounter(entry)
+            query = utils.query_with_labels(
                 resource['query'],
                 resource['schema']
             )
             copy_to(
                 query,
                 db.session.connection().engine,
-                fp,
+                counter,
                 format='csv',
                 header=True
             )
-        row_count = wc(csv_path) - 1
-        make_manifest(resource, row_count, tmpdir)
-        with tempfile.TemporaryFile(mode='w+b', dir=os.getenv('TMPDIR')) as tmpfile:
-            archive = zipfile.ZipFile(tmpfile, 'w')
-            for path in os.listdir(tmpdir):
-                _, arcname = os.path.split(path)
-                archive.write(os.path.join(tmpdir, path), arcname=arcname)
-            archive.close()
-            tmpfile.seek(0)
-            upload_s3(resource['name'], tmpfile)
-
-@app.task(base=QueueOnce, once={'graceful': True})
-def export_query(path, qs):
+        archive.writestr('manifest.txt', make_manifest(resource, counter.rows()), resource['timestamp'])
+        archive.close()
+    except Exception:
+        upload.abort()
+        raise
+    upload.complete()
+
+@app.task(base=QueueOnce, once={'graceful': True, 'keys': ['fingerprint']})
+def export_query(path, qs, fingerprint):
+    """Export the results of `path` and `qs` to S3. Concurrent exports are
+    locked on `fingerprint`, so that equivalent queries are only run once;
+    callers must pass `get_fingerprint(path, qs)`.
+    """
     resource = call_resource(path, qs)
     make_bundle(resource)
 
@@ -0,0 +1,27 @@
+import random
+import logging
+
+import sqlalchemy as sa
+
+from webservices.common import slow_queries
+from webservices.tasks import app
+from webservices.tasks import utils as task_utils
+
+logger = logging.getLogger(__name__)
+
+
+@app.task
+def explain_slow_query(entry_id, sql, duration):
+    """Explain a recorded slow query that took `duration` milliseconds on a
+    follower and store its plan.
+    """
+    followers = task_utils.get_app().config['SQLALCHEMY_FOLLOWERS']
+    if not followers:
+        logger.warning('No followers configured to explain slow query {0}'.format(entry_id))
+        return
+    try:
+        plan = slow_queries.explain_query(random.choice(followers), sql, duration)
+    except sa.exc.OperationalError as error:
+        logger.warning('Could not explain slow query {0}: {1}'.format(entry_id, error))
+        return
+    slow_queries.store_plan(entry_id, plan)
@@ -1,13 +1,18 @@
 import os
 import re
+import json
+import base64
+import binascii
 import functools
 
 import six
+import dateutil.parser
 import sqlalchemy as sa
 
 from collections import defaultdict
 
-from datetime import date
+from datetime import date, datetime
+from decimal import Decimal
 
 
 from sqlalchemy.orm import foreign
@@ -20,6 +25,7 @@ from elasticsearch import Elasticsearch
 
 import flask_restful as restful
 from marshmallow_pagination import paginators
+from postgres_copy import query_entities
 
 from webargs import fields
 from flask_apispec import use_kwargs as use_kwargs_original
@@ -29,6 +35,7 @@ from webservices import docs
 from webservices import sorting
 from webservices import decoders
 from webservices import exceptions
+from webservices.common import profiler
 
 
 use_kwargs = functools.partial(use_kwargs_original, locations=('query', ))
@@ -59,21 +66,162 @@ def check_cap(kwargs, cap):
 
 
 def fetch_page(query, kwargs, model=None, aliases=None, join_columns=None, clear=False,
-               count=None, cap=100, index_column=None, multi=False):
+               count=None, cap=100, index_column=None, multi=False, window=False):
     check_cap(kwargs, cap)
     sort, hide_null, reverse_nulls = kwargs.get('sort'), kwargs.get('sort_hide_null'), kwargs.get('sort_reverse_nulls')
+    sort_columns = []
     if sort and multi:
-        query, _ = sorting.multi_sort(
+        query, sort_columns = sorting.multi_sort(
             query, sort, model=model, aliases=aliases, join_columns=join_columns,
             clear=clear, hide_null=hide_null, index_column=index_column
         )
     elif sort:
-        query, _ = sorting.sort(
+        query, sort_column = sorting.sort(
             query, sort, model=model, aliases=aliases, join_columns=join_columns,
             clear=clear, hide_null=hide_null, index_column=index_column
         )
-    paginator = paginators.OffsetPaginator(query, kwargs['per_page'], count=count)
-    return paginator.get_page(kwargs['page'])
+        sort_columns = [sort_column]
+    if kwargs.get('seek') or kwargs.get('cursor'):
+        with profiler.phase('hydrate', sql='page_query'):
+            return fetch_keyset_page(
+                query, kwargs, sort_columns, model=model, index_column=index_column, count=count,
+            )
+    paginator_class = WindowCountPaginator if window else paginators.OffsetPaginator
+    paginator = paginator_class(query, kwargs['per_page'], count=count)
+    with profiler.phase('hydrate', sql='page_query'):
+        return paginator.get_page(kwargs['page'])
+
+
+def fetch_keyset_page(query, kwargs, sort_columns, model=None, index_column=None, count=None):
+    """Fetch the page of results following `kwargs['cursor']`, or the first
+    page if no cursor is given. Rows are ordered by `sort_columns` and then by
+    `index_column` or the primary key of `model`, and the page is selected by
+    comparing against the last row of the previous page rather than by
+    `OFFSET`, so that deep pages are as fast as the first. The cursor for the
+    next page is set as `last_cursor` on the returned page.
+    """
+    if index_column is not None:
+        tiebreakers = [(index_column, sa.asc)]
+    elif model is not None:
+        tiebreakers = [(getattr(model, column.key), sa.asc) for column in model.__mapper__.primary_key]
+    else:
+        raise exceptions.ApiError('Cursor pagination is not supported on this endpoint', status_code=422)
+    columns = list(sort_columns) + tiebreakers
+    sort = kwargs.get('sort')
+    sort = sort if isinstance(sort, list) else [sort] if sort else []
+    if count is None:
+        count = query.order_by(None).count()
+    if tiebreakers:
+        query = query.order_by(*[order(column) for column, order in tiebreakers])
+    if kwargs.get('cursor'):
+        values = decode_cursor(kwargs['cursor'], sort)
+        if len(values) != len(columns):
+            raise exceptions.ApiError('Invalid cursor', status_code=422)
+        query = query.filter(keyset_filter(columns, values))
+    page = paginators.OffsetPaginator(query, kwargs['per_page'], count=count).get_page(1)
+    results = list(page.results)
+    if results and len(results) == kwargs['per_page']:
+        values = [get_row_value(results[-1], column) for column, _ in columns]
+        page.last_cursor = encode_cursor(values, sort)
+    else:
+        page.last_cursor = None
+    return page
+
+
+def get_row_value(row, column):
+    try:
+        return getattr(row, column.key)
+    except AttributeError:
+        raise exceptions.ApiError('Cannot use cursor pagination with this sort', status_code=422)
+
+
+def keyset_filter(columns, values):
+    """Build a filter selecting rows that sort after `values`. Null values sort
+    last in ascending order and first in descending order, as in Postgres.
+
+    :param columns: List of `(column, order)` tuples
+    :param values: Values of the columns on the last row of the previous page
+    """
+    clauses = []
+    equal = []
+    for (column, order), value in zip(columns, values):
+        if value is None:
+            after = column != None if order == sa.desc else sa.false()  # noqa
+            same = column == None  # noqa
+        elif order == sa.desc:
+            after = column < value
+            same = column == value
+        else:
+            after = sa.or_(column > value, column == None)  # noqa
+            same = column == value
+        clauses.append(sa.and_(*(equal + [after])))
+        equal.append(same)
+    return sa.or_(*clauses)
+
+
+def encode_cursor(values, sort):
+    payload = json.dumps({'values': [encode_cursor_value(value) for value in values], 'sort': sort})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        values = [decode_cursor_value(value) for value in payload['values']]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise exceptions.ApiError('Invalid cursor', status_code=422)
+    if payload.get('sort') != sort:
+        raise exceptions.ApiError('Cursor does not match sort order', status_code=422)
+    return values
+
+
+def encode_cursor_value(value):
+    if isinstance(value, datetime):
+        return {'datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'decimal': str(value)}
+    return value
+
+
+def decode_cursor_value(value):
+    if isinstance(value, dict):
+        if 'datetime' in value:
+            return dateutil.parser.parse(value['datetime'])
+        if 'date' in value:
+            return dateutil.parser.parse(value['date']).date()
+        if 'decimal' in value:
+            return Decimal(value['decimal'])
+        raise ValueError('Unknown cursor value')
+    return value
+
+
+class WindowCountPaginator(paginators.OffsetPaginator):
+    """Offset paginator that reads the total count from a `count(*) over ()`
+    column added to the page query rather than issuing a separate count query.
+    Queries over multiple entities or using `DISTINCT` are counted separately.
+    """
+
+    def __init__(self, cursor, per_page, count=None):
+        # Placeholder count; the real count is set when the page is fetched
+        super(WindowCountPaginator, self).__init__(cursor, per_page, count=count or -1)
+        self.count = count
+
+    def _fetch(self, offset, limit, eager=True):
+        cursor = self.cursor
+        if self.count is not None or not eager or cursor._distinct or len(cursor._entities) != 1:
+            if self.count is None:
+                self.count = cursor.count()
+            return super(WindowCountPaginator, self)._fetch(offset, limit, eager=eager)
+        rows = cursor.add_columns(
+            sa.func.count().over().label('_total_count')
+        ).offset(offset).limit(limit).all()
+        if rows:
+            self.count = rows[0][-1]
+        else:
+            self.count = cursor.count() if offset else 0
+        return [row[0] for row in rows]
 
 class SeekCoalescePaginator(paginators.SeekPaginator):
 
@@ -136,11 +284,17 @@ def fetch_seek_page(query, kwargs, index_column, clear=False, count=None, cap=10
             paginator.cursor = query
     else:
         sort_index = None
-    return paginator.get_page(last_index=kwargs['last_index'], sort_index=sort_index, eager=eager)
+    with profiler.phase('hydrate', sql='page_query'):
+        return paginator.get_page(last_index=kwargs['last_index'], sort_index=sort_index, eager=eager)
 
 
 def fetch_seek_paginator(query, kwargs, index_column, clear=False, count=None, cap=100):
     check_cap(kwargs, cap)
+    if kwargs.get('seek') or kwargs.get('cursor'):
+        raise exceptions.ApiError(
+            'Cursor pagination is not supported on this endpoint; use "last_index"',
+            status_code=422,
+        )
     model = index_column.parent.class_
     sort, hide_null = kwargs.get('sort'), kwargs.get('sort_hide_null')
     if sort:
@@ -159,6 +313,52 @@ def fetch_seek_paginator(query, kwargs, index_column, clear=False, count=None, c
     )
 
 
+def query_with_labels(query, schema, sort_columns=False):
+    """Create a new query that labels columns according to the SQLAlchemy
+    model.  Properties that are excluded by `schema` will be ignored.
+
+    Furthermore, if a "relationships" attribute is set on the schema (via the
+    Meta options object), those relationships will be followed to include the
+    specified nested fields in the output.  By default, only the fields
+    defined on the model mapped directly to columns in the corresponding table
+    will be included.
+
+    :param query: Original SQLAlchemy query
+    :param schema: Optional schema specifying properties to exclude
+    :param sort_columns: Optional flag to sort the column labels by name
+    :returns: Query with labeled entities
+    """
+    exclude = getattr(schema.Meta, 'exclude', ())
+    relationships = getattr(schema.Meta, 'relationships', [])
+    joins = []
+    entities = [
+        entity for entity in query_entities(query)
+        if entity.key not in exclude
+    ]
+
+    for relationship in relationships:
+        if relationship.position == -1:
+            entities.append(relationship.column.label(relationship.label))
+        else:
+            entities.insert(
+                relationship.position,
+                relationship.column.label(relationship.label)
+            )
+
+        if relationship.field not in joins:
+            joins.append(relationship.field)
+
+    if sort_columns:
+        entities.sort(key=lambda x: x.name)
+
+    if joins:
+        query = query.join(*joins).with_entities(*entities)
+    else:
+        query = query.with_entities(*entities)
+
+    return query
+
+
 def extend(*dicts):
     ret = {}
     for each in dicts: